@@ -5,12 +5,20 @@ import sys
 
 sys.path.append('hooks/')
 
-from charmhelpers.core.hookenv import action_fail
+from charmhelpers.core.hookenv import (
+    action_fail,
+    action_set,
+    config,
+)
 from neutron_utils import (
     pause_unit_helper,
     resume_unit_helper,
     register_configs,
 )
+from neutron_tuning import (
+    gateway_sysctls,
+    tuning_inputs,
+)
 
 
 def pause(args):
@@ -26,9 +34,22 @@ def resume(args):
     resume_unit_helper(register_configs())
 
 
+def show_tuning(args):
+    """Show the sysctls set on the unit, and the inputs of the tuning
+    profile they were worked out from."""
+    sysctls = gateway_sysctls()
+    action_set({
+        'profile': config('gateway-tuning-profile') or 'none',
+        'inputs': ' '.join('{}={}'.format(key, value)
+                           for key, value in tuning_inputs().items()),
+        'sysctl': '\n'.join('{}={}'.format(key, value)
+                            for key, value in sorted(sysctls.items())),
+    })
+
+
 # A dictionary of all the defined actions to callables (which take
 # parsed arguments).
-ACTIONS = {"pause": pause, "resume": resume}
+ACTIONS = {"pause": pause, "resume": resume, "show-tuning": show_tuning}
 
 
 def main(args):
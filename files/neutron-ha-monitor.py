@@ -11,21 +11,131 @@ cleaned resources on failed nodes.
 """
 
 import os
-import re
 import sys
 import signal
 import socket
 import subprocess
+import threading
 import time
 
 from oslo.config import cfg
-from neutron.agent.linux import ovs_lib
-from neutron.agent.linux import ip_lib
 from neutron.common import exceptions
 from neutron.openstack.common import log as logging
 
+from neutron_ha_agents import (
+    DHCP_AGENT,
+    L3_AGENT,
+    OVS_AGENT,
+    HostedResourceCache,
+    group_agents,
+)
+from neutron_ha_client import (
+    ClientCache,
+    file_signature,
+    is_unauthorized,
+)
+from neutron_ha_crm import (
+    LeaderLease,
+    list_running_nodes,
+)
+from neutron_ha_failover import move_resources
+from neutron_ha_metrics import (
+    MonitorMetrics,
+    count_api_calls,
+)
+from neutron_ha_netns import (
+    NamespaceCleaner,
+    list_namespaces,
+)
+from neutron_ha_ovsdb import TunnelWatchdog
+from neutron_ha_placement import (
+    PORTS,
+    Placement,
+    Weigher,
+    count_ports,
+)
+from neutron_ha_scheduler import AdaptiveInterval
+from neutron_ha_services import (
+    RestartLimiter,
+    ServiceMonitor,
+)
+
 LOG = logging.getLogger(__name__)
 
+ENVRC = '/etc/legacy_ha_envrc'
+
+OPTS = [
+    cfg.FloatOpt('min_check_interval',
+                 default=2.0,
+                 help='Check Neutron Agents interval right after a '
+                      'failure, an agent flap or a recovery action.'),
+    cfg.FloatOpt('max_check_interval',
+                 default=30.0,
+                 help='Ceiling the check interval backs off to while '
+                      'all agents are healthy.'),
+    cfg.DictOpt('placement_weights',
+                default={'routers': '1.0', 'ports': '0.0',
+                         'ha_routers': '0.0'},
+                help='Weights used to compute agent load when '
+                     'placing routers and networks from failed '
+                     'agents. routers is charged per hosted '
+                     'resource, ports per attached port and '
+                     'ha_routers per HA router.'),
+    cfg.IntOpt('reschedule_workers',
+               default=8,
+               help='Maximum number of routers or networks moved '
+                    'concurrently.'),
+    cfg.IntOpt('reschedule_attempts',
+               default=3,
+               help='Attempts made for each remove or add call when '
+                    'moving a router or network.'),
+    cfg.FloatOpt('reschedule_interval',
+                 default=1.0,
+                 help='Base backoff in seconds between attempts, '
+                      'doubled and jittered on every retry.'),
+    cfg.IntOpt('scan_workers',
+               default=8,
+               help='Maximum number of concurrent calls made to list '
+                    'the routers or networks hosted on agents.'),
+    cfg.FloatOpt('agent_cache_ttl',
+                 default=60.0,
+                 help='Seconds the routers and networks hosted on an '
+                      'agent are cached between checks.'),
+    cfg.IntOpt('cleanup_workers',
+               default=8,
+               help='Maximum number of namespaces torn down '
+                    'concurrently when cleaning up after a failed '
+                    'local agent.'),
+    cfg.StrOpt('ovsdb_socket',
+               default='/var/run/openvswitch/db.sock',
+               help='ovsdb-server socket monitored for ovs tunnel '
+                    'ports.'),
+    cfg.FloatOpt('leader_lease_ttl',
+                 default=60.0,
+                 help='Seconds the node leading cl_monitor is cached '
+                      'before crm is asked again. Agent liveness '
+                      'changes and SIGUSR1 refresh it early.'),
+    cfg.IntOpt('restart_burst',
+               default=3,
+               help='Maximum number of times a local service is '
+                    'restarted within restart_period seconds.'),
+    cfg.FloatOpt('restart_period',
+                 default=300.0,
+                 help='Window in seconds restart_burst applies to.'),
+    cfg.StrOpt('metrics_textfile',
+               default='',
+               help='File the monitor metrics are written to after '
+                    'every check, in the Prometheus text format for '
+                    'the node-exporter textfile collector. Nothing is '
+                    'written when empty or when its directory does '
+                    'not exist.'),
+    cfg.FloatOpt('token_ttl',
+                 default=3000.0,
+                 help='Seconds a keystone token is reused before the '
+                      'client re-authenticates. Keep below the '
+                      'keystone token expiration.'),
+]
+
 
 class Daemon(object):
     """A generic daemon class.
@@ -95,24 +205,42 @@ class MonitorNeutronAgentsDaemon(Daemon):
         LOG.info('Monitor Neutron Agent Loop Init')
         self.hostname = None
         self.env = {}
+        self.env_signature = None
+        self.client_cache = ClientCache(
+            ENVRC, self.build_quantum_client,
+            token_ttl=float(cfg.CONF.token_ttl))
+        self.activity = False
+        self.scheduler = AdaptiveInterval(
+            min_interval=float(cfg.CONF.min_check_interval),
+            max_interval=float(cfg.CONF.max_check_interval))
+        self.hosted_cache = HostedResourceCache(
+            ttl=float(cfg.CONF.agent_cache_ttl))
+        self.service_monitor = ServiceMonitor(
+            limiter=RestartLimiter(
+                burst=int(cfg.CONF.restart_burst),
+                period=float(cfg.CONF.restart_period)),
+            log=LOG.error)
+        self.metrics = MonitorMetrics()
+        self.failover_started = None
+        self.leader_lease = LeaderLease(
+            self.list_monitor_res, ttl=float(cfg.CONF.leader_lease_ttl))
+        self.tunnel_watchdog = TunnelWatchdog(
+            path=cfg.CONF.ovsdb_socket, on_lost=self.tunnels_lost,
+            log=LOG.error)
 
     def get_env(self):
-        envrc_f = '/etc/legacy_ha_envrc'
-        envrc_f_m = False
-        if os.path.isfile(envrc_f):
-            ctime = time.ctime(os.stat(envrc_f).st_ctime)
-            mtime = time.ctime(os.stat(envrc_f).st_mtime)
-            if ctime != mtime:
-                envrc_f_m = True
-
-            if not self.env or envrc_f_m:
-                with open(envrc_f, 'r') as f:
-                    for line in f:
-                        data = line.strip().split('=')
-                        if data and data[0] and data[1]:
-                            self.env[data[0]] = data[1]
-                        else:
-                            raise Exception("OpenStack env data uncomplete.")
+        signature = file_signature(ENVRC)
+        if signature and (not self.env or signature != self.env_signature):
+            env = {}
+            with open(ENVRC, 'r') as f:
+                for line in f:
+                    data = line.strip().split('=')
+                    if data and data[0] and data[1]:
+                        env[data[0]] = data[1]
+                    else:
+                        raise Exception("OpenStack env data uncomplete.")
+            self.env = env
+            self.env_signature = signature
         return self.env
 
     def get_hostname(self):
@@ -125,56 +253,21 @@ class MonitorNeutronAgentsDaemon(Daemon):
 
     def list_monitor_res(self):
         # List crm resource 'cl_monitor' running node
-        nodes = []
-        cmd = ['crm', 'resource', 'show', 'cl_monitor']
-        output = subprocess.check_output(cmd)
-        pattern = re.compile('resource cl_monitor is running on: (.*) ')
-        nodes = pattern.findall(output)
-        return nodes
+        return list_running_nodes()
 
     def get_crm_res_lead_node(self):
-        nodes = self.list_monitor_res()
-        if nodes:
-            return nodes[0].strip()
-        else:
+        node = self.leader_lease.get()
+        if not node:
             LOG.error('Failed to get crm resource.')
-            return None
-
-    def unplug_device(self, device):
-        try:
-            device.link.delete()
-        except RuntimeError:
-            root_helper = self.get_root_helper()
-            # Maybe the device is OVS port, so try to delete
-            bridge_name = ovs_lib.get_bridge_for_iface(root_helper,
-                                                       device.name)
-            if bridge_name:
-                bridge = ovs_lib.OVSBridge(bridge_name, root_helper)
-                bridge.delete_port(device.name)
-            else:
-                LOG.debug('Unable to find bridge for device: %s', device.name)
-
-    def get_pattern(self, key, text):
-        if not key or not text:
-            LOG.debug('Invalid key(%s) or text(%s)' % (key, text))
-            return None
-
-        pattern = re.compile('%s' % key)
-        result = pattern.findall(text)
-        return result
+        return node
 
     def _cleanup(self, key1, key2):
         namespaces = []
         if key1:
-            for k in key1.iterkeys():
+            for k in key1.keys():
                 namespaces.append(key2 + '-' + k)
         else:
-            try:
-                cmd = ['sudo', 'ip', 'netns']
-                ns = subprocess.check_output(cmd)
-                namespaces = self.get_pattern('(%s.*)' % key2, ns)
-            except RuntimeError as e:
-                LOG.error('Failed to list namespace, (%s)' % e)
+            namespaces = list_namespaces(key2)
 
         if namespaces:
             LOG.info('Namespaces: %s is going to be deleted.' % namespaces)
@@ -188,16 +281,14 @@ class MonitorNeutronAgentsDaemon(Daemon):
 
     def destroy_namespaces(self, namespaces):
         try:
-            root_helper = self.get_root_helper()
-            for namespace in namespaces:
-                ip = ip_lib.IPWrapper(root_helper, namespace)
-                if ip.netns.exists(namespace):
-                    for device in ip.get_devices(exclude_loopback=True):
-                        self.unplug_device(device)
-
-            ip.garbage_collect_namespace()
+            cleaner = NamespaceCleaner(
+                concurrency=int(cfg.CONF.cleanup_workers),
+                root_helper=self.get_root_helper(), log=LOG.error)
+            deleted = cleaner.cleanup(namespaces)
+            LOG.info('Namespaces deleted: %s' % deleted)
         except Exception:
-            LOG.exception('Error unable to destroy namespace: %s', namespace)
+            LOG.exception('Error unable to destroy namespaces: %s',
+                          namespaces)
 
     def is_same_host(self, host):
         return str(host).strip() == self.get_hostname()
@@ -214,61 +305,147 @@ class MonitorNeutronAgentsDaemon(Daemon):
             return False
         return True
 
-    def l3_agents_reschedule(self, l3_agents, routers, quantum):
+    def get_weigher(self, quantum, key):
+        weigher = Weigher(cfg.CONF.placement_weights)
+        if weigher.weights[PORTS]:
+            # Only pay for the port listing when ports carry weight.
+            try:
+                ports = quantum.list_ports(fields=[key])['ports']
+                weigher.port_counts = count_ports(ports, key)
+            except exceptions.NeutronException as e:
+                LOG.error('Failed to list ports for placement: %s' % e)
+        return weigher
+
+    def worker_clients(self, quantum):
+        '''
+        Return a callable giving each reschedule worker thread its own
+        client. The http connection of a client is not thread safe so
+        workers get a clone sharing the token of the main client.
+        '''
+        clients = threading.local()
+
+        def _client():
+            if not hasattr(clients, 'quantum'):
+                clients.quantum = self.clone_client(quantum)
+            return clients.quantum
+        return _client
+
+    def clone_client(self, quantum):
+        httpclient = getattr(quantum, 'httpclient', None)
+        token = getattr(httpclient, 'auth_token', None)
+        endpoint_url = getattr(httpclient, 'endpoint_url', None)
+        if not token or not endpoint_url:
+            return quantum
+        return count_api_calls(
+            self.get_client_module().Client(token=token,
+                                            endpoint_url=endpoint_url),
+            self.metrics.api_calls)
+
+    def move_resources(self, moves, remove, add, resource):
+        report = move_resources(moves, remove, add,
+                                concurrency=int(cfg.CONF.reschedule_workers),
+                                attempts=int(cfg.CONF.reschedule_attempts),
+                                interval=float(cfg.CONF.reschedule_interval),
+                                log=LOG.error)
+        self.metrics.moved.inc(len(report.moved), resource=resource)
+        self.metrics.move_failures.inc(len(report.failed),
+                                       resource=resource)
+        return report
+
+    def l3_agents_reschedule(self, l3_agents, routers, quantum,
+                             resources=None):
         if not self.validate_reschedule():
             return
 
-        index = 0
+        placement = Placement(self.get_weigher(quantum, 'device_id'))
+        for agent in l3_agents:
+            placement.add_agent(agent, l3_agents[agent])
+
+        resources = resources or {}
+        targets = placement.place_all(
+            dict((r, resources.get(r, {'id': r})) for r in routers))
+        moves = []
         for router_id in routers:
-            agent = index % len(l3_agents)
             LOG.info('Moving router %s from %s to %s' %
-                     (router_id, routers[router_id], l3_agents[agent]))
-            try:
-                quantum.remove_router_from_l3_agent(l3_agent=routers[router_id],
-                                                    router_id=router_id)
-            except exceptions.NeutronException as e:
-                LOG.error('Remove router raised exception: %s' % e)
-            try:
-                quantum.add_router_to_l3_agent(l3_agent=l3_agents[agent],
-                                               body={'router_id': router_id})
-            except exceptions.NeutronException as e:
-                LOG.error('Add router raised exception: %s' % e)
-            index += 1
-
-    def dhcp_agents_reschedule(self, dhcp_agents, networks, quantum):
+                     (router_id, routers[router_id], targets[router_id]))
+            moves.append((router_id, routers[router_id], targets[router_id]))
+
+        client = self.worker_clients(quantum)
+
+        def _remove(agent, router_id):
+            client().remove_router_from_l3_agent(l3_agent=agent,
+                                                 router_id=router_id)
+
+        def _add(agent, router_id):
+            client().add_router_to_l3_agent(l3_agent=agent,
+                                            body={'router_id': router_id})
+
+        report = self.move_resources(moves, _remove, _add, 'router')
+        LOG.info('Router reschedule: %s' % report)
+        if report.failed:
+            LOG.error('Failed to move routers: %s' % sorted(report.failed))
+        if report.skipped:
+            LOG.warning('Skipped routers: %s' % report.skipped)
+        LOG.info('L3 agent loads after reschedule: %s' % placement.loads)
+        return report
+
+    def dhcp_agents_reschedule(self, dhcp_agents, networks, quantum,
+                               resources=None):
         if not self.validate_reschedule():
             return
 
-        index = 0
+        placement = Placement(self.get_weigher(quantum, 'network_id'))
+        for agent in dhcp_agents:
+            placement.add_agent(agent, dhcp_agents[agent])
+
+        resources = resources or {}
+        targets = placement.place_all(
+            dict((n, resources.get(n, {'id': n})) for n in networks))
+        moves = []
         for network_id in networks:
-            agent = index % len(dhcp_agents)
             LOG.info('Moving network %s from %s to %s' % (network_id,
-                     networks[network_id], dhcp_agents[agent]))
-            try:
-                quantum.remove_network_from_dhcp_agent(
-                    dhcp_agent=networks[network_id], network_id=network_id)
-            except exceptions.NeutronException as e:
-                LOG.error('Remove network raised exception: %s' % e)
-            try:
-                quantum.add_network_to_dhcp_agent(
-                    dhcp_agent=dhcp_agents[agent],
-                    body={'network_id': network_id})
-            except exceptions.NeutronException as e:
-                LOG.error('Add network raised exception: %s' % e)
-            index += 1
+                     networks[network_id], targets[network_id]))
+            moves.append((network_id, networks[network_id],
+                          targets[network_id]))
+
+        client = self.worker_clients(quantum)
+
+        def _remove(agent, network_id):
+            client().remove_network_from_dhcp_agent(dhcp_agent=agent,
+                                                    network_id=network_id)
+
+        def _add(agent, network_id):
+            client().add_network_to_dhcp_agent(
+                dhcp_agent=agent, body={'network_id': network_id})
+
+        report = self.move_resources(moves, _remove, _add, 'network')
+        LOG.info('Network reschedule: %s' % report)
+        if report.failed:
+            LOG.error('Failed to move networks: %s' % sorted(report.failed))
+        if report.skipped:
+            LOG.warning('Skipped networks: %s' % report.skipped)
+        LOG.info('DHCP agent loads after reschedule: %s' % placement.loads)
+        return report
+
+    def get_client_module(self):
+        try:
+            from quantumclient.v2_0 import client
+        except ImportError:
+            # Try to import neutronclient instead for havana+
+            from neutronclient.v2_0 import client
+        return client
 
     def get_quantum_client(self):
+        """Return the client kept across iterations, see ClientCache."""
+        return self.client_cache.get()
+
+    def build_quantum_client(self):
         env = self.get_env()
         if not env:
             LOG.info('Unable to re-assign resources at this time')
             return None
 
-        try:
-            from quantumclient.v2_0 import client
-        except ImportError:
-            # Try to import neutronclient instead for havana+
-            from neutronclient.v2_0 import client
-
+        client = self.get_client_module()
         auth_url = '%(auth_protocol)s://%(keystone_host)s:%(auth_port)s/v2.0' \
                    % env
         quantum = client.Client(username=env['service_username'],
@@ -276,76 +453,147 @@ class MonitorNeutronAgentsDaemon(Daemon):
                                 tenant_name=env['service_tenant'],
                                 auth_url=auth_url,
                                 region_name=env['region'])
-        return quantum
-
-    def reassign_agent_resources(self, quantum=None):
-        """Use agent scheduler API to detect down agents and re-schedule"""
-        if not quantum:
-            LOG.error('Failed to get quantum client.')
-            return
+        return count_api_calls(quantum, self.metrics.api_calls)
 
+    def list_agents(self, quantum):
+        """List all agents with one call, grouped by agent type."""
         try:
-            DHCP_AGENT = "DHCP Agent"
-            L3_AGENT = "L3 Agent"
-            agents = quantum.list_agents(agent_type=DHCP_AGENT)
+            return group_agents(quantum.list_agents())
         except exceptions.NeutronException as e:
             LOG.error('Failed to get quantum agents, %s' % e)
-            return
+            return None
 
-        dhcp_agents = []
-        l3_agents = []
-        networks = {}
-        for agent in agents['agents']:
-            hosted_networks = quantum.list_networks_on_dhcp_agent(
-                agent['id'])['networks']
-            if not agent['alive']:
-                LOG.info('DHCP Agent %s down' % agent['id'])
-                for network in hosted_networks:
-                    networks[network['id']] = agent['id']
-                if self.is_same_host(agent['host']):
-                    self.cleanup_dhcp(networks)
-            else:
-                dhcp_agents.append(agent['id'])
-                LOG.info('Active dhcp agents: %s' % agent['id'])
-                if not hosted_networks and self.is_same_host(agent['host']):
-                    self.cleanup_dhcp(None)
-
-        agents = quantum.list_agents(agent_type=L3_AGENT)
-        routers = {}
-        for agent in agents['agents']:
-            hosted_routers = quantum.list_routers_on_l3_agent(
-                agent['id'])['routers']
+    def scan_agents(self, quantum, agents, list_hosted, cleanup):
+        """Find resources hosted on down agents of one type.
+
+        Hosted resources are fetched for down agents and the local agent
+        only. Live agents are fetched as well, to compute their load for
+        placement, only when a down agent still hosts something.
+
+        :returns: (live, orphans, resources) where live maps live agent ids
+                  to their hosted resources, orphans maps resource ids on
+                  down agents to that agent id and resources maps the same
+                  ids to the resource.
+        """
+        client = self.worker_clients(quantum)
+
+        def _fetch(wanted):
+            return self.hosted_cache.fetch(
+                [a['id'] for a in wanted],
+                lambda agent_id: list_hosted(client(), agent_id),
+                concurrency=int(cfg.CONF.scan_workers), log=LOG.error)
+
+        dead = [a for a in agents if not a['alive']]
+        local = [a for a in agents
+                 if a['alive'] and self.is_same_host(a['host'])]
+        hosted = _fetch(dead + local)
+        if [a for a in dead if hosted.get(a['id'])]:
+            hosted.update(_fetch([a for a in agents
+                                  if a['alive'] and a['id'] not in hosted]))
+
+        live = {}
+        orphans = {}
+        resources = {}
+        for agent in agents:
+            if agent['id'] not in hosted:
+                continue
+            hosted_resources = hosted[agent['id']]
             if not agent['alive']:
-                LOG.info('L3 Agent %s down' % agent['id'])
-                for router in hosted_routers:
-                    routers[router['id']] = agent['id']
+                LOG.info('%s %s down' % (agent['agent_type'], agent['id']))
+                agent_orphans = {}
+                for resource in hosted_resources:
+                    agent_orphans[resource['id']] = agent['id']
+                    resources[resource['id']] = resource
+                orphans.update(agent_orphans)
                 if self.is_same_host(agent['host']):
-                    self.cleanup_router(routers)
+                    cleanup(agent_orphans)
             else:
-                l3_agents.append(agent['id'])
-                LOG.info('Active l3 agents: %s' % agent['id'])
-                if not hosted_routers and self.is_same_host(agent['host']):
-                    self.cleanup_router(None)
+                if not hosted_resources and self.is_same_host(agent['host']):
+                    # Cleaning up deletes every namespace of the node, so
+                    # do not trust a cached hosting which may be stale.
+                    self.hosted_cache.invalidate([agent['id']])
+                    fresh = _fetch([agent])
+                    hosted_resources = fresh.get(agent['id'])
+                    if hosted_resources is None:
+                        LOG.error('Not cleaning up, failed to get the '
+                                  'resources of %s' % agent['id'])
+                        hosted_resources = []
+                    elif not hosted_resources:
+                        cleanup(None)
+                live[agent['id']] = hosted_resources
+                LOG.info('Active %s: %s' % (agent['agent_type'], agent['id']))
+        return live, orphans, resources
+
+    def reassign_agent_resources(self, quantum=None, agents=None):
+        """Use agent scheduler API to detect down agents and re-schedule"""
+        if not quantum:
+            LOG.error('Failed to get quantum client.')
+            return
+
+        if agents is None:
+            agents = self.list_agents(quantum)
+            if agents is None:
+                return
+
+        if self.hosted_cache.observe(agents[DHCP_AGENT] + agents[L3_AGENT]):
+            # A node may have left the cluster, ask crm for the leader.
+            self.leader_lease.invalidate()
+            self.activity = True
+        scan_started = time.time()
+        dhcp_agents, networks, orphan_networks = self.scan_agents(
+            quantum, agents[DHCP_AGENT],
+            lambda client, agent_id: client.list_networks_on_dhcp_agent(
+                agent_id)['networks'],
+            self.cleanup_dhcp)
+        l3_agents, routers, orphan_routers = self.scan_agents(
+            quantum, agents[L3_AGENT],
+            lambda client, agent_id: client.list_routers_on_l3_agent(
+                agent_id)['routers'],
+            self.cleanup_router)
+        self.metrics.scan_duration.observe(time.time() - scan_started)
 
         if not networks and not routers:
             LOG.info('No networks and routers hosted on failed agents.')
+            # Moves which failed earlier have been completed since.
+            self.failover_done()
             return
 
+        self.activity = True
+        if self.failover_started is None:
+            self.failover_started = scan_started
+
         if len(dhcp_agents) == 0 and len(l3_agents) == 0:
             LOG.error('Unable to relocate resources, there are %s dhcp_agents '
                       'and %s l3_agents in this cluster' % (len(dhcp_agents),
                                                             len(l3_agents)))
             return
 
-        if len(l3_agents) > 0:
-            self.l3_agents_reschedule(l3_agents, routers, quantum)
+        reports = []
+        if len(l3_agents) > 0 and routers:
+            reports.append(self.l3_agents_reschedule(
+                l3_agents, routers, quantum, resources=orphan_routers))
             # new l3 node will not create a tunnel if don't restart ovs process
 
-        if len(dhcp_agents) > 0:
-            self.dhcp_agents_reschedule(dhcp_agents, networks, quantum)
+        if len(dhcp_agents) > 0 and networks:
+            reports.append(self.dhcp_agents_reschedule(
+                dhcp_agents, networks, quantum, resources=orphan_networks))
+
+        if reports and all(r is not None and not r.failed for r in reports):
+            self.failover_done()
 
+        # Hosting changed for the down agents and the move targets.
+        self.hosted_cache.invalidate(
+            list(dhcp_agents) + list(l3_agents) +
+            list(set(networks.values())) + list(set(routers.values())))
 
-    def check_ovs_tunnel(self, quantum=None):
+    def failover_done(self):
+        if self.failover_started is not None:
+            duration = time.time() - self.failover_started
+            LOG.info('Failover completed in %.2fs' % duration)
+            self.metrics.failover_duration.observe(duration)
+            self.failover_started = None
+
+    def check_ovs_tunnel(self, quantum=None, agents=None):
         '''
         Work around for Bug #1411163
         No fdb entries added when failover dhcp and l3 agent together.
@@ -354,82 +602,98 @@ class MonitorNeutronAgentsDaemon(Daemon):
             LOG.error('Failed to get quantum client.')
             return
 
-        try:
-            OVS_AGENT = 'Open vSwitch agent'
-            agents = quantum.list_agents(agent_type=OVS_AGENT)
-        except exceptions.NeutronException as e:
-            LOG.error('No ovs agent found on localhost, error:%s.' % e)
-            return
+        if agents is None:
+            try:
+                agents = group_agents(
+                    quantum.list_agents(agent_type=OVS_AGENT))
+            except exceptions.NeutronException as e:
+                LOG.error('No ovs agent found on localhost, error:%s.' % e)
+                return
 
-        for agent in agents['agents']:
+        for agent in agents[OVS_AGENT]:
             if self.is_same_host(agent['host']) and agent['alive']:
                 conf = agent['configurations']
-                if 'gre' in conf['tunnel_types'] and conf['l2_population'] \
+                tunnel_types = set(conf.get('tunnel_types') or [])
+                if tunnel_types and conf['l2_population'] \
                         and conf['devices']:
                     LOG.debug('local ovs agent:%s' % agent)
-                    ovs_output = subprocess.check_output(['ovs-vsctl',
-                                                          'list-ports', 'br-tun'])
-                    ports = ovs_output.strip().split('\n')
-                    look_up_gre_port = False
-                    for port in ports:
-                        if port.startswith('gre-'):
-                            look_up_gre_port = True
-                            break
-                    if not look_up_gre_port:
-                        try:
-                            LOG.error('Local agent has devices, but no ovs tunnel is created,'
-                                      'restart ovs agent.')
-                            cmd = ['sudo', 'service', 'neutron-plugin-openvswitch-agent',
-                                   'restart']
-                            subprocess.call(cmd)
-                        except subprocess.CalledProcessError:
-                            LOG.error('Failed to restart neutron-plugin-openvswitch-agent.')
+                    if not self.tunnel_watchdog.synced.is_set():
+                        LOG.debug('OVSDB monitor not synced yet, skip ovs '
+                                  'tunnel check.')
+                        continue
+                    if not self.tunnel_watchdog.index.ports(tunnel_types):
+                        LOG.error('Local agent has devices, but no ovs '
+                                  'tunnel is created, restart ovs agent.')
+                        if self.service_monitor.restart(
+                                'neutron-plugin-openvswitch-agent'):
+                            self.metrics.restarts.inc(
+                                service='neutron-plugin-openvswitch-agent')
+                            self.activity = True
+
+    def tunnels_lost(self, types):
+        LOG.error('Last ovs tunnel of type %s removed.' %
+                  ', '.join(sorted(types)))
+        self.scheduler.wake()
 
     def check_local_agents(self):
-        services = ['openvswitch-switch', 'neutron-dhcp-agent',
-                    'neutron-metadata-agent', 'neutron-vpn-agent']
-        for s in services:
-            status = ['sudo', 'service', s, 'status']
-            restart = ['sudo', 'service', s, 'restart']
-            start = ['sudo', 'service', s, 'start']
-            stop = '%s stop/waiting' % s
-            try:
-                output = subprocess.check_output(status)
-                if output.strip() == stop:
-                    subprocess.check_output(start)
-                    LOG.error('Restart service: %s' % s)
-                    if s == 'neutron-metadata-agent':
-                        subprocess.check_output(['sudo', 'service',
-                                                 'neutron-vpn-agent',
-                                                 'restart'])
-                        LOG.error('Restart neutron-vpn-agent')
-            except subprocess.CalledProcessError:
-                LOG.error('Restart service: %s' % s)
-                subprocess.check_output(restart)
-                if s == 'neutron-metadata-agent':
-                    subprocess.check_output(['sudo', 'service',
-                                             'neutron-vpn-agent',
-                                             'restart'])
+        try:
+            restarted = self.service_monitor.check()
+            for service in restarted:
+                self.metrics.restarts.inc(service=service)
+            if restarted:
+                self.activity = True
+        except (OSError, subprocess.CalledProcessError) as e:
+            LOG.error('Failed to get local service states: %s' % e)
+
+    def write_metrics(self):
+        self.metrics.checks.inc()
+        self.metrics.last_check.set(time.time())
+        if not cfg.CONF.metrics_textfile:
+            return
+        try:
+            self.metrics.write(cfg.CONF.metrics_textfile)
+        except (IOError, OSError) as e:
+            LOG.error('Failed to write metrics to %s: %s' %
+                      (cfg.CONF.metrics_textfile, e))
+
+    def wake(self, *args):
+        self.leader_lease.invalidate()
+        self.scheduler.wake()
 
     def run(self):
+        # SIGUSR1 from NeutronAgentMon reload or the charm hooks triggers
+        # an immediate check with a fresh crm leader.
+        signal.signal(signal.SIGUSR1, self.wake)
+        self.tunnel_watchdog.start()
         while True:
             LOG.info('Monitor Neutron HA Agent Loop Start')
+            self.activity = False
             quantum = self.get_quantum_client()
-            self.reassign_agent_resources(quantum=quantum)
-            self.check_ovs_tunnel(quantum=quantum)
+            try:
+                agents = self.list_agents(quantum) if quantum else None
+                if agents is not None:
+                    self.reassign_agent_resources(quantum=quantum,
+                                                  agents=agents)
+                    self.check_ovs_tunnel(quantum=quantum, agents=agents)
+            except Exception as e:
+                if not is_unauthorized(e):
+                    raise
+                LOG.error('Token rejected, rebuilding client: %s' % e)
+                self.client_cache.invalidate()
             self.check_local_agents()
-            LOG.info('sleep %s' % cfg.CONF.check_interval)
-            time.sleep(float(cfg.CONF.check_interval))
+            self.write_metrics()
+            interval = self.scheduler.next(self.activity)
+            LOG.info('sleep %s' % interval)
+            if self.scheduler.wait(interval):
+                LOG.info('Woken up by signal')
 
 
 if __name__ == '__main__':
-    opts = [
-        cfg.StrOpt('check_interval',
-                   default=8,
-                   help='Check Neutron Agents interval.'),
-    ]
-
-    cfg.CONF.register_cli_opts(opts)
+    # SIGUSR1 would kill the daemon until run() handles it, ignore it in
+    # the meantime as the first check is done straight away anyway.  The
+    # charm only signals daemons which catch or ignore it.
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    cfg.CONF.register_cli_opts(OPTS)
     cfg.CONF(project='monitor_neutron_agents', default_config_files=[])
     logging.setup('Neuron-HA-Monitor')
     monitor_daemon = MonitorNeutronAgentsDaemon()
@@ -0,0 +1,115 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Agent liveness scan and hosted resource cache for neutron-ha-monitor.py.
+
+The monitor lists every agent with a single list_agents call and only asks
+which routers or networks an agent hosts when that answer is needed.
+Answers are cached per agent for a TTL and dropped as soon as the agent
+changes liveness or resources are moved on or off it.
+"""
+
+import threading
+import time
+
+from neutron_ha_failover import run_bounded
+
+DHCP_AGENT = 'DHCP Agent'
+L3_AGENT = 'L3 Agent'
+OVS_AGENT = 'Open vSwitch agent'
+
+
+def group_agents(agents):
+    """Group a list_agents response by agent type.
+
+    :param agents: list_agents response or its list of agents.
+    :returns: dict of agent_type to list of agents.
+    """
+    if isinstance(agents, dict):
+        agents = agents['agents']
+    grouped = {DHCP_AGENT: [], L3_AGENT: [], OVS_AGENT: []}
+    for agent in agents:
+        grouped.setdefault(agent['agent_type'], []).append(agent)
+    return grouped
+
+
+class HostedResourceCache(object):
+    """Cache of agent id to the resources hosted on that agent."""
+
+    def __init__(self, ttl=60.0, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._alive = {}
+        self._lock = threading.Lock()
+
+    def get(self, agent_id):
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is None:
+                return None
+            stamp, resources = entry
+            if self.clock() - stamp > self.ttl:
+                del self._entries[agent_id]
+                return None
+            return resources
+
+    def set(self, agent_id, resources):
+        with self._lock:
+            self._entries[agent_id] = (self.clock(), resources)
+
+    def invalidate(self, agent_ids=None):
+        """Drop cached entries for agent_ids, or every entry if None."""
+        with self._lock:
+            if agent_ids is None:
+                self._entries.clear()
+                return
+            for agent_id in agent_ids:
+                self._entries.pop(agent_id, None)
+
+    def observe(self, agents):
+        """Invalidate agents whose liveness changed since the last scan."""
+        changed = []
+        for agent in agents:
+            previous = self._alive.get(agent['id'])
+            if previous is not None and previous != agent['alive']:
+                changed.append(agent['id'])
+            self._alive[agent['id']] = agent['alive']
+        if changed:
+            self.invalidate(changed)
+        return changed
+
+    def fetch(self, agent_ids, fetch, concurrency=8, log=None):
+        """Return hosted resources for agent_ids.
+
+        Cached entries are used as is, misses are fetched in parallel with
+        at most concurrency calls in flight.  Agents whose fetch fails are
+        left out of the result.
+
+        :param fetch: callable(agent_id) returning a list of resources.
+        :param log: optional callable(msg) used to report failures.
+        :returns: dict of agent id to list of resources.
+        """
+        hosted = {}
+        misses = []
+        for agent_id in agent_ids:
+            resources = self.get(agent_id)
+            if resources is None:
+                misses.append(agent_id)
+            else:
+                hosted[agent_id] = resources
+
+        def _fetch(agent_id):
+            try:
+                resources = fetch(agent_id)
+            except Exception as e:
+                if log:
+                    log('Failed to list resources on agent %s: %s' %
+                        (agent_id, e))
+                return
+            self.set(agent_id, resources)
+            hosted[agent_id] = resources
+
+        run_bounded(_fetch, misses, concurrency)
+        return hosted
@@ -0,0 +1,68 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Long lived neutron client for neutron-ha-monitor.py.
+
+The client, and the keystone token it holds, is reused across monitor
+iterations.  It is rebuilt only when the credentials file changes or the
+server rejects the token, and the token is dropped once it reaches
+token_ttl so the client re-authenticates before keystone expires it.
+"""
+
+import os
+import time
+
+
+def file_signature(path):
+    """Return a value which changes whenever path is rewritten."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+
+def is_unauthorized(error):
+    """Whether error is the server rejecting the client token."""
+    return (getattr(error, 'status_code', None) == 401 or
+            error.__class__.__name__ == 'Unauthorized')
+
+
+class ClientCache(object):
+    """Keep one authenticated client across monitor iterations."""
+
+    def __init__(self, env_path, build, token_ttl=3000.0, clock=time.time):
+        """
+        :param env_path: credentials file the client is built from.
+        :param build: callable returning a new client or None.
+        :param token_ttl: seconds after which the token is dropped.
+        """
+        self.env_path = env_path
+        self.build = build
+        self.token_ttl = token_ttl
+        self.clock = clock
+        self.client = None
+        self.signature = None
+        self.token_time = None
+
+    def get(self):
+        signature = file_signature(self.env_path)
+        if self.client is None or signature != self.signature:
+            self.client = self.build()
+            self.signature = signature
+            self.token_time = self.clock()
+        elif self.clock() - self.token_time >= self.token_ttl:
+            self.reset_token()
+        return self.client
+
+    def reset_token(self):
+        """Drop the token so the next request re-authenticates."""
+        httpclient = getattr(self.client, 'httpclient', None)
+        if httpclient is not None:
+            httpclient.auth_token = None
+        self.token_time = self.clock()
+
+    def invalidate(self):
+        """Drop the client, the next get() builds a new one."""
+        self.client = None
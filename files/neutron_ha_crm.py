@@ -0,0 +1,69 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Pacemaker leader lookups for neutron-ha-monitor.py.
+
+Only the node running the first cl_monitor clone instance reschedules
+resources.  Which node that is rarely changes, so the answer is held as a
+lease for lease_ttl seconds instead of running crm, which takes hundreds
+of milliseconds, on every check.  The lease is dropped early whenever the
+monitor sees the cluster change.
+"""
+
+import re
+import subprocess
+import threading
+import time
+
+MONITOR_RESOURCE = 'cl_monitor'
+
+
+def parse_running_nodes(output, resource=MONITOR_RESOURCE):
+    """Return the nodes 'crm resource show' reports resource running on."""
+    if isinstance(output, bytes):
+        output = output.decode('UTF-8')
+    pattern = re.compile('resource %s is running on: (.*) ' %
+                         re.escape(resource))
+    return [node.strip() for node in pattern.findall(output)]
+
+
+def list_running_nodes(resource=MONITOR_RESOURCE,
+                       execute=subprocess.check_output):
+    return parse_running_nodes(
+        execute(['crm', 'resource', 'show', resource]), resource)
+
+
+class LeaderLease(object):
+
+    def __init__(self, fetch=list_running_nodes, ttl=60.0, clock=time.time):
+        """
+        :param fetch: callable returning the nodes running the monitor
+                      resource, the first one leads.
+        :param ttl: seconds a leader is trusted before asking crm again.
+        """
+        self.fetch = fetch
+        self.ttl = ttl
+        self.clock = clock
+        self.leader = None
+        self.expires = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the leading node or None if crm reports none.
+
+        A missing leader is not cached so that the next call asks again.
+        """
+        with self._lock:
+            if self.leader is None or self.clock() >= self.expires:
+                nodes = self.fetch()
+                self.leader = nodes[0] if nodes else None
+                self.expires = self.clock() + self.ttl
+            return self.leader
+
+    def invalidate(self):
+        """Drop the lease.
+
+        Takes no lock so that it is safe to call from a signal handler.
+        """
+        self.leader = None
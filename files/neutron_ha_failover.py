@@ -0,0 +1,196 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Concurrent execution of router and network moves for neutron-ha-monitor.py.
+
+Each move is a remove from the failed agent followed by an add to the
+target agent.  Moves run on a bounded pool of worker threads, every API call
+is retried with jittered exponential backoff and the outcome of the whole
+batch is returned as a FailoverReport.
+"""
+
+import random
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+# Errors of neutronclient and requests which a retry may get past.
+TRANSIENT_ERRORS = ('ConnectionFailed', 'ConnectionError', 'Timeout',
+                    'ServiceUnavailable', 'InternalServerError')
+
+
+def _status_code(error):
+    return getattr(error, 'status_code', None) or None
+
+
+def is_transient(error):
+    """Whether error may go away on retry: a failure to reach the server or
+    a server side (5xx) error."""
+    status = _status_code(error)
+    if status is not None:
+        return status >= 500
+    if isinstance(error, EnvironmentError):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS
+               for cls in type(error).__mro__)
+
+
+def is_not_found(error):
+    """Whether error is the server not knowing the resource or agent."""
+    return (_status_code(error) == 404 or
+            error.__class__.__name__.endswith('NotFound'))
+
+
+def retry_call(func, attempts=3, interval=1.0, max_interval=10.0,
+               retry_on=is_transient, sleep=time.sleep):
+    """Call func, retrying with full jitter exponential backoff.
+
+    :param func: callable taking no arguments.
+    :param attempts: total number of calls to make before giving up.
+    :param interval: base backoff in seconds, doubled on every retry.
+    :param max_interval: cap on the backoff in seconds.
+    :param retry_on: exception types, or callable(error) returning whether
+                     error triggers a retry.
+    :returns: the result of func.
+    :raises: the last exception once attempts are exhausted or on an error
+             not retried.
+    """
+    if isinstance(retry_on, tuple):
+        types = retry_on
+
+        def retry_on(error):
+            return isinstance(error, types)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= attempts or not retry_on(e):
+                raise
+            backoff = min(max_interval, interval * (2 ** (attempt - 1)))
+            sleep(random.uniform(0, backoff))
+
+
+class FailoverReport(object):
+    """Outcome of a batch of moves.
+
+    moved and skipped are lists of resource ids, failed is a dict of
+    resource id to the error which caused the move to fail.
+    """
+
+    def __init__(self):
+        self.moved = []
+        self.failed = {}
+        self.skipped = []
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add_moved(self, resource_id):
+        with self._lock:
+            self.moved.append(resource_id)
+
+    def add_failed(self, resource_id, error):
+        with self._lock:
+            self.failed[resource_id] = error
+
+    def add_skipped(self, resource_id):
+        with self._lock:
+            self.skipped.append(resource_id)
+
+    def __str__(self):
+        return ('moved=%d failed=%d skipped=%d in %.2fs' %
+                (len(self.moved), len(self.failed), len(self.skipped),
+                 self.duration))
+
+
+def run_bounded(func, items, concurrency):
+    """Call func on every item using at most concurrency threads.
+
+    func must handle its own errors, anything it raises is swallowed so a
+    single bad item cannot stop a worker.
+    """
+    work = queue.Queue()
+    for item in items:
+        work.put(item)
+
+    def _worker():
+        while True:
+            try:
+                item = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(item)
+            except Exception:
+                pass
+
+    workers = [threading.Thread(target=_worker)
+               for _ in range(max(1, min(concurrency, work.qsize())))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def move_resources(moves, remove, add, concurrency=8, attempts=3,
+                   interval=1.0, max_interval=10.0, retry_on=is_transient,
+                   log=None, sleep=time.sleep, clock=time.time):
+    """Move resources between agents concurrently.
+
+    Only transient errors are retried by default, so a conflicting add, or
+    one of a resource deleted since the scan, fails at once.  A remove
+    failing as the source agent no longer hosts the resource is expected.
+
+    :param moves: list of (resource_id, source_agent, target_agent) tuples,
+                  moves with no target or target == source are skipped.
+    :param remove: callable(source_agent, resource_id).
+    :param add: callable(target_agent, resource_id).
+    :param concurrency: maximum number of moves in flight.
+    :param retry_on: as for retry_call().
+    :param log: optional callable(msg) used to report failures.
+    :param sleep: callable(seconds) waiting out the backoff between retries.
+    :param clock: callable returning the time in seconds, for the duration.
+    :returns: FailoverReport
+    """
+    report = FailoverReport()
+    start = clock()
+
+    def _move(move):
+        resource_id, source, target = move
+        if not target or target == source:
+            report.add_skipped(resource_id)
+            return
+        try:
+            retry_call(lambda: remove(source, resource_id),
+                       attempts=attempts, interval=interval,
+                       max_interval=max_interval, retry_on=retry_on,
+                       sleep=sleep)
+        except Exception as e:
+            # The add is still attempted, the failed agent may already have
+            # dropped the resource.
+            if log and not is_not_found(e):
+                log('Remove %s from %s failed: %s' % (resource_id, source, e))
+        try:
+            retry_call(lambda: add(target, resource_id),
+                       attempts=attempts, interval=interval,
+                       max_interval=max_interval, retry_on=retry_on,
+                       sleep=sleep)
+        except Exception as e:
+            if log:
+                log('Add %s to %s failed: %s' % (resource_id, target, e))
+            report.add_failed(resource_id, e)
+            return
+        report.add_moved(resource_id)
+
+    run_bounded(_move, moves, concurrency)
+    report.duration = clock() - start
+    return report
@@ -0,0 +1,211 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Metrics for neutron-ha-monitor.py in the Prometheus text format.
+
+The monitor updates counters, gauges and histograms as it works and writes
+them all to a file after every check, for the node-exporter textfile
+collector to pick up.  The file is replaced atomically so the collector
+never reads a partial write.
+"""
+
+import os
+import tempfile
+import threading
+
+PREFIX = 'neutron_ha_monitor_'
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                   120.0, 300.0)
+HTTP_VERBS = ('get', 'post', 'put', 'delete')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric(object):
+
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def samples(self):
+        """Yield (name, labels, value) tuples."""
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield self.name, key, value
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        for name, labels, value in self.samples():
+            lines.append('%s%s %s' % (name, _format_labels(labels),
+                                      _format_value(value)))
+        return lines
+
+
+class Counter(_Metric):
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+
+class Histogram(_Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self._lock:
+            for bound, count in zip(self.buckets, self.counts):
+                yield (self.name + '_bucket',
+                       (('le', _format_value(bound)),), count)
+            yield self.name + '_sum', (), self.sum
+            yield self.name + '_count', (), self.count
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        return self._add(Counter(name, documentation))
+
+    def gauge(self, name, documentation):
+        return self._add(Gauge(name, documentation))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically replace path with the current metrics.
+
+        :returns: False if the directory of path does not exist, e.g.
+                  no node-exporter is installed.
+        """
+        directory = os.path.dirname(path) or '.'
+        if not os.path.isdir(directory):
+            return False
+        fd, tmp = tempfile.mkstemp(dir=directory,
+                                   prefix='.%s.' % os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o644)
+            os.rename(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        return True
+
+
+def count_api_calls(client, counter):
+    """Count the requests client makes by HTTP verb.
+
+    neutronclient funnels every API method through get/post/put/delete,
+    which are wrapped on the instance.
+    """
+    def _wrap(verb, func):
+        def _call(*args, **kwargs):
+            counter.inc(verb=verb.upper())
+            return func(*args, **kwargs)
+        return _call
+
+    for verb in HTTP_VERBS:
+        func = getattr(client, verb, None)
+        if func is not None:
+            setattr(client, verb, _wrap(verb, func))
+    return client
+
+
+class MonitorMetrics(Registry):
+    """The metrics exported by neutron-ha-monitor.py."""
+
+    def __init__(self):
+        super(MonitorMetrics, self).__init__()
+        self.checks = self.counter(
+            'checks_total', 'Monitor checks run.')
+        self.last_check = self.gauge(
+            'last_check_timestamp_seconds',
+            'Unix time the last check finished.')
+        self.scan_duration = self.histogram(
+            'scan_duration_seconds',
+            'Time to scan agents for resources hosted on failed agents.')
+        self.api_calls = self.counter(
+            'api_calls_total', 'Neutron API requests by HTTP verb.')
+        self.moved = self.counter(
+            'resources_moved_total',
+            'Routers and networks moved off failed agents.')
+        self.move_failures = self.counter(
+            'resource_move_failures_total',
+            'Routers and networks which could not be moved.')
+        self.failover_duration = self.histogram(
+            'failover_duration_seconds',
+            'Time from detecting resources on failed agents to the last '
+            'of them moved.')
+        self.restarts = self.counter(
+            'service_restarts_total', 'Local service restarts by service.')
@@ -0,0 +1,166 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+OVS tunnel port watchdog for neutron-ha-monitor.py.
+
+A background thread keeps one JSON-RPC session (RFC 7047) open on the
+local ovsdb-server socket and monitors the name and type of every
+Interface.  Tunnel interfaces of all types are kept in an in-memory index
+which is updated as ovsdb-server pushes changes, so checking for tunnels
+needs no command at all and losing the last tunnel of a type is noticed
+straight away.
+"""
+
+import codecs
+import json
+import socket
+import threading
+
+OVSDB_SOCKET = '/var/run/openvswitch/db.sock'
+TUNNEL_TYPES = frozenset(['gre', 'ip6gre', 'vxlan', 'geneve', 'stt',
+                          'lisp'])
+MONITOR_ID = 'tunnel-watchdog'
+
+
+class TunnelIndex(object):
+    """Tunnel interfaces keyed by Interface row uuid."""
+
+    def __init__(self):
+        self._ports = {}
+        self._lock = threading.Lock()
+
+    def _types(self):
+        return set(t for _, t in self._ports.values())
+
+    def update(self, table_updates, reset=False):
+        """Apply ovsdb table-updates for the Interface table.
+
+        :param reset: replace the index, e.g. with the initial rows.
+        :returns: set of tunnel types which had ports before the update
+                  and have none after it.
+        """
+        with self._lock:
+            before = self._types()
+            if reset:
+                self._ports.clear()
+            for uuid, row in table_updates.get('Interface', {}).items():
+                new = row.get('new')
+                if new is not None and new.get('type') in TUNNEL_TYPES:
+                    self._ports[uuid] = (new['name'], new['type'])
+                else:
+                    # Deleted or no longer a tunnel.
+                    self._ports.pop(uuid, None)
+            return before - self._types()
+
+    def ports(self, types=TUNNEL_TYPES):
+        """Return the names of tunnel interfaces of the given types."""
+        with self._lock:
+            return sorted(name for name, t in self._ports.values()
+                          if t in types)
+
+
+class TunnelWatchdog(threading.Thread):
+
+    def __init__(self, path=OVSDB_SOCKET, on_lost=None, retry_interval=5.0,
+                 log=None):
+        """
+        :param on_lost: callable(types) called when the last tunnel port of
+                        some types disappears.
+        :param retry_interval: seconds between reconnection attempts.
+        :param log: optional callable(msg) used to report errors.
+        """
+        super(TunnelWatchdog, self).__init__(name='tunnel-watchdog')
+        self.daemon = True
+        self.path = path
+        self.on_lost = on_lost
+        self.retry_interval = retry_interval
+        self.log = log
+        self.index = TunnelIndex()
+        self.synced = threading.Event()
+        self._stopped = threading.Event()
+        self._sock = None
+
+    def _error(self, msg):
+        if self.log:
+            self.log(msg)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._sock = self.connect()
+                self.session(self._sock)
+            except (socket.error, ValueError) as e:
+                if not self._stopped.is_set():
+                    self._error('OVSDB monitor session failed: %s' % e)
+            finally:
+                self.synced.clear()
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+            self._stopped.wait(self.retry_interval)
+
+    def stop(self):
+        self._stopped.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def _send(self, sock, msg):
+        sock.sendall(json.dumps(msg).encode('UTF-8'))
+
+    def _lost(self, types):
+        if types and self.on_lost:
+            self.on_lost(types)
+
+    def handle(self, sock, msg):
+        method = msg.get('method')
+        if method == 'echo':
+            # ovsdb-server probes idle sessions and drops them unless
+            # answered.
+            self._send(sock, {'id': msg['id'], 'result': msg['params'],
+                              'error': None})
+        elif method == 'update' and msg['params'][0] == MONITOR_ID:
+            self._lost(self.index.update(msg['params'][1]))
+        elif msg.get('id') == MONITOR_ID:
+            if msg.get('error'):
+                raise ValueError('monitor request failed: %s' %
+                                 msg['error'])
+            self._lost(self.index.update(msg['result'], reset=True))
+            self.synced.set()
+
+    def session(self, sock):
+        """Monitor the Interface table until the connection closes."""
+        self._send(sock, {'method': 'monitor',
+                          'params': ['Open_vSwitch', MONITOR_ID,
+                                     {'Interface': {
+                                         'columns': ['name', 'type']}}],
+                          'id': MONITOR_ID})
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder('UTF-8')()
+        buf = ''
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return
+            buf += utf8.decode(data)
+            # Messages are concatenated JSON objects with no delimiter.
+            while True:
+                buf = buf.lstrip()
+                if not buf:
+                    break
+                try:
+                    msg, end = decoder.raw_decode(buf)
+                except ValueError:
+                    # Incomplete message, wait for more data.
+                    break
+                buf = buf[end:]
+                self.handle(sock, msg)
@@ -0,0 +1,136 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Load aware placement of routers and networks orphaned by failed agents.
+
+Used by neutron-ha-monitor.py to pick, for every resource hosted on a dead
+agent, the live agent currently carrying the least load.
+"""
+
+import heapq
+
+ROUTERS = 'routers'
+PORTS = 'ports'
+HA_ROUTERS = 'ha_routers'
+
+DEFAULT_WEIGHTS = {
+    ROUTERS: 1.0,
+    PORTS: 0.0,
+    HA_ROUTERS: 0.0,
+}
+
+
+def parse_weights(weights):
+    """Parse placement weights into a dict of floats.
+
+    :param weights: dict or 'name:value,name:value' string.
+    :returns: dict of weight name to float, unset names use the defaults.
+    """
+    parsed = dict(DEFAULT_WEIGHTS)
+    if not weights:
+        return parsed
+
+    if not isinstance(weights, dict):
+        items = {}
+        for item in weights.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            name, _, value = item.partition(':')
+            items[name.strip()] = value.strip()
+        weights = items
+
+    for name, value in weights.items():
+        if name not in DEFAULT_WEIGHTS:
+            raise ValueError('Unknown placement weight: %s' % name)
+        parsed[name] = float(value)
+    return parsed
+
+
+def count_ports(ports, key):
+    """Count ports grouped by a port attribute.
+
+    :param ports: list of port dicts as returned by list_ports.
+    :param key: attribute to group by e.g. device_id or network_id.
+    :returns: dict of attribute value to number of ports.
+    """
+    counts = {}
+    for port in ports:
+        value = port.get(key)
+        if value:
+            counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+class Weigher(object):
+    """Compute the load a single router or network puts on an agent.
+
+    The routers weight is charged for every hosted resource, networks
+    included, the ports weight per port attached to the resource and the
+    ha_routers weight on top for routers with ha set.
+    """
+
+    def __init__(self, weights=None, port_counts=None):
+        self.weights = parse_weights(weights)
+        self.port_counts = port_counts or {}
+
+    def __call__(self, resource):
+        if not isinstance(resource, dict):
+            resource = {'id': resource}
+
+        load = self.weights[ROUTERS]
+        if self.weights[PORTS]:
+            load += (self.weights[PORTS] *
+                     self.port_counts.get(resource.get('id'), 0))
+        if self.weights[HA_ROUTERS] and resource.get('ha'):
+            load += self.weights[HA_ROUTERS]
+        return load
+
+
+class Placement(object):
+    """Place resources on the least loaded live agent.
+
+    Agents are kept in a min-heap keyed on their current load so placing M
+    orphans over N agents costs O(M log N).  Ties are broken on agent id so
+    the result is deterministic for a given input.
+    """
+
+    def __init__(self, weigher=None):
+        self.weigher = weigher or Weigher()
+        self.loads = {}
+        self._heap = []
+
+    def add_agent(self, agent_id, hosted=None):
+        """Register a live agent with the resources it already hosts."""
+        load = sum(self.weigher(r) for r in (hosted or []))
+        self.loads[agent_id] = load
+        heapq.heappush(self._heap, (load, agent_id))
+
+    def place(self, resource):
+        """Return the agent to host resource and account for its load.
+
+        :param resource: resource dict or id.
+        :returns: agent id or None if there are no live agents.
+        """
+        if not self._heap:
+            return None
+
+        load, agent_id = heapq.heappop(self._heap)
+        load += self.weigher(resource)
+        self.loads[agent_id] = load
+        heapq.heappush(self._heap, (load, agent_id))
+        return agent_id
+
+    def place_all(self, resources):
+        """Place a collection of resources.
+
+        Heavier resources are placed first which gives a better balance
+        than placing them in arrival order.
+
+        :param resources: dict of resource id to resource dict.
+        :returns: dict of resource id to agent id.
+        """
+        order = sorted(resources,
+                       key=lambda r: (-self.weigher(resources[r]), r))
+        return dict((r, self.place(resources[r])) for r in order)
@@ -0,0 +1,55 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Adaptive check interval for neutron-ha-monitor.py.
+
+The monitor checks quickly after it saw something happen (an agent going
+down or coming back, resources moved, a local service restarted) and backs
+off exponentially towards a ceiling while the cluster stays healthy.  A
+wake() call, e.g. from a SIGUSR1 handler, ends the current wait at once.
+"""
+
+import threading
+
+
+class AdaptiveInterval(object):
+
+    def __init__(self, min_interval=2.0, max_interval=30.0, factor=2.0):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError('Invalid check interval range %s-%s' %
+                             (min_interval, max_interval))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = min_interval
+        self._woken = threading.Event()
+
+    def next(self, activity=False):
+        """Return the interval to wait before the next check.
+
+        :param activity: whether the last check saw a failure, a flap or
+                         took a recovery action.
+        """
+        if activity:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval,
+                                self.interval * self.factor)
+        return self.interval
+
+    def wait(self, timeout):
+        """Wait timeout seconds or until woken.
+
+        :returns: True if woken early, in which case the interval is reset
+                  to its minimum.
+        """
+        woken = self._woken.wait(timeout)
+        if woken:
+            self._woken.clear()
+            self.interval = self.min_interval
+        return bool(woken)
+
+    def wake(self, *args):
+        """Wake a pending wait(), usable directly as a signal handler."""
+        self._woken.set()
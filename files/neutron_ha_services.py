@@ -0,0 +1,204 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Local service health checks for neutron-ha-monitor.py.
+
+The state of every monitored service is read with a single command per
+check: 'systemctl show' on systemd and 'initctl list' on upstart.  Services
+found down are restarted together with the services which depend on them,
+at most restart_burst times per restart_period each.
+"""
+
+import collections
+import os
+import subprocess
+import time
+
+SERVICES = [
+    'openvswitch-switch',
+    'neutron-dhcp-agent',
+    'neutron-metadata-agent',
+    'neutron-vpn-agent',
+]
+
+# Services restarted whenever the key service is restarted.
+RESTART_DEPENDENCIES = {
+    'neutron-metadata-agent': ['neutron-vpn-agent'],
+}
+
+SYSTEMD = 'systemd'
+UPSTART = 'upstart'
+
+
+def init_system(systemd_dir='/run/systemd/system'):
+    """Return SYSTEMD when booted with systemd and UPSTART otherwise."""
+    if os.path.isdir(systemd_dir):
+        return SYSTEMD
+    return UPSTART
+
+
+def parse_systemctl_show(output, services):
+    """Map the 'systemctl show' output for services to their properties.
+
+    systemctl prints one block of properties per unit, in the order the
+    units were given, separated by blank lines.
+    """
+    blocks = [{}]
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            if blocks[-1]:
+                blocks.append({})
+            continue
+        key, _, value = line.partition('=')
+        blocks[-1][key] = value
+    return dict(zip(services, [b for b in blocks if b]))
+
+
+def parse_initctl_list(output, services):
+    """Map the 'initctl list' output for services to systemd-like
+    properties.
+
+        neutron-dhcp-agent start/running, process 1234
+        neutron-vpn-agent stop/waiting
+    """
+    states = {}
+    for line in output.splitlines():
+        fields = line.replace(',', ' ').split()
+        if len(fields) < 2 or fields[0] not in services:
+            continue
+        goal, _, sub_state = fields[1].partition('/')
+        pid = '0'
+        if 'process' in fields:
+            pid = fields[fields.index('process') + 1]
+        states[fields[0]] = {
+            'LoadState': 'loaded',
+            'ActiveState': 'active' if goal == 'start' else 'inactive',
+            'SubState': sub_state,
+            'MainPID': pid,
+        }
+    # Jobs initctl does not know about are not installed.
+    for service in services:
+        states.setdefault(service, {'LoadState': 'not-found'})
+    return states
+
+
+def is_healthy(state):
+    """Whether the unit described by state needs no restart.
+
+    Units which are not installed are reported as healthy.  Oneshot units
+    such as openvswitch-switch are active with a SubState of 'exited'.
+    """
+    if state.get('LoadState') == 'not-found':
+        return True
+    return state.get('ActiveState') in ('active', 'activating', 'reloading')
+
+
+class RestartLimiter(object):
+    """Allow at most burst restarts of a service every period seconds."""
+
+    def __init__(self, burst=3, period=300.0, clock=time.time):
+        self.burst = burst
+        self.period = period
+        self.clock = clock
+        self._restarts = collections.defaultdict(collections.deque)
+
+    def allow(self, service):
+        """Record a restart of service if it is within the limit.
+
+        :returns: True if the restart may go ahead.
+        """
+        now = self.clock()
+        restarts = self._restarts[service]
+        while restarts and now - restarts[0] >= self.period:
+            restarts.popleft()
+        if len(restarts) >= self.burst:
+            return False
+        restarts.append(now)
+        return True
+
+
+class ServiceMonitor(object):
+
+    def __init__(self, services=SERVICES, dependencies=RESTART_DEPENDENCIES,
+                 limiter=None, init=None, execute=subprocess.check_output,
+                 log=None):
+        """
+        :param dependencies: dict of service to the services restarted
+                             along with it.
+        :param init: SYSTEMD or UPSTART, detected when None.
+        :param execute: callable(cmd) returning the command output.
+        :param log: optional callable(msg) used to report restarts.
+        """
+        self.services = list(services)
+        self.dependencies = dependencies
+        self.limiter = limiter or RestartLimiter()
+        self.init = init or init_system()
+        self.execute = execute
+        self.log = log
+
+    def _log(self, msg):
+        if self.log:
+            self.log(msg)
+
+    def _output(self, cmd):
+        out = self.execute(cmd)
+        return out.decode('UTF-8') if isinstance(out, bytes) else out
+
+    def states(self):
+        """Return the properties of every service, keyed by service."""
+        if self.init == SYSTEMD:
+            out = self._output(
+                ['systemctl', 'show',
+                 '-p', 'LoadState,ActiveState,SubState,MainPID'] +
+                ['%s.service' % s for s in self.services])
+            return parse_systemctl_show(out, self.services)
+        return parse_initctl_list(self._output(['initctl', 'list']),
+                                  self.services)
+
+    def restart(self, service):
+        """Restart service unless it exceeded its restart limit.
+
+        :returns: True if the service was restarted.
+        """
+        if not self.limiter.allow(service):
+            self._log('Not restarting %s, restarted %d times in the last '
+                      '%ds' % (service, self.limiter.burst,
+                               self.limiter.period))
+            return False
+        self._log('Restart service: %s' % service)
+        try:
+            self.execute(['sudo', 'service', service, 'restart'])
+        except subprocess.CalledProcessError as e:
+            self._log('Failed to restart %s: %s' % (service, e))
+            return False
+        return True
+
+    def check(self):
+        """Restart services which are down, then their dependents.
+
+        :returns: list of services restarted.
+        """
+        states = self.states()
+        failed = [s for s in self.services
+                  if not is_healthy(states.get(s, {}))]
+        restarted = []
+        for service in failed:
+            if service in restarted:
+                continue
+            self._log('Service %s is %s/%s' %
+                      (service, states.get(service, {}).get('ActiveState'),
+                       states.get(service, {}).get('SubState')))
+            if not self.restart(service):
+                continue
+            restarted.append(service)
+            for dependent in self.dependencies.get(service, []):
+                if dependent in restarted:
+                    continue
+                if states.get(dependent, {}).get('LoadState') == \
+                        'not-found':
+                    continue
+                if self.restart(dependent):
+                    restarted.append(dependent)
+        return restarted
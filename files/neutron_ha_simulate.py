@@ -0,0 +1,388 @@
+# Copyright 2014 Canonical Ltd.
+#
+
+"""
+Failover simulation for neutron-ha-monitor.py.
+
+Drives MonitorNeutronAgentsDaemon against an in-memory cloud instead of a
+real neutron server and pacemaker cluster.  The fake neutron client adds
+configurable latency and a configurable rate of failing requests, and the
+topology is set by the number of gateway nodes, routers and networks.
+Every node runs one l3 and one dhcp agent and the monitor runs on node-0,
+which also leads the fake crm cluster.
+
+Each scenario kills and revives nodes, runs monitor checks until no router
+or network is left on a dead agent and reports the failover time, the API
+calls and crm calls made and how evenly the resources ended up spread.
+The monitor itself needs oslo.config and neutron to import, so run this on
+a gateway node or in a virtualenv with neutron installed:
+
+    python neutron_ha_simulate.py --nodes 3 --routers 300 --networks 300 \\
+        --latency 0.02 --error-rate 0.05
+
+The unit tests run the scenarios on stand ins of those modules.
+"""
+
+import collections
+import os
+import random
+import threading
+import time
+
+from neutron_ha_agents import (
+    DHCP_AGENT,
+    L3_AGENT,
+)
+
+MONITOR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'neutron-ha-monitor.py')
+
+
+class SimulatedError(Exception):
+    """Raised by the fake client for requests chosen to fail."""
+
+    status_code = 500
+
+
+class Cluster(object):
+    """In-memory agents, routers and networks of a gateway cluster."""
+
+    def __init__(self, nodes=3, routers=30, networks=30):
+        self.nodes = ['node-%d' % n for n in range(nodes)]
+        self.agents = []
+        for node in self.nodes:
+            for agent_type, prefix in ((L3_AGENT, 'l3'), (DHCP_AGENT,
+                                                          'dhcp')):
+                self.agents.append({'id': '%s-%s' % (prefix, node),
+                                    'agent_type': agent_type,
+                                    'host': node,
+                                    'alive': True,
+                                    'admin_state_up': True,
+                                    'configurations': {}})
+        l3 = self.agent_ids(L3_AGENT)
+        dhcp = self.agent_ids(DHCP_AGENT)
+        # Router ids to their agent, network ids to their set of agents.
+        self.routers = dict(('router-%d' % r, l3[r % len(l3)])
+                            for r in range(routers))
+        self.networks = dict(('network-%d' % n, set([dhcp[n % len(dhcp)]]))
+                             for n in range(networks))
+        self.lock = threading.Lock()
+
+    def agent_ids(self, agent_type, alive=None):
+        return [a['id'] for a in self.agents
+                if a['agent_type'] == agent_type and
+                (alive is None or a['alive'] == alive)]
+
+    def set_alive(self, node, alive):
+        with self.lock:
+            for agent in self.agents:
+                if agent['host'] == node:
+                    agent['alive'] = alive
+
+    def orphans(self):
+        """Return the number of resources left only on dead agents."""
+        with self.lock:
+            dead = set(a['id'] for a in self.agents if not a['alive'])
+            return (len([r for r, a in self.routers.items() if a in dead]) +
+                    len([n for n, agents in self.networks.items()
+                         if agents and agents <= dead]))
+
+    def lost(self):
+        """Return the number of resources hosted by no agent at all."""
+        with self.lock:
+            return (len([r for r, a in self.routers.items() if a is None]) +
+                    len([n for n, agents in self.networks.items()
+                         if not agents]))
+
+    def balance(self):
+        """Return the resources hosted per live agent, keyed by type."""
+        with self.lock:
+            routers = dict((a, 0) for a in self.agent_ids(L3_AGENT, True))
+            networks = dict((a, 0) for a in self.agent_ids(DHCP_AGENT, True))
+            for agent in self.routers.values():
+                if agent in routers:
+                    routers[agent] += 1
+            for agents in self.networks.values():
+                for agent in agents:
+                    if agent in networks:
+                        networks[agent] += 1
+            return {'routers': routers, 'networks': networks}
+
+
+class FakeNeutronClient(object):
+    """The subset of the neutronclient API used by the monitor."""
+
+    def __init__(self, cluster, latency=0.0, error_rate=0.0, seed=0,
+                 error=SimulatedError, sleep=time.sleep):
+        """
+        :param latency: seconds every request takes.
+        :param error_rate: fraction of requests failing with error.
+        """
+        self.cluster = cluster
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error = error
+        self.sleep = sleep
+        self.random = random.Random(seed)
+        self.calls = collections.Counter()
+        self.errors = 0
+
+    def _request(self, verb):
+        with self.cluster.lock:
+            self.calls[verb] += 1
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if self.latency:
+            self.sleep(self.latency)
+        if fail:
+            raise self.error()
+
+    def list_agents(self, **params):
+        self._request('GET')
+        with self.cluster.lock:
+            return {'agents': [dict(a) for a in self.cluster.agents
+                               if all(a.get(k) == v
+                                      for k, v in params.items())]}
+
+    def list_routers_on_l3_agent(self, l3_agent, **params):
+        self._request('GET')
+        with self.cluster.lock:
+            return {'routers': [{'id': r} for r, a in
+                                sorted(self.cluster.routers.items())
+                                if a == l3_agent]}
+
+    def list_networks_on_dhcp_agent(self, dhcp_agent, **params):
+        self._request('GET')
+        with self.cluster.lock:
+            return {'networks': [{'id': n} for n, agents in
+                                 sorted(self.cluster.networks.items())
+                                 if dhcp_agent in agents]}
+
+    def list_ports(self, **params):
+        self._request('GET')
+        return {'ports': []}
+
+    def remove_router_from_l3_agent(self, l3_agent, router_id):
+        self._request('DELETE')
+        with self.cluster.lock:
+            if self.cluster.routers.get(router_id) == l3_agent:
+                self.cluster.routers[router_id] = None
+
+    def add_router_to_l3_agent(self, l3_agent, body):
+        self._request('POST')
+        with self.cluster.lock:
+            if self.cluster.routers.get(body['router_id']) is not None:
+                # neutron refuses to host a legacy router twice.
+                raise self.error()
+            self.cluster.routers[body['router_id']] = l3_agent
+
+    def remove_network_from_dhcp_agent(self, dhcp_agent, network_id):
+        self._request('DELETE')
+        with self.cluster.lock:
+            self.cluster.networks[network_id].discard(dhcp_agent)
+
+    def add_network_to_dhcp_agent(self, dhcp_agent, body):
+        self._request('POST')
+        with self.cluster.lock:
+            self.cluster.networks[body['network_id']].add(dhcp_agent)
+
+
+def _spread(counts):
+    if not counts:
+        return 0
+    return max(counts.values()) - min(counts.values())
+
+
+class Result(object):
+
+    def __init__(self, name, cluster, client, checks, duration, crm_calls,
+                 moved):
+        self.name = name
+        self.moved = moved
+        self.checks = checks
+        self.duration = duration
+        self.calls = dict(client.calls)
+        self.errors = client.errors
+        self.crm_calls = crm_calls
+        self.orphans = cluster.orphans()
+        self.lost = cluster.lost()
+        self.balance = cluster.balance()
+
+    def __str__(self):
+        return ('%-8s failover=%.3fs checks=%d moved=%d api=%d (%s) '
+                'errors=%d crm=%d orphans=%d lost=%d spread routers=%d '
+                'networks=%d' %
+                (self.name, self.duration, self.checks, self.moved,
+                 sum(self.calls.values()),
+                 ' '.join('%s:%d' % c for c in sorted(self.calls.items())),
+                 self.errors, self.crm_calls, self.orphans, self.lost,
+                 _spread(self.balance['routers']),
+                 _spread(self.balance['networks'])))
+
+
+def load_monitor(path=MONITOR):
+    """Import neutron-ha-monitor.py and register its options."""
+    try:
+        from importlib import util
+    except ImportError:
+        # Python 2
+        import imp
+        monitor = imp.load_source('neutron_ha_monitor', path)
+    else:
+        spec = util.spec_from_file_location('neutron_ha_monitor', path)
+        monitor = util.module_from_spec(spec)
+        spec.loader.exec_module(monitor)
+    try:
+        monitor.cfg.CONF.register_cli_opts(monitor.OPTS)
+    except monitor.cfg.DuplicateOptError:
+        pass
+    monitor.cfg.CONF(args=[], project='monitor_neutron_agents',
+                     default_config_files=[])
+    return monitor
+
+
+class Simulator(object):
+
+    def __init__(self, monitor, nodes=3, routers=30, networks=30,
+                 latency=0.0, error_rate=0.0, seed=0, max_checks=20,
+                 overrides=None):
+        """
+        :param monitor: the module returned by load_monitor().
+        :param overrides: dict of monitor options to set, e.g.
+                          {'reschedule_workers': 1}.
+        """
+        self.monitor = monitor
+        self.topology = (nodes, routers, networks)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.max_checks = max_checks
+        conf = monitor.cfg.CONF
+        # Keep retry backoff in proportion to the simulated latency.
+        conf.set_override('reschedule_interval', max(latency, 0.001))
+        for name, value in (overrides or {}).items():
+            conf.set_override(name, value)
+
+    def daemon(self, client, crm_calls):
+        base = self.monitor.MonitorNeutronAgentsDaemon
+
+        class SimulatedDaemon(base):
+
+            def get_hostname(self):
+                return 'node-0'
+
+            def get_quantum_client(self):
+                return client
+
+            def list_monitor_res(self):
+                crm_calls.append(1)
+                return ['node-0']
+
+            def cleanup_dhcp(self, networks):
+                pass
+
+            def cleanup_router(self, routers):
+                pass
+
+        return SimulatedDaemon()
+
+    def _setup(self):
+        # Same error pattern and retry jitter on every run.
+        random.seed(self.seed)
+        nodes, routers, networks = self.topology
+        cluster = Cluster(nodes, routers, networks)
+
+        class Error(self.monitor.exceptions.NeutronException, SimulatedError):
+            message = 'Simulated API error'
+
+        client = FakeNeutronClient(cluster, latency=self.latency,
+                                   error_rate=self.error_rate,
+                                   seed=self.seed, error=Error)
+        crm_calls = []
+        return cluster, client, crm_calls, self.daemon(client, crm_calls)
+
+    def check(self, daemon, client):
+        daemon.reassign_agent_resources(quantum=client)
+
+    def run(self, name, events):
+        """Run a scenario.
+
+        :param events: list of (check, node, alive) applied before the
+                       check of that index; checks continue until no
+                       resource is left on a dead agent.
+        :returns: Result
+        """
+        cluster, client, crm_calls, daemon = self._setup()
+        # Settle, so the steady state checks are not counted.
+        self.check(daemon, client)
+        client.calls.clear()
+        del crm_calls[:]
+        moved = daemon.metrics.moved
+
+        start = None
+        checks = 0
+        last_event = max(e[0] for e in events)
+        while checks < self.max_checks:
+            for check, node, alive in events:
+                if check == checks:
+                    cluster.set_alive(node, alive)
+                    if start is None:
+                        start = time.time()
+            self.check(daemon, client)
+            checks += 1
+            if checks > last_event and not cluster.orphans():
+                break
+        return Result(name, cluster, client, checks, time.time() - start,
+                      len(crm_calls),
+                      moved.value(resource='router') +
+                      moved.value(resource='network'))
+
+    def single_loss(self):
+        return self.run('single', [(0, 'node-1', False)])
+
+    def double_loss(self):
+        return self.run('double', [(0, 'node-1', False),
+                                   (0, 'node-2', False)])
+
+    def flapping(self):
+        return self.run('flapping', [(0, 'node-1', False),
+                                     (1, 'node-1', True),
+                                     (2, 'node-1', False),
+                                     (3, 'node-1', True),
+                                     (4, 'node-1', False)])
+
+    SCENARIOS = ('single_loss', 'double_loss', 'flapping')
+
+    def run_all(self, scenarios=SCENARIOS):
+        return [getattr(self, s)() for s in scenarios]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Simulate failovers of the neutron HA monitor.')
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--routers', type=int, default=100)
+    parser.add_argument('--networks', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='Seconds every API request takes.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of API requests which fail.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='reschedule_workers and scan_workers.')
+    parser.add_argument('--scenarios', nargs='+',
+                        choices=Simulator.SCENARIOS,
+                        default=list(Simulator.SCENARIOS))
+    args = parser.parse_args()
+
+    simulator = Simulator(load_monitor(), nodes=args.nodes,
+                          routers=args.routers, networks=args.networks,
+                          latency=args.latency, error_rate=args.error_rate,
+                          seed=args.seed,
+                          overrides={'reschedule_workers': args.workers,
+                                     'scan_workers': args.workers})
+    for result in simulator.run_all(args.scenarios):
+        print(result)
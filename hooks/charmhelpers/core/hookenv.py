@@ -19,6 +19,7 @@
 #  Charm Helpers Developers <juju@lists.ubuntu.com>
 
 from __future__ import print_function
+import atexit as _py_atexit
 import copy
 from distutils.version import LooseVersion
 from functools import wraps
@@ -91,13 +92,60 @@ def flush(key):
         del cache[item]
 
 
+# Messages queued by log() while buffer_log() is in effect, else None.
+_log_buffer = None
+# Upper bound on the messages joined into one juju-log call, Linux limits a
+# single argument to 128KiB.
+LOG_BATCH_MAX = 65536
+
+
 def log(message, level=None):
     """Write a message to the juju log"""
+    if not isinstance(message, six.string_types):
+        message = repr(message)
+    if _log_buffer is None:
+        _juju_log(message, level)
+        return
+    _log_buffer.append((level, message))
+    if level in (ERROR, CRITICAL):
+        flush_log()
+
+
+def buffer_log():
+    """Queue the messages of log() for the rest of the hook rather than
+    forking juju-log for each of them.
+
+    The queue is sent when the process exits, one juju-log call for each run
+    of messages at the same level, so the order is kept.  ERROR and CRITICAL
+    messages send the queue, and themselves, at once.
+    """
+    global _log_buffer
+    if _log_buffer is None:
+        _log_buffer = []
+        _py_atexit.register(flush_log)
+
+
+def flush_log():
+    """Send the messages queued since buffer_log() to juju-log."""
+    if not _log_buffer:
+        return
+    batches = []
+    for level, message in _log_buffer:
+        if (batches and batches[-1][0] == level and
+                batches[-1][2] + len(message) < LOG_BATCH_MAX):
+            batches[-1][1].append(message)
+            batches[-1][2] += len(message) + 1
+        else:
+            batches.append([level, [message], len(message)])
+    del _log_buffer[:]
+    for level, messages, _ in batches:
+        _juju_log('\n'.join(messages), level)
+
+
+def _juju_log(message, level=None):
     command = ['juju-log']
     if level:
         command += ['-l', level]
-    if not isinstance(message, six.string_types):
-        message = repr(message)
     command += [message]
     # Missing juju-log should not cause failures in unit tests
     # Send log output to stderr
@@ -422,6 +470,14 @@ def config(scope=None):
 @cached
 def relation_get(attribute=None, unit=None, rid=None):
     """Get relation information"""
+    snapshot = _relation_snapshot()
+    if snapshot is not None:
+        settings = snapshot['settings'].get((rid or relation_id(),
+                                             unit or remote_unit()))
+        if settings is not None:
+            if attribute:
+                return settings.get(attribute)
+            return dict(settings)
     _args = ['relation-get', '--format=json']
     if rid:
         _args.append('-r')
@@ -492,6 +548,9 @@ def relation_ids(reltype=None):
     reltype = reltype or relation_type()
     relid_cmd_line = ['relation-ids', '--format=json']
     if reltype is not None:
+        snapshot = _relation_snapshot()
+        if snapshot is not None and reltype in snapshot['ids']:
+            return list(snapshot['ids'][reltype])
         relid_cmd_line.append(reltype)
         return json.loads(
             subprocess.check_output(relid_cmd_line).decode('UTF-8')) or []
@@ -504,11 +563,95 @@ def related_units(relid=None):
     relid = relid or relation_id()
     units_cmd_line = ['relation-list', '--format=json']
     if relid is not None:
+        snapshot = _relation_snapshot()
+        if snapshot is not None and relid in snapshot['units']:
+            return list(snapshot['units'][relid])
         units_cmd_line.extend(('-r', relid))
     return json.loads(
         subprocess.check_output(units_cmd_line).decode('UTF-8')) or []
 
 
+_prefetch_relations = False
+RELATION_SNAPSHOT_KEY = '<relation-snapshot>'
+
+
+def prefetch_relations():
+    """Answer relation_ids(), related_units() and relation_get() for remote
+    units from one snapshot of all the charm's relations for the rest of the
+    hook.
+
+    The snapshot is taken on first use, running the relation-ids,
+    relation-list and relation-get calls for each stage in parallel, rather
+    than forking one hook tool per lookup.  Juju keeps the remote settings a
+    hook sees constant for the hook, so the snapshot does not go stale.  The
+    local unit's settings, and units which are not in the relation any more
+    such as the departing unit, are still read with relation-get.
+    """
+    global _prefetch_relations
+    _prefetch_relations = True
+
+
+def _check_outputs(commands, width=16):
+    """Run commands in parallel, width at a time.
+
+    :returns: list of the outputs decoded, None for those which failed.
+    """
+    outputs = []
+    for i in range(0, len(commands), width):
+        procs = [subprocess.Popen(command, stdout=subprocess.PIPE)
+                 for command in commands[i:i + width]]
+        for proc in procs:
+            output = proc.communicate()[0]
+            outputs.append(output.decode('UTF-8')
+                           if proc.returncode == 0 else None)
+    return outputs
+
+
+def _relation_snapshot():
+    """The snapshot taken for prefetch_relations(), or None if not enabled
+    or it could not be taken.
+
+    :returns: dict with the relation ids by relation type under 'ids', the
+              units by relation id under 'units' and the settings by
+              (relation id, unit) under 'settings'.
+    """
+    if not _prefetch_relations:
+        return None
+    try:
+        return cache[RELATION_SNAPSHOT_KEY]
+    except KeyError:
+        pass
+    snapshot = {'ids': {}, 'units': {}, 'settings': {}}
+    try:
+        reltypes = relation_types()
+        outputs = _check_outputs([['relation-ids', '--format=json', reltype]
+                                  for reltype in reltypes])
+        for reltype, output in zip(reltypes, outputs):
+            if output is not None:
+                snapshot['ids'][reltype] = json.loads(output) or []
+        relids = [relid for reltype in reltypes
+                  for relid in snapshot['ids'].get(reltype, [])]
+        outputs = _check_outputs([['relation-list', '--format=json',
+                                   '-r', relid] for relid in relids])
+        for relid, output in zip(relids, outputs):
+            if output is not None:
+                snapshot['units'][relid] = json.loads(output) or []
+        members = [(relid, unit) for relid in relids
+                   for unit in snapshot['units'].get(relid, [])]
+        outputs = _check_outputs([['relation-get', '--format=json',
+                                   '-r', relid, '-', unit]
+                                  for relid, unit in members])
+        for member, output in zip(members, outputs):
+            if output is not None:
+                snapshot['settings'][member] = json.loads(output) or {}
+    except (IOError, OSError, ValueError) as e:
+        log('Unable to take a relation snapshot: {}'.format(e),
+            level=WARNING)
+        snapshot = None
+    cache[RELATION_SNAPSHOT_KEY] = snapshot
+    return snapshot
+
+
 @cached
 def relation_for_unit(unit=None, rid=None):
     """Get the json represenation of a unit's relation"""
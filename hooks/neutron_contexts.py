@@ -1,24 +1,35 @@
 # vim: set ts=4:et
+import copy
+import json
 import os
+import re
 import uuid
+from contextlib import contextmanager
+from functools import wraps
+from charmhelpers.core import hookenv
 from charmhelpers.core.hookenv import (
-    log, ERROR,
+    log, DEBUG, ERROR, WARNING,
     config,
     unit_get,
     network_get_primary_address,
 )
+import charmhelpers.contrib.openstack.context as context
 from charmhelpers.contrib.openstack.context import (
     OSContextGenerator,
-    NeutronAPIContext,
+    WorkerConfigContext,
     config_flags_parser,
 )
 from charmhelpers.contrib.openstack.utils import (
     os_release,
     CompareOpenStackReleases,
 )
+from charmhelpers.contrib.openstack.neutron import parse_data_port_mappings
+from charmhelpers.core.host import get_total_ram
 from charmhelpers.contrib.hahelpers.cluster import (
     eligible_leader
 )
+from neutron_nics import nic_inventory
+from neutron_tuning import nic_tuning
 from charmhelpers.contrib.network.ip import (
     get_address_in_network,
     get_host_ip,
@@ -37,6 +48,8 @@ OVS_ODL = 'ovs-odl'
 
 NEUTRON = 'neutron'
 
+MAC_REGEX = re.compile(r'([0-9A-F]{2}[:-]){5}([0-9A-F]{2})', re.I)
+
 CORE_PLUGIN = {
     OVS: NEUTRON_ML2_PLUGIN,
     N1KV: NEUTRON_N1KV_PLUGIN,
@@ -49,8 +62,263 @@ def core_plugin():
     return CORE_PLUGIN[config('plugin')]
 
 
-class L3AgentContext(OSContextGenerator):
+IPTABLES_HYBRID = 'iptables_hybrid'
+OPENVSWITCH = 'openvswitch'
+NATIVE = 'native'
+
+FIREWALL_DRIVERS = {
+    IPTABLES_HYBRID:
+    'neutron.agent.linux.iptables_firewall.OVSHybridIptablesFirewallDriver',
+    OPENVSWITCH: 'openvswitch',
+}
+
+# The first release whose openvswitch agent supports each of these, and the
+# values they can be set to.
+OVS_AGENT_OPTIONS = {
+    'of-interface': ('mitaka', [NATIVE, 'ovs-ofctl']),
+    'ovsdb-interface': ('mitaka', [NATIVE, 'vsctl']),
+}
+OVS_FIREWALL_RELEASE = 'newton'
+
+
+def ovs_agent_options(release):
+    '''The settings of the openvswitch agent chosen in the charm config which
+    release supports.
+
+    :param release: openstack release codename
+    :returns: dict with the firewall driver under 'firewall_driver', and
+              of_interface and ovsdb_interface if set.
+    '''
+    cmp_os_release = CompareOpenStackReleases(release)
+    options = {'firewall_driver': FIREWALL_DRIVERS[IPTABLES_HYBRID]}
+    firewall_driver = config('firewall-driver')
+    if firewall_driver == OPENVSWITCH:
+        if cmp_os_release >= OVS_FIREWALL_RELEASE:
+            options['firewall_driver'] = FIREWALL_DRIVERS[OPENVSWITCH]
+        else:
+            log('The openvswitch firewall driver is unsupported'
+                ' for {}.'.format(release), level=WARNING)
+    elif firewall_driver and firewall_driver not in FIREWALL_DRIVERS:
+        log('Unknown firewall-driver {}.'.format(firewall_driver),
+            level=WARNING)
+    for key, (first_release, values) in OVS_AGENT_OPTIONS.items():
+        value = config(key)
+        if not value:
+            continue
+        if value not in values:
+            log('Unknown {} {}.'.format(key, value), level=WARNING)
+        elif cmp_os_release >= first_release:
+            options[key.replace('-', '_')] = value
+        else:
+            log('{} {} is unsupported for {}.'.format(key, value, release),
+                level=WARNING)
+    return options
+
+
+# Prefix of the keys of the contexts memoized in the hookenv cache.
+CONTEXT_CACHE_KEY = '<neutron-context>'
+
+# Nesting depth of context_cache() scopes, contexts are only memoized when
+# greater than zero.
+_context_cache_depth = 0
+
+
+@contextmanager
+def context_cache():
+    '''Memoize context generators decorated with cached_context while in
+    this scope.
+
+    Results are kept in the hookenv cache, so for the rest of the hook: the
+    config and the remote units' relation data juju hands a hook do not
+    change while it runs.  NeutronConfigRenderer renders in this scope so
+    each context is evaluated once per hook rather than once per template it
+    is registered with.
+    '''
+    global _context_cache_depth
+    _context_cache_depth += 1
+    try:
+        yield
+    finally:
+        _context_cache_depth -= 1
+
+
+def flush_context_cache():
+    '''Evaluate the memoized contexts again on their next use.'''
+    hookenv.flush(CONTEXT_CACHE_KEY)
+
+
+def cached_context(func):
+    '''Decorator for the __call__ of a CachedContextGenerator, memoizing the
+    context by generator class and constructor arguments in a context_cache()
+    scope.  The installed OpenStack release is part of the key, so contexts
+    gated on it are evaluated again once an upgrade resets os_release().
+
+    The attributes the generator sets on itself while called, such as
+    complete and missing_data, are restored along with the context, and
+    copies are handed out so callers may modify them.
+    '''
+    @wraps(func)
+    def wrapper(self):
+        if not _context_cache_depth:
+            return func(self)
+        key = json.dumps((CONTEXT_CACHE_KEY, os_release('neutron-common'),
+                          func, type(self), self._context_args),
+                         sort_keys=True, default=str)
+        try:
+            ctxt, state = hookenv.cache[key]
+        except KeyError:
+            ctxt = func(self)
+            hookenv.cache[key] = (copy.deepcopy(ctxt),
+                                  copy.deepcopy(self.__dict__))
+            return ctxt
+        self.__dict__.update(copy.deepcopy(state))
+        return copy.deepcopy(ctxt)
+    return wrapper
+
+
+class CachedContextGenerator(OSContextGenerator):
+    '''Context generator which keeps its constructor arguments, for
+    cached_context to key on.'''
+
+    def __new__(cls, *args, **kwargs):
+        obj = super(CachedContextGenerator, cls).__new__(cls)
+        obj._context_args = (args, kwargs)
+        return obj
+
+
+class AMQPContext(CachedContextGenerator, context.AMQPContext):
+    __call__ = cached_context(context.AMQPContext.__call__)
+
+
+class NeutronAPIContext(CachedContextGenerator, context.NeutronAPIContext):
+    __call__ = cached_context(context.NeutronAPIContext.__call__)
+
+
+class NetworkServiceContext(CachedContextGenerator,
+                            context.NetworkServiceContext):
+    __call__ = cached_context(context.NetworkServiceContext.__call__)
+
+
+class NeutronPortContext(CachedContextGenerator, context.NeutronPortContext):
+    '''NeutronPortContext resolving ports from the nic_inventory() rather
+    than looking each interface up again.'''
+
+    def resolve_ports(self, ports):
+        '''Resolve NICs not yet bound to bridge(s)
+
+        If hwaddress provided then returns resolved hwaddress otherwise NIC.
+        '''
+        if not ports:
+            return None
+
+        nics = nic_inventory()['by_name']
+        hwaddr_to_nic = {}
+        hwaddr_to_ip = {}
+        for nic in sorted(nics.values(), key=lambda nic: nic['index']):
+            # Ignore virtual interfaces (bond masters will be identified from
+            # their slaves)
+            if nic['virtual']:
+                continue
+
+            if nic['bond_master'] in nics:
+                log("Replacing iface '%s' with bond master '%s'" %
+                    (nic['name'], nic['bond_master']), level=DEBUG)
+                nic = nics[nic['bond_master']]
+
+            hwaddr_to_nic[nic['mac']] = nic['name']
+            hwaddr_to_ip[nic['mac']] = nic['addresses']
+
+        resolved = []
+        for entry in ports:
+            if re.match(MAC_REGEX, entry):
+                # NIC is in known NICs and does NOT have an IP address, nor
+                # is part of a bridge
+                if (entry in hwaddr_to_nic and not hwaddr_to_ip[entry] and
+                        not nics[hwaddr_to_nic[entry]]['bridge_member']):
+                    resolved.append(hwaddr_to_nic[entry])
+            else:
+                # If the passed entry is not a MAC address, assume it's a valid
+                # interface, and that the user put it there on purpose (we can
+                # trust it to be the real external network).
+                resolved.append(entry)
+
+        # Ensure no duplicates
+        return list(set(resolved))
+
+
+class ExternalPortContext(NeutronPortContext):
+
+    @cached_context
+    def __call__(self):
+        ctxt = {}
+        ports = config('ext-port')
+        if ports:
+            ports = [p.strip() for p in ports.split()]
+            ports = self.resolve_ports(ports)
+            if ports:
+                ctxt = {"ext_port": ports[0]}
+                napi_settings = NeutronAPIContext()()
+                mtu = napi_settings.get('network_device_mtu')
+                if mtu:
+                    ctxt['ext_port_mtu'] = mtu
+
+        return ctxt
+
+
+class DataPortContext(NeutronPortContext):
+
+    @cached_context
+    def __call__(self):
+        ports = config('data-port')
+        if ports:
+            # Map of {port/mac:bridge}
+            portmap = parse_data_port_mappings(ports)
+            ports = portmap.keys()
+            # Resolve provided ports or mac addresses and filter out those
+            # already attached to a bridge.
+            resolved = self.resolve_ports(ports)
+            nics = nic_inventory()['by_name']
+            normalized = {nics[port]['mac'] if port in nics else '': port
+                          for port in resolved if port not in ports}
+            normalized.update({port: port for port in resolved
+                               if port in ports})
+            if resolved:
+                return {normalized[port]: bridge for port, bridge in
+                        portmap.items() if port in normalized}
+
+        return None
+
+
+class PhyNICMTUContext(DataPortContext):
+
+    @cached_context
+    def __call__(self):
+        ctxt = {}
+        mappings = super(PhyNICMTUContext, self).__call__()
+        if mappings:
+            ports = sorted(mappings.keys())
+            napi_settings = NeutronAPIContext()()
+            mtu = napi_settings.get('network_device_mtu')
+            # If any of ports is a vlan device, its underlying device must
+            # have mtu applied first.
+            nics = nic_inventory()['by_name']
+            all_ports = set()
+            for port in ports:
+                if port in nics:
+                    all_ports.update(nics[port]['lower'])
+
+            all_ports = list(all_ports)
+            all_ports.extend(ports)
+            if mtu:
+                ctxt["devs"] = '\\n'.join(all_ports)
+                ctxt['mtu'] = mtu
+
+        return ctxt
+
+
+class L3AgentContext(CachedContextGenerator):
 
+    @cached_context
     def __call__(self):
         api_settings = NeutronAPIContext()()
         ctxt = {}
@@ -82,6 +350,7 @@ class L3AgentContext(OSContextGenerator):
 
 class NeutronGatewayContext(NeutronAPIContext):
 
+    @cached_context
     def __call__(self):
         api_settings = super(NeutronGatewayContext, self).__call__()
         ctxt = {
@@ -141,6 +410,8 @@ class NeutronGatewayContext(NeutronAPIContext):
             ctxt['network_device_mtu'] = net_dev_mtu
             ctxt['veth_mtu'] = net_dev_mtu
 
+        ctxt.update(ovs_agent_options(os_release('neutron-common')))
+
         # Override user supplied config for these plugins as these settings are
         # mandatory
         if ctxt['plugin'] in ['nvp', 'nsx', 'n1kv']:
@@ -150,8 +421,9 @@ class NeutronGatewayContext(NeutronAPIContext):
         return ctxt
 
 
-class NovaMetadataContext(OSContextGenerator):
+class NovaMetadataContext(CachedContextGenerator):
 
+    @cached_context
     def __call__(self):
         ctxt = {}
         ctxt['vendordata_providers'] = []
@@ -174,6 +446,85 @@ class NovaMetadataContext(OSContextGenerator):
         return ctxt
 
 
+# The agent concurrency settings: the upstream default of each, which the
+# derived values never go below, and the config option overriding it.
+AGENT_CONCURRENCY = {
+    'executor_thread_pool_size': (64, 'executor-thread-pool-size'),
+    'rpc_conn_pool_size': (30, 'rpc-conn-pool-size'),
+    'num_sync_threads': (4, 'dhcp-num-sync-threads'),
+}
+
+
+def agent_concurrency(workers, ram_gb):
+    '''Derive the agent concurrency settings from the number of workers,
+    which follows the CPU count and worker-multiplier, and the RAM.
+
+    Thread and connection pools grow with the workers, up to a ceiling set
+    by the RAM, and never below their upstream defaults.
+
+    :param workers: int number of workers, as from _calculate_workers()
+    :param ram_gb: int GiB of RAM of the unit
+    :returns: dict of setting to value
+    '''
+    ram_gb = max(1, ram_gb)
+    derived = {
+        'executor_thread_pool_size': min(8 * workers, 32 * ram_gb),
+        'rpc_conn_pool_size': min(4 * workers, 16 * ram_gb),
+        'num_sync_threads': min(workers, 2 * ram_gb),
+    }
+    return dict((key, max(default, derived[key]))
+                for key, (default, _) in AGENT_CONCURRENCY.items())
+
+
+class AgentConcurrencyContext(CachedContextGenerator,
+                              WorkerConfigContext):
+
+    @cached_context
+    def __call__(self):
+        ctxt = super(AgentConcurrencyContext, self).__call__()
+        try:
+            ram_gb = get_total_ram() // (1024 ** 3)
+        except (IOError, NotImplementedError):
+            ram_gb = 1
+        ctxt.update(agent_concurrency(ctxt['workers'], ram_gb))
+        for key, (_, option) in AGENT_CONCURRENCY.items():
+            if config(option):
+                ctxt[key] = config(option)
+        return ctxt
+
+
+class RootwrapDaemonContext(CachedContextGenerator):
+
+    @cached_context
+    def __call__(self):
+        ctxt = {}
+        if not config('use-rootwrap-daemon'):
+            return ctxt
+        cmp_os_release = CompareOpenStackReleases(os_release('neutron-common'))
+        if cmp_os_release >= 'kilo':
+            ctxt['rootwrap_daemon'] = True
+        else:
+            log('The rootwrap daemon is unsupported'
+                ' for {}.'.format(cmp_os_release), level=WARNING)
+        return ctxt
+
+
+class NICTuningContext(CachedContextGenerator):
+    '''The NICs under the external and data ports and the CPUs to spread
+    their interrupts and queues over.'''
+
+    @cached_context
+    def __call__(self):
+        if not config('nic-tuning'):
+            return {}
+        ports = []
+        ext_port = ExternalPortContext()().get('ext_port')
+        if ext_port:
+            ports.append(ext_port)
+        ports.extend(sorted(DataPortContext()() or {}))
+        return nic_tuning(ports, nic_inventory()['by_name'])
+
+
 SHARED_SECRET = "/etc/{}/secret.txt"
 
 
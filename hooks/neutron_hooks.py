@@ -4,12 +4,14 @@ from base64 import b64decode
 
 from charmhelpers.core.hookenv import (
     log, ERROR, WARNING,
+    buffer_log,
     config,
     relation_get,
     relation_set,
     relation_ids,
     Hooks,
     UnregisteredHookError,
+    prefetch_relations,
     status_set,
 )
 from charmhelpers.core.host import service_restart
@@ -32,7 +34,6 @@ from charmhelpers.contrib.hahelpers.apache import(
 from charmhelpers.contrib.openstack.utils import (
     configure_installation_source,
     openstack_upgrade_available,
-    pausable_restart_on_change as restart_on_change,
     is_unit_paused_set,
 )
 from charmhelpers.payload.execd import execd_preinstall
@@ -42,12 +43,20 @@ from charmhelpers.contrib.charmsupport import nrpe
 from charmhelpers.contrib.hardening.harden import harden
 
 import sys
+from neutron_templating import (
+    pausable_restart_on_change as restart_on_change,
+)
+from neutron_tuning import (
+    SYSCTL_FILE,
+    gateway_sysctls,
+)
 from neutron_utils import (
     L3HA_PACKAGES,
-    register_configs,
+    LazyConfigs,
     restart_map,
     services,
     do_openstack_upgrade,
+    load_os_release,
     get_packages,
     get_early_packages,
     valid_plugin,
@@ -59,16 +68,20 @@ from neutron_utils import (
     install_legacy_ha_files,
     cleanup_ovs_netns,
     stop_neutron_ha_monitor_daemon,
+    restart_neutron_ha_monitor_daemon,
+    wake_neutron_ha_monitor_daemon,
     use_l3ha,
     NEUTRON_COMMON,
     assess_status,
     install_systemd_override,
+    update_nic_tuning,
     configure_apparmor,
     write_vendordata,
 )
 
 hooks = Hooks()
-CONFIGS = register_configs()
+# Registered on first use, hooks which render nothing never pay for it.
+CONFIGS = LazyConfigs()
 
 
 @hooks.hook('install')
@@ -101,10 +114,11 @@ def install():
     # Install systemd overrides to remove service startup race between
     # n-gateway and n-cloud-controller services.
     install_systemd_override()
+    update_nic_tuning()
 
 
 @hooks.hook('config-changed')
-@restart_on_change(restart_map())
+@restart_on_change(restart_map, rendered=True)
 @harden()
 def config_changed():
     global CONFIGS
@@ -115,9 +129,9 @@ def config_changed():
 
     update_nrpe_config()
 
-    sysctl_dict = config('sysctl')
+    sysctl_dict = gateway_sysctls()
     if sysctl_dict:
-        create_sysctl(sysctl_dict, '/etc/sysctl.d/50-quantum-gateway.conf')
+        create_sysctl(sysctl_dict, SYSCTL_FILE)
 
     if config('vendor-data'):
         write_vendordata(config('vendor-data'))
@@ -131,6 +145,7 @@ def config_changed():
         CONFIGS.write_all()
         configure_ovs()
         configure_apparmor()
+        update_nic_tuning()
     else:
         message = 'Please provide a valid plugin config'
         log(message, level=ERROR)
@@ -153,10 +168,14 @@ def upgrade_charm():
     install()
     config_changed()
     update_legacy_ha_files(force=True)
+    if config('ha-legacy-mode'):
+        # Run the neutron-ha-monitor daemon just installed.
+        restart_neutron_ha_monitor_daemon()
 
     # Install systemd overrides to remove service startup race between
     # n-gateway and n-cloud-controller services.
     install_systemd_override()
+    update_nic_tuning()
 
 
 @hooks.hook('amqp-nova-relation-joined')
@@ -175,7 +194,7 @@ def amqp_joined(relation_id=None):
 
 @hooks.hook('amqp-nova-relation-departed')
 @hooks.hook('amqp-nova-relation-changed')
-@restart_on_change(restart_map())
+@restart_on_change(restart_map, rendered=True)
 def amqp_nova_changed():
     if 'amqp-nova' not in CONFIGS.complete_contexts():
         log('amqp relation incomplete. Peer not ready?')
@@ -184,7 +203,7 @@ def amqp_nova_changed():
 
 
 @hooks.hook('amqp-relation-departed')
-@restart_on_change(restart_map())
+@restart_on_change(restart_map, rendered=True)
 def amqp_departed():
     if 'amqp' not in CONFIGS.complete_contexts():
         log('amqp relation incomplete. Peer not ready?')
@@ -195,13 +214,13 @@ def amqp_departed():
 @hooks.hook('amqp-relation-changed',
             'cluster-relation-changed',
             'cluster-relation-joined')
-@restart_on_change(restart_map())
+@restart_on_change(restart_map, rendered=True)
 def amqp_changed():
     CONFIGS.write_all()
 
 
 @hooks.hook('neutron-plugin-api-relation-changed')
-@restart_on_change(restart_map())
+@restart_on_change(restart_map, rendered=True)
 def neutron_plugin_api_changed():
     if use_l3ha():
         apt_update()
@@ -210,7 +229,7 @@ def neutron_plugin_api_changed():
 
 
 @hooks.hook('quantum-network-service-relation-changed')
-@restart_on_change(restart_map())
+@restart_on_change(restart_map, rendered=True)
 def nm_changed():
     CONFIGS.write_all()
     if relation_get('ca_cert'):
@@ -235,7 +254,7 @@ def nm_changed():
 
 
 @hooks.hook("cluster-relation-departed")
-@restart_on_change(restart_map())
+@restart_on_change(restart_map, rendered=True)
 def cluster_departed():
     if config('plugin') in ['nvp', 'nsx']:
         log('Unable to re-assign agent resources for'
@@ -246,6 +265,9 @@ def cluster_departed():
         log('Unable to re-assign agent resources for failed nodes with n1kv',
             level=WARNING)
         return
+    if config('ha-legacy-mode'):
+        # A peer went away, have the monitor look for down agents now.
+        wake_neutron_ha_monitor_daemon()
 
 
 @hooks.hook('cluster-relation-broken')
@@ -324,6 +346,9 @@ def update_status():
 
 
 if __name__ == '__main__':
+    buffer_log()
+    prefetch_relations()
+    load_os_release()
     try:
         hooks.execute(sys.argv)
     except UnregisteredHookError as e:
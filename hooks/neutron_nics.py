@@ -0,0 +1,115 @@
+'''
+Inventory of the network interfaces of the unit.
+
+Every interface is read from sysfs, and their addresses from a single
+`ip -o addr` dump, once per hook, rather than with several ip and sysfs
+lookups for each interface each time a port is resolved.
+'''
+import glob
+import os
+import subprocess
+
+from charmhelpers.core.hookenv import (
+    cached,
+    flush,
+)
+
+ARPHRD_ETHER = 1
+
+
+def _read_sys_net(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return default
+
+
+def _ip_addresses():
+    '''Map interface names to their addresses from one `ip -o addr` dump.
+
+    Link local and temporary IPv6 addresses are left out.
+    '''
+    addresses = {}
+    ip_output = subprocess.check_output(['ip', '-o', 'addr', 'show'])
+    for line in ip_output.decode('UTF-8').split('\n'):
+        words = line.split()
+        if len(words) < 4 or words[2] not in ('inet', 'inet6'):
+            continue
+        if words[2] == 'inet6' and ('link' in words or 'temporary' in words):
+            continue
+        iface = words[1].partition('@')[0]
+        addresses.setdefault(iface, []).append(words[3].split('/')[0])
+    return addresses
+
+
+def build_nic_inventory(sys_net='/sys/class/net'):
+    '''Read every network interface from sys_net and their addresses from
+    a single `ip -o addr` dump.
+
+    :param sys_net: str the sysfs network class directory.
+    :returns: dict with the interfaces by name under 'by_name' and the
+              names of the interfaces with each MAC address, in ifindex
+              order, under 'by_mac'.  Each interface is a dict of:
+
+              - name, index and mtu (int)
+              - mac: the ethernet address, '' if not an ethernet device
+              - virtual: True if not backed by a physical device
+              - master: the interface it is enslaved to, if any
+              - bond_master: master if it is a bond, else None
+              - bond and bridge: True for bond and linux bridge masters
+              - bridge_member: True if enslaved to a linux bridge
+              - lower: the interfaces it sits on, e.g. a vlan's parent
+              - addresses: its IPv4 and global IPv6 addresses
+    '''
+    addresses = _ip_addresses()
+    by_name = {}
+    for path in glob.glob(os.path.join(sys_net, '*')):
+        name = os.path.basename(path)
+        master = os.path.join(path, 'master')
+        master = (os.path.basename(os.path.realpath(master))
+                  if os.path.exists(master) else None)
+        mac = ''
+        if _read_sys_net(os.path.join(path, 'type')) == str(ARPHRD_ETHER):
+            mac = _read_sys_net(os.path.join(path, 'address'), '')
+        by_name[name] = {
+            'name': name,
+            'index': int(_read_sys_net(os.path.join(path, 'ifindex'), 0)),
+            'mtu': int(_read_sys_net(os.path.join(path, 'mtu'), 0)),
+            'mac': mac,
+            'virtual': '/virtual/' in os.path.realpath(path),
+            'master': master,
+            'bond_master': None,
+            'bond': os.path.isdir(os.path.join(path, 'bonding')),
+            'bridge': os.path.isdir(os.path.join(path, 'bridge')),
+            'bridge_member': False,
+            'lower': sorted(os.path.basename(lower)[len('lower_'):]
+                            for lower in glob.glob(os.path.join(path,
+                                                                'lower_*'))),
+            'addresses': addresses.get(name, []),
+        }
+    for nic in by_name.values():
+        master = by_name.get(nic['master'])
+        if master and master['bond']:
+            nic['bond_master'] = master['name']
+        if master and master['bridge']:
+            nic['bridge_member'] = True
+    by_mac = {}
+    for nic in sorted(by_name.values(), key=lambda nic: nic['index']):
+        if nic['mac']:
+            by_mac.setdefault(nic['mac'], []).append(nic['name'])
+    return {'by_name': by_name, 'by_mac': by_mac}
+
+
+@cached
+def nic_inventory():
+    '''The network interfaces of the unit as read by build_nic_inventory(),
+    read once for the rest of the hook unless flush_nic_inventory() is
+    called.'''
+    return build_nic_inventory()
+
+
+def flush_nic_inventory():
+    '''Read the network interfaces again on the next nic_inventory(), to be
+    called after adding or moving interfaces.'''
+    flush('nic_inventory')
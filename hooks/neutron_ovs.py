@@ -0,0 +1,141 @@
+'''
+Reconciliation of the openvswitch bridges of the gateway.
+
+The bridges, their ports and IPFIX targets are read with one ovs-vsctl call,
+and whatever is missing or differs added in a single ovs-vsctl transaction,
+rather than one ovs-vsctl call per bridge and port on every hook.
+'''
+import json
+import subprocess
+
+from charmhelpers.core.hookenv import log
+from neutron_nics import flush_nic_inventory
+
+IFF_UP = 0x1
+IFF_PROMISC = 0x100
+
+
+def _ovsdb_value(value):
+    '''Convert a cell of ovs-vsctl --format=json output to python.
+
+    uuids become their string, sets lists and maps dicts.  OVSDB may
+    represent a set of one element as the element itself.'''
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind == 'uuid':
+            return data
+        if kind == 'set':
+            return [_ovsdb_value(v) for v in data]
+        if kind == 'map':
+            return dict((_ovsdb_value(k), _ovsdb_value(v)) for k, v in data)
+    return value
+
+
+def _ovsdb_set(value):
+    '''A set column converted by _ovsdb_value() as a list.'''
+    return value if isinstance(value, list) else [value]
+
+
+def _ovsdb_tables(output):
+    '''Yield the rows of each table printed by ovs-vsctl --format=json for
+    a series of list commands, as dicts of column to value.'''
+    decoder = json.JSONDecoder()
+    output = output.strip()
+    while output:
+        table, end = decoder.raw_decode(output)
+        output = output[end:].strip()
+        yield [dict(zip(table['headings'], map(_ovsdb_value, row)))
+               for row in table['data']]
+
+
+def bridges_state():
+    '''Read the bridges, their ports and IPFIX targets with one ovs-vsctl
+    call.
+
+    :returns: dict of bridge name to a dict with the set of its port names
+              under 'ports' and the set of its IPFIX targets under 'ipfix'.
+    '''
+    output = subprocess.check_output(
+        ['ovs-vsctl', '--format=json',
+         '--', '--columns=name,ports,ipfix', 'list', 'Bridge',
+         '--', '--columns=_uuid,name', 'list', 'Port',
+         '--', '--columns=_uuid,targets', 'list', 'IPFIX']).decode('UTF-8')
+    bridges, ports, ipfix = _ovsdb_tables(output)
+    port_names = dict((p['_uuid'], p['name']) for p in ports)
+    targets = dict((i['_uuid'], set(_ovsdb_set(i['targets'])))
+                   for i in ipfix)
+    state = {}
+    for bridge in bridges:
+        ipfix_uuids = _ovsdb_set(bridge['ipfix'])
+        state[bridge['name']] = {
+            'ports': set(port_names[uuid]
+                         for uuid in _ovsdb_set(bridge['ports'])),
+            'ipfix': targets.get(ipfix_uuids[0], set()) if ipfix_uuids
+            else set(),
+        }
+    return state
+
+
+def _link_flags(port):
+    try:
+        with open('/sys/class/net/{}/flags'.format(port)) as flags:
+            return int(flags.read().strip(), 16)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def reconcile_bridges(bridges, ipfix_target=None):
+    '''Bring openvswitch to the desired bridges, ports and IPFIX target.
+
+    The current state is read with one ovs-vsctl call and the bridges and
+    ports missing, and the IPFIX settings which differ, added in a single
+    ovs-vsctl transaction, which is skipped if nothing differs.  IPFIX is
+    left alone on bridges already exporting to ipfix_target.  Bridges and
+    ports not in bridges are not removed.  Ports are then brought up and
+    their promiscuous mode set, with ip, if not already.
+
+    :param bridges: dict of bridge name to a dict of the names of the ports
+                    it should have to whether each should be promiscuous.
+    :param ipfix_target: IPFIX remote endpoint for every bridge in bridges,
+                         or None to disable IPFIX on them.
+    :returns: list of the ovs-vsctl commands run in the transaction.
+    '''
+    state = bridges_state()
+    commands = []
+    for bridge in bridges:
+        if bridge not in state:
+            log('Creating bridge {}'.format(bridge))
+            commands.append(['--may-exist', 'add-br', bridge])
+    for bridge, ports in bridges.items():
+        current = state.get(bridge, {'ports': set(), 'ipfix': set()})
+        for port in ports:
+            if port not in current['ports']:
+                log('Adding port {} to bridge {}'.format(port, bridge))
+                commands.append(['--may-exist', 'add-port', bridge, port])
+        if ipfix_target:
+            if current['ipfix'] != set([ipfix_target]):
+                log('Enabling IPfix on {}.'.format(bridge))
+                ipfix_id = '@ipfix{}'.format(len(commands))
+                commands.append(['set', 'Bridge', bridge,
+                                 'ipfix={}'.format(ipfix_id)])
+                commands.append(['--id={}'.format(ipfix_id), 'create',
+                                 'IPFIX', 'targets="{}"'.format(ipfix_target)])
+        elif current['ipfix']:
+            log('Disabling IPfix on {}.'.format(bridge))
+            commands.append(['clear', 'Bridge', bridge, 'ipfix'])
+    if commands:
+        cmd = ['ovs-vsctl']
+        for command in commands:
+            cmd += ['--'] + command
+        subprocess.check_call(cmd)
+        flush_nic_inventory()
+
+    for ports in bridges.values():
+        for port, promisc in ports.items():
+            flags = _link_flags(port)
+            if (flags is not None and flags & IFF_UP and
+                    bool(flags & IFF_PROMISC) == promisc):
+                continue
+            subprocess.check_call(['ip', 'link', 'set', port, 'up', 'promisc',
+                                   'on' if promisc else 'off'])
+    return commands
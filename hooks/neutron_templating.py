@@ -0,0 +1,208 @@
+'''
+Config rendering and restart_on_change for the charm's hooks.
+
+NeutronConfigRenderer only replaces a config file when its rendered content
+changed, and reports the change with path_changed().  The charm's
+pausable_restart_on_change(rendered=True) restarts services on those reports
+rather than hashing every file in the restart map before and after a hook.
+'''
+import functools
+import itertools
+import os
+import stat
+import tempfile
+from collections import OrderedDict
+
+import six
+
+from charmhelpers.core.hookenv import (
+    log, ERROR, INFO,
+)
+from charmhelpers.core.host import (
+    path_hash,
+    service,
+)
+from charmhelpers.contrib.openstack.utils import is_unit_paused_set
+import charmhelpers.contrib.openstack.templating as templating
+from neutron_contexts import context_cache
+
+
+def write_if_changed(path, content):
+    '''
+    Replace the file at path with content, unless it already holds it.
+
+    The new content is written to a temporary file in the same directory and
+    renamed over path, so readers never see a partially written file.  The
+    mode and ownership of the replaced file are kept, and symlinks followed.
+
+    :param path: str the file to write
+    :param content: bytes the new content
+    :returns: True if the file was written, False if unchanged.
+    '''
+    path = os.path.realpath(path)
+    try:
+        with open(path, 'rb') as current:
+            if current.read() == content:
+                return False
+        st = os.stat(path)
+        mode, owner = stat.S_IMODE(st.st_mode), (st.st_uid, st.st_gid)
+    except (IOError, OSError):
+        umask = os.umask(0)
+        os.umask(umask)
+        mode, owner = 0o666 & ~umask, None
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+                               prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(content)
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(tmp, mode)
+        st = os.stat(tmp)
+        if owner is not None and owner != (st.st_uid, st.st_gid):
+            os.chown(tmp, *owner)
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+# Sets the paths reported by path_changed() are added to, one for each
+# restart_on_change_helper() in progress.
+_changed_paths = []
+
+
+def path_changed(path):
+    '''Report that path was changed, for restart_on_change_helper() calls
+    which take reports for it rather than hashing it.'''
+    for changed in _changed_paths:
+        changed.add(path)
+
+
+class NeutronConfigRenderer(templating.OSConfigRenderer):
+    '''
+    OSConfigRenderer which leaves config files whose content is unchanged
+    alone, and reports the ones it replaces with path_changed().
+
+    Contexts are evaluated in a context_cache() scope, once for all the
+    templates they are registered with.
+    '''
+
+    def render(self, config_file):
+        with context_cache():
+            return super(NeutronConfigRenderer, self).render(config_file)
+
+    def complete_contexts(self):
+        with context_cache():
+            return super(NeutronConfigRenderer, self).complete_contexts()
+
+    def write(self, config_file):
+        '''
+        Write a single config file, raises if config file is not registered.
+
+        :returns: True if the file changed.
+        '''
+        if config_file not in self.templates:
+            log('Config not registered: %s' % config_file, level=ERROR)
+            raise templating.OSConfigException
+
+        _out = self.render(config_file)
+        if six.PY3:
+            _out = _out.encode('UTF-8')
+
+        if not write_if_changed(config_file, _out):
+            return False
+        path_changed(config_file)
+        log('Wrote template %s.' % config_file, level=INFO)
+        return True
+
+    def write_all(self):
+        '''
+        Write out all registered config files.
+
+        :returns: set of the config files which changed.
+        '''
+        return set(k for k in six.iterkeys(self.templates) if self.write(k))
+
+
+def restart_on_change_helper(lambda_f, restart_map, stopstart=False,
+                             restart_functions=None, reported_paths=None):
+    '''
+    charmhelpers.core.host.restart_on_change_helper(), except that the
+    paths in reported_paths are not hashed.  They count as changed if
+    lambda_f() reported them with path_changed().
+
+    :param lambda_f: function to call.
+    :param restart_map: {file: [service, ...]}
+    :param stopstart: whether to stop, start or restart a service
+    :param restart_functions: nonstandard functions to use to restart
+                              services {svc: func, ...}
+    :param reported_paths: paths in restart_map only written by
+                           NeutronConfigRenderer
+    :returns: result of lambda_f()
+    '''
+    if restart_functions is None:
+        restart_functions = {}
+    reported_paths = set(reported_paths or ()).intersection(restart_map)
+    checksums = {path: path_hash(path) for path in restart_map
+                 if path not in reported_paths}
+    changed = set()
+    _changed_paths.append(changed)
+    try:
+        r = lambda_f()
+    finally:
+        _changed_paths.remove(changed)
+    # create a list of lists of the services to restart
+    restarts = [restart_map[path]
+                for path in restart_map
+                if (path in changed if path in reported_paths
+                    else path_hash(path) != checksums[path])]
+    # create a flat list of ordered services without duplicates from lists
+    services_list = list(OrderedDict.fromkeys(itertools.chain(*restarts)))
+    if services_list:
+        actions = ('stop', 'start') if stopstart else ('restart',)
+        for service_name in services_list:
+            if service_name in restart_functions:
+                restart_functions[service_name](service_name)
+            else:
+                for action in actions:
+                    service(action, service_name)
+    return r
+
+
+def pausable_restart_on_change(restart_map, stopstart=False,
+                               restart_functions=None, rendered=False):
+    '''
+    charmhelpers.contrib.openstack.utils.pausable_restart_on_change(), which
+    also takes a callable restart map and can restart on the changes
+    NeutronConfigRenderer reports.
+
+    :param restart_map: the restart map {conf_file: [services]} or a
+                        callable returning it, called once on first use
+    :param stopstart: DEFAULT false; whether to stop, start or just restart
+    :param restart_functions: nonstandard functions to use to restart
+                              services {svc: func, ...}
+    :param rendered: DEFAULT false; the files in the restart map are only
+                     written by NeutronConfigRenderer, restart on the changes
+                     it reports instead of hashing them
+    :returns: decorator to use a restart_on_change with pausability
+    '''
+    def wrap(f):
+        # py27 compatible nonlocal variable.
+        __restart_map_cache = {'cache': None}
+
+        @functools.wraps(f)
+        def wrapped_f(*args, **kwargs):
+            if is_unit_paused_set():
+                return f(*args, **kwargs)
+            if __restart_map_cache['cache'] is None:
+                __restart_map_cache['cache'] = restart_map() \
+                    if callable(restart_map) else restart_map
+            return restart_on_change_helper(
+                (lambda: f(*args, **kwargs)), __restart_map_cache['cache'],
+                stopstart, restart_functions,
+                __restart_map_cache['cache'] if rendered else None)
+        return wrapped_f
+    return wrap
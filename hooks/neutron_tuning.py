@@ -0,0 +1,240 @@
+'''
+Kernel tuning of a gateway for the routers it is expected to host.
+
+Works out the conntrack, neighbour table, backlog and socket buffer sysctls
+from the RAM and CPU count of the unit and the gateway-expected-routers
+option, when gateway-tuning-profile is 'auto'.  Values set in the sysctl
+option take precedence over the calculated ones.
+
+Also spreads the interrupts and packet steering of the data and external
+port NICs across the CPUs, when nic-tuning is set.  The NICs and CPUs are
+rendered to a script which runs at boot, as the settings do not persist
+across reboots.
+'''
+import multiprocessing
+import os
+from collections import OrderedDict
+
+import yaml
+
+from charmhelpers.core.hookenv import (
+    log, ERROR, WARNING,
+    config,
+)
+from charmhelpers.core.host import get_total_ram
+
+SYSCTL_FILE = '/etc/sysctl.d/50-quantum-gateway.conf'
+
+SYSFS = '/sys'
+
+AUTO = 'auto'
+
+MB = 1024 ** 2
+
+# Kernel defaults, the calculated values never go below them.
+CONNTRACK_MIN = 262144
+GC_THRESH3_MIN = 1024
+BACKLOG_MIN = 1000
+SOCKET_BUFFER_MIN = 4 * MB
+SOCKET_BUFFER_MAX = 16 * MB
+
+# Flows tracked for each router, and bytes of RAM each conntrack entry may
+# take up to, about 16 times its real size.
+CONNTRACK_PER_ROUTER = 16384
+CONNTRACK_RAM = 4096
+# Neighbours on the external and tenant networks of each router.
+NEIGHBOURS_PER_ROUTER = 128
+BACKLOG_PER_CPU = 2000
+BACKLOG_MAX = 65536
+
+
+def calculate(ram, cpus, routers):
+    '''Work out the sysctls of a gateway.
+
+    :param ram: int bytes of RAM
+    :param cpus: int number of CPUs
+    :param routers: int number of routers the gateway is expected to host
+    :returns: OrderedDict of sysctl key to value, sorted by key
+    '''
+    conntrack = min(routers * CONNTRACK_PER_ROUTER, ram // CONNTRACK_RAM)
+    gc_thresh3 = max(GC_THRESH3_MIN, routers * NEIGHBOURS_PER_ROUTER)
+    backlog = min(BACKLOG_MAX, max(BACKLOG_MIN, cpus * BACKLOG_PER_CPU))
+    buffer_max = min(SOCKET_BUFFER_MAX, max(SOCKET_BUFFER_MIN, ram // 1024))
+    sysctls = {
+        'net.netfilter.nf_conntrack_max': max(CONNTRACK_MIN, conntrack),
+        'net.core.netdev_max_backlog': backlog,
+        'net.core.rmem_max': buffer_max,
+        'net.core.wmem_max': buffer_max,
+        'net.ipv4.tcp_rmem': '4096 87380 {}'.format(buffer_max),
+        'net.ipv4.tcp_wmem': '4096 65536 {}'.format(buffer_max),
+    }
+    for family in ('ipv4', 'ipv6'):
+        key = 'net.{}.neigh.default.gc_thresh{{}}'.format(family)
+        sysctls[key.format(1)] = gc_thresh3 // 8
+        sysctls[key.format(2)] = gc_thresh3 // 2
+        sysctls[key.format(3)] = gc_thresh3
+    return OrderedDict(sorted(sysctls.items()))
+
+
+def tuning_inputs():
+    '''The unit's RAM and CPUs and the routers it is expected to host.'''
+    return OrderedDict([
+        ('ram', get_total_ram()),
+        ('cpus', multiprocessing.cpu_count()),
+        ('routers', config('gateway-expected-routers')),
+    ])
+
+
+def tuned_sysctls():
+    '''The sysctls of the tuning profile, empty unless it is enabled.'''
+    profile = config('gateway-tuning-profile')
+    if not profile:
+        return OrderedDict()
+    if profile != AUTO:
+        log('Unknown gateway-tuning-profile {}.'.format(profile),
+            level=WARNING)
+        return OrderedDict()
+    return calculate(**tuning_inputs())
+
+
+def operator_sysctls():
+    '''The sysctls of the sysctl option.'''
+    sysctl = config('sysctl')
+    if not sysctl:
+        return {}
+    try:
+        parsed = yaml.safe_load(sysctl)
+    except yaml.YAMLError:
+        log('Error parsing YAML sysctl: {}'.format(sysctl), level=ERROR)
+        return {}
+    if not isinstance(parsed, dict):
+        log('sysctl is not a YAML associative array: {}'.format(sysctl),
+            level=ERROR)
+        return {}
+    return parsed
+
+
+def gateway_sysctls():
+    '''The sysctls to apply, those of the sysctl option over those of the
+    tuning profile.
+
+    A plain dict, as sysctl.create() parses anything else as YAML.'''
+    sysctls = dict(tuned_sysctls())
+    sysctls.update(operator_sysctls())
+    return sysctls
+
+
+def parse_cpu_list(cpus):
+    '''The CPUs of a kernel cpu list such as "0-3,8,10-11".
+
+    :raises: ValueError if cpus is not a cpu list
+    :returns: sorted list of int CPUs
+    '''
+    parsed = set()
+    for part in cpus.replace(' ', '').split(','):
+        if not part:
+            continue
+        bounds = [int(bound) for bound in part.split('-')]
+        first, last = bounds[0], bounds[-1]
+        if len(bounds) > 2 or first < 0 or last < first:
+            raise ValueError('Invalid cpu list {}'.format(cpus))
+        parsed.update(range(first, last + 1))
+    return sorted(parsed)
+
+
+def cpu_mask(cpus):
+    '''The kernel cpumask of cpus, hex in comma separated 32 bit words.'''
+    mask = 0
+    for cpu in cpus:
+        mask |= 1 << cpu
+    words = []
+    while True:
+        words.append(mask & 0xffffffff)
+        mask >>= 32
+        if not mask:
+            break
+    words.reverse()
+    return ','.join(['{:x}'.format(words[0])] +
+                    ['{:08x}'.format(word) for word in words[1:]])
+
+
+def online_cpus(sys_root=SYSFS):
+    '''The online CPUs of the unit.'''
+    with open(os.path.join(sys_root, 'devices', 'system', 'cpu',
+                           'online')) as f:
+        return parse_cpu_list(f.read().strip())
+
+
+def physical_nics(ports, by_name):
+    '''The physical NICs under ports, through VLANs and bonds.
+
+    :param ports: list of interface names
+    :param by_name: the 'by_name' dict of the NIC inventory
+    :returns: list of NIC names in the order found
+    '''
+    nics = []
+    for port in ports:
+        nic = by_name.get(port)
+        if nic is None:
+            continue
+        if nic['lower']:
+            lower = nic['lower']
+        elif nic['bond']:
+            lower = sorted((name for name, slave in by_name.items()
+                            if slave['bond_master'] == port),
+                           key=lambda name: by_name[name]['index'])
+        else:
+            if not nic['virtual'] and port not in nics:
+                nics.append(port)
+            continue
+        for name in physical_nics(lower, by_name):
+            if name not in nics:
+                nics.append(name)
+    return nics
+
+
+def nic_tuning_cpus(sys_root=SYSFS):
+    '''The online CPUs less those of nic-tuning-reserved-cpus, None if
+    the reserved CPUs are not a cpu list.'''
+    reserved = config('nic-tuning-reserved-cpus') or ''
+    try:
+        reserved = parse_cpu_list(reserved)
+    except ValueError:
+        log('Invalid nic-tuning-reserved-cpus {}.'.format(reserved),
+            level=ERROR)
+        return None
+    return [cpu for cpu in online_cpus(sys_root) if cpu not in reserved]
+
+
+def nic_tuning(ports, by_name, sys_root=SYSFS):
+    '''The NICs under ports and the unreserved CPUs, for the tuning script.
+
+    The script looks the interrupts and queues of the NICs up each time it
+    runs, as MSI interrupt numbers change across reboots.  It spreads the
+    interrupts and the CPUs the transmit queues steer to (XPS) round robin
+    over the CPUs, carrying on from where the last NIC left off so the NICs
+    do not all start on the same CPU.  Receive queues steer to all of the
+    CPUs (RPS), spreading the work of single queue and tunnelled traffic.
+
+    :param ports: list of interface names
+    :param by_name: the 'by_name' dict of the NIC inventory
+    :returns: dict of space separated 'nic_tuning_nics', 'nic_tuning_cpus'
+              as cpu:mask pairs and the 'nic_tuning_rps_cpus' mask, empty
+              when there is nothing to tune
+    '''
+    cpus = nic_tuning_cpus(sys_root)
+    if cpus is None:
+        return {}
+    if not cpus:
+        log('nic-tuning-reserved-cpus reserves all of the CPUs, not tuning '
+            'the NICs.', level=WARNING)
+        return {}
+    nics = physical_nics(ports, by_name)
+    if not nics:
+        return {}
+    return {
+        'nic_tuning_nics': ' '.join(nics),
+        'nic_tuning_cpus': ' '.join('{}:{}'.format(cpu, cpu_mask([cpu]))
+                                    for cpu in cpus),
+        'nic_tuning_rps_cpus': cpu_mask(cpus),
+    }
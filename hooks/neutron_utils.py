@@ -1,6 +1,8 @@
 import os
 import json
+import filecmp
 import shutil
+import signal
 import subprocess
 from shutil import copy2
 from charmhelpers.core.host import (
@@ -9,6 +11,8 @@ from charmhelpers.core.host import (
     service_running,
     service_stop,
     service_restart,
+    service_pause,
+    service_resume,
     init_is_systemd,
     CompareHostReleases,
 )
@@ -17,34 +21,35 @@ from charmhelpers.core.hookenv import (
     DEBUG,
     INFO,
     ERROR,
+    atexit,
+    cached,
     config,
+    flush,
     is_relation_made,
     relation_ids,
 )
+from charmhelpers.core.unitdata import kv
 from charmhelpers.fetch import (
     apt_upgrade,
     apt_update,
     apt_install,
 )
 from charmhelpers.contrib.network.ovs import (
-    add_bridge,
-    add_bridge_port,
     is_linuxbridge_interface,
     add_ovsbridge_linuxbridge,
     full_restart,
-    enable_ipfix,
-    disable_ipfix,
 )
 from charmhelpers.contrib.hahelpers.cluster import (
     get_hacluster_config,
+    is_clustered,
 )
 from charmhelpers.contrib.openstack.utils import (
     configure_installation_source,
     get_os_codename_install_source,
+    is_unit_paused_set,
     make_assess_status_func,
     os_release,
     pause_unit,
-    reset_os_release,
     resume_unit,
     os_application_version_set,
     CompareOpenStackReleases,
@@ -55,26 +60,35 @@ from charmhelpers.contrib.openstack.neutron import (
 )
 
 import charmhelpers.contrib.openstack.context as context
+import charmhelpers.contrib.openstack.utils as os_utils
 from charmhelpers.contrib.openstack.context import (
     SyslogContext,
+)
+from charmhelpers.contrib.openstack.neutron import headers_package
+from neutron_nics import flush_nic_inventory
+from neutron_ovs import reconcile_bridges
+from neutron_templating import NeutronConfigRenderer
+from neutron_contexts import (
+    CORE_PLUGIN, OVS, NSX, N1KV, OVS_ODL,
+    AMQPContext,
     NeutronAPIContext,
     NetworkServiceContext,
     ExternalPortContext,
     PhyNICMTUContext,
     DataPortContext,
-)
-import charmhelpers.contrib.openstack.templating as templating
-from charmhelpers.contrib.openstack.neutron import headers_package
-from neutron_contexts import (
-    CORE_PLUGIN, OVS, NSX, N1KV, OVS_ODL,
     NeutronGatewayContext,
     L3AgentContext,
     NovaMetadataContext,
+    RootwrapDaemonContext,
+    AgentConcurrencyContext,
+    NICTuningContext,
+    flush_context_cache,
 )
 from charmhelpers.contrib.openstack.neutron import (
     parse_bridge_mappings,
 )
 
+from collections import OrderedDict
 from copy import deepcopy
 
 
@@ -189,6 +203,36 @@ LEGACY_FILES_MAP = {
         'path': '/usr/local/bin/',
         'permissions': 0o755
     },
+    'neutron_ha_agents.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_client.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_crm.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_failover.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_metrics.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_netns.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_ovsdb.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_placement.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_scheduler.py': {
+        'path': '/usr/local/bin/',
+    },
+    'neutron_ha_services.py': {
+        'path': '/usr/local/bin/',
+    },
     'neutron-ha-monitor.conf': {
         'path': '/var/lib/juju-neutron-ha/',
     },
@@ -268,7 +312,8 @@ def use_l3ha():
 
 EXT_PORT_CONF = '/etc/init/ext-port.conf'
 PHY_NIC_MTU_CONF = '/etc/init/os-charm-phy-nic-mtu.conf'
-STOPPED_SERVICES = ['os-charm-phy-nic-mtu', 'ext-port']
+NIC_TUNING_SCRIPT = '/usr/local/bin/os-charm-nic-tuning'
+STOPPED_SERVICES = ['os-charm-phy-nic-mtu', 'ext-port', 'os-charm-nic-tuning']
 
 TEMPLATES = 'templates'
 
@@ -295,7 +340,7 @@ NOVA_CONFIG_FILES = {
         'hook_contexts': [NetworkServiceContext(),
                           NeutronGatewayContext(),
                           SyslogContext(),
-                          context.WorkerConfigContext(),
+                          AgentConcurrencyContext(),
                           context.ZeroMQContext(),
                           context.NotificationDriverContext(),
                           NovaMetadataContext()],
@@ -311,7 +356,9 @@ NOVA_CONFIG_FILES = {
 
 NEUTRON_SHARED_CONFIG_FILES = {
     NEUTRON_DHCP_AGENT_CONF: {
-        'hook_contexts': [NeutronGatewayContext()],
+        'hook_contexts': [NeutronGatewayContext(),
+                          RootwrapDaemonContext(),
+                          AgentConcurrencyContext()],
         'services': ['neutron-dhcp-agent']
     },
     NEUTRON_DNSMASQ_CONF: {
@@ -320,8 +367,9 @@ NEUTRON_SHARED_CONFIG_FILES = {
     },
     NEUTRON_METADATA_AGENT_CONF: {
         'hook_contexts': [NetworkServiceContext(),
-                          context.WorkerConfigContext(),
-                          NeutronGatewayContext()],
+                          AgentConcurrencyContext(),
+                          NeutronGatewayContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-metadata-agent']
     },
     NEUTRON_DHCP_AA_PROFILE_PATH: {
@@ -359,12 +407,13 @@ NEUTRON_SHARED_CONFIG_FILES.update(NOVA_CONFIG_FILES)
 
 NEUTRON_OVS_CONFIG_FILES = {
     NEUTRON_CONF: {
-        'hook_contexts': [context.AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
+        'hook_contexts': [AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
                           NeutronGatewayContext(),
                           SyslogContext(),
                           context.ZeroMQContext(),
-                          context.WorkerConfigContext(),
-                          context.NotificationDriverContext()],
+                          AgentConcurrencyContext(),
+                          context.NotificationDriverContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-l3-agent',
                      'neutron-dhcp-agent',
                      'neutron-metadata-agent',
@@ -377,7 +426,8 @@ NEUTRON_OVS_CONFIG_FILES = {
     NEUTRON_L3_AGENT_CONF: {
         'hook_contexts': [NetworkServiceContext(),
                           L3AgentContext(),
-                          NeutronGatewayContext()],
+                          NeutronGatewayContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-l3-agent', 'neutron-vpn-agent']
     },
     NEUTRON_METERING_AGENT_CONF: {
@@ -424,18 +474,23 @@ NEUTRON_OVS_CONFIG_FILES = {
     PHY_NIC_MTU_CONF: {
         'hook_contexts': [PhyNICMTUContext()],
         'services': ['os-charm-phy-nic-mtu']
+    },
+    NIC_TUNING_SCRIPT: {
+        'hook_contexts': [NICTuningContext()],
+        'services': ['os-charm-nic-tuning']
     }
 }
 NEUTRON_OVS_CONFIG_FILES.update(NEUTRON_SHARED_CONFIG_FILES)
 
 NEUTRON_OVS_ODL_CONFIG_FILES = {
     NEUTRON_CONF: {
-        'hook_contexts': [context.AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
+        'hook_contexts': [AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
                           NeutronGatewayContext(),
                           SyslogContext(),
                           context.ZeroMQContext(),
-                          context.WorkerConfigContext(),
-                          context.NotificationDriverContext()],
+                          AgentConcurrencyContext(),
+                          context.NotificationDriverContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-l3-agent',
                      'neutron-dhcp-agent',
                      'neutron-metadata-agent',
@@ -447,7 +502,8 @@ NEUTRON_OVS_ODL_CONFIG_FILES = {
     NEUTRON_L3_AGENT_CONF: {
         'hook_contexts': [NetworkServiceContext(),
                           L3AgentContext(),
-                          NeutronGatewayContext()],
+                          NeutronGatewayContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-l3-agent', 'neutron-vpn-agent']
     },
     NEUTRON_METERING_AGENT_CONF: {
@@ -474,16 +530,21 @@ NEUTRON_OVS_ODL_CONFIG_FILES = {
     PHY_NIC_MTU_CONF: {
         'hook_contexts': [PhyNICMTUContext()],
         'services': ['os-charm-phy-nic-mtu']
+    },
+    NIC_TUNING_SCRIPT: {
+        'hook_contexts': [NICTuningContext()],
+        'services': ['os-charm-nic-tuning']
     }
 }
 NEUTRON_OVS_ODL_CONFIG_FILES.update(NEUTRON_SHARED_CONFIG_FILES)
 
 NEUTRON_NSX_CONFIG_FILES = {
     NEUTRON_CONF: {
-        'hook_contexts': [context.AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
+        'hook_contexts': [AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
                           NeutronGatewayContext(),
-                          context.WorkerConfigContext(),
-                          SyslogContext()],
+                          AgentConcurrencyContext(),
+                          SyslogContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-dhcp-agent', 'neutron-metadata-agent']
     },
 }
@@ -491,10 +552,11 @@ NEUTRON_NSX_CONFIG_FILES.update(NEUTRON_SHARED_CONFIG_FILES)
 
 NEUTRON_N1KV_CONFIG_FILES = {
     NEUTRON_CONF: {
-        'hook_contexts': [context.AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
+        'hook_contexts': [AMQPContext(ssl_dir=NEUTRON_CONF_DIR),
                           NeutronGatewayContext(),
-                          context.WorkerConfigContext(),
-                          SyslogContext()],
+                          AgentConcurrencyContext(),
+                          SyslogContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-l3-agent',
                      'neutron-dhcp-agent',
                      'neutron-metadata-agent']
@@ -502,7 +564,8 @@ NEUTRON_N1KV_CONFIG_FILES = {
     NEUTRON_L3_AGENT_CONF: {
         'hook_contexts': [NetworkServiceContext(),
                           L3AgentContext(),
-                          NeutronGatewayContext()],
+                          NeutronGatewayContext(),
+                          RootwrapDaemonContext()],
         'services': ['neutron-l3-agent']
     },
 }
@@ -544,6 +607,85 @@ def install_systemd_override():
         subprocess.check_call(['systemctl', 'daemon-reload'])
 
 
+NIC_TUNING_UNIT = '/etc/systemd/system/os-charm-nic-tuning.service'
+NIC_TUNING_JOB = '/etc/init/os-charm-nic-tuning.conf'
+IRQBALANCE = 'irqbalance'
+# Set in the unit's kv store while irqbalance is paused for nic-tuning.
+IRQBALANCE_PAUSED_KEY = 'nic-tuning-paused-irqbalance'
+
+
+def nic_tuning_job():
+    '''The boot job running the NIC tuning script on this init system'''
+    if init_is_systemd():
+        return NIC_TUNING_UNIT
+    return NIC_TUNING_JOB
+
+
+def install_nic_tuning():
+    '''
+    Install the boot job running the NIC tuning script, the writes of which
+    do not persist across reboots, and enable it under systemd.
+    '''
+    dst = nic_tuning_job()
+    src = os.path.join('files', os.path.basename(dst))
+    if not (os.path.exists(dst) and filecmp.cmp(src, dst, shallow=False)):
+        shutil.copy(src, dst)
+        if init_is_systemd():
+            subprocess.check_call(['systemctl', 'daemon-reload'])
+            subprocess.check_call(['systemctl', 'enable',
+                                   os.path.basename(dst)])
+    pause_irqbalance()
+
+
+def remove_nic_tuning():
+    '''
+    Disable and remove the boot job of the NIC tuning script.  The current
+    settings stay in place until the next reboot.
+    '''
+    dst = nic_tuning_job()
+    if os.path.exists(dst):
+        if init_is_systemd():
+            subprocess.check_call(['systemctl', 'disable',
+                                   os.path.basename(dst)])
+        remove_file(dst)
+        if init_is_systemd():
+            subprocess.check_call(['systemctl', 'daemon-reload'])
+    resume_irqbalance()
+
+
+def update_nic_tuning():
+    if config('nic-tuning'):
+        install_nic_tuning()
+    else:
+        remove_nic_tuning()
+
+
+def pause_irqbalance():
+    '''
+    Stop irqbalance, and keep it from starting at boot, as it would move the
+    interrupts the NIC tuning script spreads within seconds.
+    '''
+    db = kv()
+    if db.get(IRQBALANCE_PAUSED_KEY) or not service_running(IRQBALANCE):
+        return
+    log('Pausing irqbalance while nic-tuning is set, it would move the '
+        'NIC interrupts again.', level=INFO)
+    service_pause(IRQBALANCE)
+    db.set(IRQBALANCE_PAUSED_KEY, True)
+    db.flush()
+
+
+def resume_irqbalance():
+    '''Resume irqbalance if paused by pause_irqbalance()'''
+    db = kv()
+    if not db.get(IRQBALANCE_PAUSED_KEY):
+        return
+    log('Resuming irqbalance as nic-tuning is unset.', level=INFO)
+    service_resume(IRQBALANCE)
+    db.unset(IRQBALANCE_PAUSED_KEY)
+    db.flush()
+
+
 def remap_service(service_name):
     '''
     Remap service names based on openstack release to deal
@@ -594,12 +736,12 @@ def resolve_config_files(plugin, release):
             config_files[plugin].pop(_config)
 
     if is_relation_made('amqp-nova'):
-        amqp_nova_ctxt = context.AMQPContext(
+        amqp_nova_ctxt = AMQPContext(
             ssl_dir=NOVA_CONF_DIR,
             rel_name='amqp-nova',
             relation_prefix='nova')
     else:
-        amqp_nova_ctxt = context.AMQPContext(
+        amqp_nova_ctxt = AMQPContext(
             ssl_dir=NOVA_CONF_DIR,
             rel_name='amqp')
     config_files[plugin][NOVA_CONF][
@@ -617,14 +759,37 @@ def register_configs(release=None):
     release = release or os_release('neutron-common')
     plugin = config('plugin')
     config_files = resolve_config_files(plugin, release)
-    configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
-                                          openstack_release=release)
+    configs = NeutronConfigRenderer(templates_dir=TEMPLATES,
+                                    openstack_release=release)
     for conf in config_files[plugin]:
         configs.register(conf,
                          config_files[plugin][conf]['hook_contexts'])
     return configs
 
 
+class LazyConfigs(object):
+    '''
+    Stand-in for the renderer returned by register_configs() which only
+    registers the configs the first time it is used.
+
+    :param release: passed on to register_configs()
+    '''
+
+    def __init__(self, release=None):
+        self._release = release
+        self._configs = None
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the proxy itself.  Private
+        # and special attributes, probed by copy, pickle or mock, never
+        # register.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self.__dict__.get('_configs') is None:
+            self._configs = register_configs(self.__dict__.get('_release'))
+        return getattr(self._configs, name)
+
+
 def stop_services():
     release = os_release('neutron-common')
     plugin = config('plugin')
@@ -675,12 +840,82 @@ EXT_BRIDGE = "br-ex"
 
 def services():
     ''' Returns a list of services associate with this charm '''
+    return _release_services(os_release('neutron-common'))
+
+
+@cached
+def _release_services(release):
+    '''The services of services() for release, worked out once per hook and
+    again should the release change, as on upgrade.'''
     _services = []
-    for v in restart_map().values():
+    for v in restart_map(release).values():
         _services = _services + v
     return list(set(_services))
 
 
+# The release detected by os_release() is kept in the unit's kv store across
+# hooks, under OS_RELEASE_KEY, for as long as the dpkg status and
+# openstack-origin stay the same.
+OS_RELEASE_KEY = 'os-release'
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+
+def _os_release_key():
+    '''What the release is determined from: the state of the installed
+    packages and the installation source.'''
+    try:
+        status = os.stat(DPKG_STATUS)
+        dpkg = [status.st_mtime, status.st_size]
+    except OSError:
+        dpkg = None
+    return [NEUTRON_COMMON, dpkg, config('openstack-origin')]
+
+
+def load_os_release():
+    '''
+    Answer os_release() with the release kept by an earlier hook, if the
+    packages and openstack-origin are unchanged since, rather than opening
+    the apt cache again.
+
+    The release is saved when the hook exits, and only if it succeeds, so a
+    failed hook leaves the kept release alone.
+    '''
+    key = _os_release_key()
+    kept = kv().get(OS_RELEASE_KEY)
+    if kept and kept.get('key') == key and not os_utils._os_rel:
+        # os_release() caches the release of the process in this global,
+        # which charmhelpers' own callers go through too.
+        os_utils._os_rel = kept['release']
+    atexit(save_os_release, key)
+
+
+def save_os_release(start_key):
+    '''
+    Keep the release in the unit's kv store for later hooks, and commit it.
+
+    :param start_key: the _os_release_key() as the hook started.  Packages
+                      changed since, and the release detected before the
+                      change is detected again.
+    '''
+    key = _os_release_key()
+    if key != start_key:
+        reset_os_release()
+    db = kv()
+    db.set(OS_RELEASE_KEY, {'key': key,
+                            'release': os_release(NEUTRON_COMMON)})
+    db.flush()
+
+
+def reset_os_release():
+    '''
+    Forget the release detected by os_release(), and what was worked out
+    from it this hook: the cached contexts and services.
+    '''
+    os_utils.reset_os_release()
+    flush_context_cache()
+    flush('_release_services')
+
+
 def do_openstack_upgrade(configs):
     """
     Perform an upgrade.  Takes care of upgrading packages, rewriting
@@ -690,6 +925,8 @@ def do_openstack_upgrade(configs):
     new_src = config('openstack-origin')
     new_os_rel = get_os_codename_install_source(new_src)
     log('Performing OpenStack upgrade to %s.' % (new_os_rel))
+    # Contexts evaluated earlier in the hook were for the old release.
+    flush_context_cache()
 
     configure_installation_source(new_src)
 
@@ -717,39 +954,35 @@ def configure_ovs():
     if config('plugin') in [OVS, OVS_ODL]:
         if not service_running('openvswitch-switch'):
             full_restart()
-        add_bridge(INT_BRIDGE)
-        add_bridge(EXT_BRIDGE)
+        # The ports each bridge should have, and whether promiscuous.
+        bridges = OrderedDict([(INT_BRIDGE, {}), (EXT_BRIDGE, {})])
         ext_port_ctx = ExternalPortContext()()
         if ext_port_ctx and ext_port_ctx['ext_port']:
-            add_bridge_port(EXT_BRIDGE, ext_port_ctx['ext_port'])
+            bridges[EXT_BRIDGE][ext_port_ctx['ext_port']] = False
 
         portmaps = DataPortContext()()
         bridgemaps = parse_bridge_mappings(config('bridge-mappings'))
+        linuxbridges = []
         for br in bridgemaps.values():
-            add_bridge(br)
+            bridges.setdefault(br, {})
             if not portmaps:
                 continue
 
             for port, _br in portmaps.items():
                 if _br == br:
                     if not is_linuxbridge_interface(port):
-                        add_bridge_port(br, port, promisc=True)
+                        bridges[br][port] = True
                     else:
-                        add_ovsbridge_linuxbridge(br, port)
-
-        target = config('ipfix-target')
-        bridges = [INT_BRIDGE, EXT_BRIDGE]
-        bridges.extend(bridgemaps.values())
-
-        if target:
-            for bridge in bridges:
-                disable_ipfix(bridge)
-                enable_ipfix(bridge, target)
-        else:
-            # NOTE: removing ipfix setting from a bridge is idempotent and
-            #       will pass regardless of the existence of the setting
-            for bridge in bridges:
-                disable_ipfix(bridge)
+                        linuxbridges.append((br, port))
+
+        # One ovs-vsctl transaction for everything missing, IPFIX is only
+        # touched on bridges not already exporting to the target.
+        reconcile_bridges(bridges, config('ipfix-target') or None)
+        for br, port in linuxbridges:
+            add_ovsbridge_linuxbridge(br, port)
+        if linuxbridges:
+            # The veth pairs plugging the linux bridges in are new NICs.
+            flush_nic_inventory()
 
         # Ensure this runs so that mtu is applied to data-port interfaces if
         # provided.
@@ -832,6 +1065,7 @@ def cache_env_data():
         with open(envrc_f, 'w') as f:
             for k, v in env.items():
                 f.write(''.join([k, '=', v, '\n']))
+        wake_neutron_ha_monitor_daemon()
 
 
 def stop_neutron_ha_monitor_daemon():
@@ -845,6 +1079,85 @@ def stop_neutron_ha_monitor_daemon():
         log('Faild to kill neutron-ha-monitor daemon, %s' % e, level=ERROR)
 
 
+SIGUSR1_MASK = 1 << (signal.SIGUSR1 - 1)
+
+
+def neutron_ha_monitor_pids():
+    '''The pids of the running neutron-ha-monitor daemons'''
+    try:
+        res = subprocess.check_output(['pgrep', '-f', 'neutron-ha-monitor.py'])
+    except subprocess.CalledProcessError:
+        # pgrep exits 1 when no daemon is running.
+        return []
+    return [int(pid) for pid in res.decode('UTF-8').split()]
+
+
+def handles_sigusr1(pid):
+    '''Whether process pid catches or ignores SIGUSR1, which terminates
+    processes by default'''
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            status = f.read()
+    except IOError:
+        return False
+    for line in status.splitlines():
+        key, _, value = line.partition(':')
+        if (key in ('SigCgt', 'SigIgn') and
+                int(value.strip(), 16) & SIGUSR1_MASK):
+            return True
+    return False
+
+
+def restart_neutron_ha_monitor_daemon():
+    '''Restart the neutron-ha-monitor daemons through pacemaker, which
+    manages them as res_monitor.
+
+    :returns: True if restarted, False if not clustered or it failed
+    '''
+    if not is_clustered():
+        return False
+    resource = LEGACY_RES_MAP[0]
+    try:
+        subprocess.check_output(['crm', 'resource', 'status', resource],
+                                stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        log('{} is not a cluster resource, not restarting it'.format(
+            resource), level=DEBUG)
+        return False
+    try:
+        subprocess.check_call(['crm', 'resource', 'restart', resource])
+    except subprocess.CalledProcessError as e:
+        log('Failed to restart {}, {}'.format(resource, e), level=ERROR)
+        return False
+    return True
+
+
+def wake_neutron_ha_monitor_daemon():
+    '''Make a running neutron-ha-monitor daemon check agents immediately.
+
+    A daemon started before it handled SIGUSR1, as by the code the charm
+    was upgraded from, is restarted through pacemaker instead.  Failing
+    that it is left to pick the change up on its next check.
+    '''
+    pids = neutron_ha_monitor_pids()
+    if not pids:
+        return
+    if all(handles_sigusr1(pid) for pid in pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGUSR1)
+            except OSError as e:
+                log('Failed to wake neutron-ha-monitor daemon, %s' % e,
+                    level=ERROR)
+        return
+    if restart_neutron_ha_monitor_daemon():
+        log('neutron-ha-monitor daemon did not handle SIGUSR1, restarted it',
+            level=INFO)
+        return
+    log('neutron-ha-monitor daemon does not handle SIGUSR1, it will pick '
+        'the change up on its next check', level=INFO)
+
+
 def cleanup_ovs_netns():
     try:
         subprocess.call('neutron-ovs-cleanup')
@@ -888,6 +1201,56 @@ def check_optional_relations(configs):
     return 'unknown', ''
 
 
+def services_running(service_names):
+    """Determine which of the named system services are running.
+
+    Under systemd all of them are asked about with a single systemctl show,
+    rather than one systemctl is-active each.  Other init systems are asked
+    with service_running() for each service.
+
+    :param service_names: list of the names of the services
+    :returns: dict of service name to True if it is running, else False
+    """
+    service_names = list(service_names)
+    if not service_names:
+        return {}
+    if not init_is_systemd():
+        return dict((name, service_running(name)) for name in service_names)
+    cmd = ['systemctl', 'show', '--property=ActiveState'] + service_names
+    try:
+        output = subprocess.check_output(cmd).decode('UTF-8')
+    except subprocess.CalledProcessError:
+        return dict((name, service_running(name)) for name in service_names)
+    # One ActiveState= line per unit, in the order asked for.
+    states = [line.partition('=')[2].strip() for line in output.split('\n')
+              if line.startswith('ActiveState=')]
+    if len(states) != len(service_names):
+        return dict((name, service_running(name)) for name in service_names)
+    # systemctl is-active succeeds for these states.
+    return dict((name, state in ('active', 'reloading'))
+                for name, state in zip(service_names, states))
+
+
+def check_services_running(configs, services):
+    """check_optional_relations(), and then that services are running, with
+    one services_running() call.
+
+    :param configs: an OSConfigRender() instance.
+    :param services: list of the services which should be running.
+    :return 2-tuple: (string, string) = (status, message)
+    """
+    state, message = check_optional_relations(configs)
+    if state not in ('active', 'unknown'):
+        return state, message
+    running = services_running(services)
+    stopped = [service for service in services if not running[service]]
+    if stopped:
+        return ('blocked',
+                'Services not running that should be: {}'
+                ''.format(', '.join(stopped)))
+    return state, message
+
+
 def assess_status(configs):
     """Assess status of current unit
     Decides what the state of the unit should be based on the current
@@ -923,10 +1286,24 @@ def assess_status_func(configs):
     required_interfaces = REQUIRED_INTERFACES.copy()
     required_interfaces.update(get_optional_interfaces())
     active_services = [s for s in services() if s not in STOPPED_SERVICES]
-    return make_assess_status_func(
+    # A paused unit has its services checked as stopped by charmhelpers,
+    # once each.  Otherwise check_services_running() asks about them all
+    # at once.
+    paused_func = make_assess_status_func(
         configs, required_interfaces,
         charm_func=check_optional_relations,
         services=active_services, ports=None)
+    running_func = make_assess_status_func(
+        configs, required_interfaces,
+        charm_func=lambda configs: check_services_running(configs,
+                                                          active_services),
+        services=None, ports=None)
+
+    def _assess_status_func():
+        if is_unit_paused_set():
+            return paused_func()
+        return running_func()
+    return _assess_status_func
 
 
 def pause_unit_helper(configs):
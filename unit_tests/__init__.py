@@ -3,3 +3,4 @@ import sys
 sys.path.append('unit_tests')
 sys.path.append('actions')
 sys.path.append('hooks')
+sys.path.append('files')
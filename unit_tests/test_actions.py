@@ -1,5 +1,6 @@
 import sys
 import mock
+from collections import OrderedDict
 from mock import patch, MagicMock
 
 from test_utils import CharmTestCase
@@ -76,3 +77,27 @@ class MainTestCase(CharmTestCase):
         with mock.patch.dict(actions.ACTIONS, {"foo": dummy_action}):
             actions.main(["foo"])
         self.assertEqual(dummy_calls, ["Action foo failed: uh oh"])
+
+
+class ShowTuningTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(ShowTuningTestCase, self).setUp(
+            actions, ["action_set", "config", "gateway_sysctls",
+                      "tuning_inputs"])
+        self.config.side_effect = self.test_config.get
+
+    def test_show_tuning(self):
+        self.test_config.set('gateway-tuning-profile', 'auto')
+        self.tuning_inputs.return_value = OrderedDict([
+            ('ram', 8589934592), ('cpus', 4), ('routers', 100)])
+        self.gateway_sysctls.return_value = {
+            'net.netfilter.nf_conntrack_max': 1638400,
+            'net.core.rmem_max': 8388608}
+        actions.show_tuning([])
+        self.action_set.assert_called_once_with({
+            'profile': 'auto',
+            'inputs': 'ram=8589934592 cpus=4 routers=100',
+            'sysctl': 'net.core.rmem_max=8388608\n'
+                      'net.netfilter.nf_conntrack_max=1638400',
+        })
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+import charmhelpers.contrib.openstack.context as context
+import neutron_templating
+
+
+class ValueContext(context.OSContextGenerator):
+
+    value = 'one'
+
+    def __call__(self):
+        return {'value': self.value}
+
+
+class TestConfigWrites(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        templates = os.path.join(self.tmp, 'templates')
+        os.mkdir(templates)
+        for name in ('a.conf', 'b.conf'):
+            with open(os.path.join(templates, name), 'w') as f:
+                f.write('{{ value }}\n')
+        self.ctxt = ValueContext()
+        self.configs = neutron_templating.NeutronConfigRenderer(
+            templates_dir=templates, openstack_release='queens')
+        self.paths = [os.path.join(self.tmp, name)
+                      for name in ('a.conf', 'b.conf')]
+        for path in self.paths:
+            self.configs.register(path, [self.ctxt])
+        patcher = patch.object(neutron_templating, 'log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_write_new(self):
+        self.assertTrue(self.configs.write(self.paths[0]))
+        self.assertEqual(self.read(self.paths[0]), 'one')
+
+    def test_write_unchanged(self):
+        self.configs.write(self.paths[0])
+        inode = os.stat(self.paths[0]).st_ino
+        self.assertFalse(self.configs.write(self.paths[0]))
+        self.assertEqual(os.stat(self.paths[0]).st_ino, inode)
+
+    def test_write_changed(self):
+        self.configs.write(self.paths[0])
+        os.chmod(self.paths[0], 0o640)
+        inode = os.stat(self.paths[0]).st_ino
+        self.ctxt.value = 'two'
+        self.assertTrue(self.configs.write(self.paths[0]))
+        self.assertEqual(self.read(self.paths[0]), 'two')
+        st = os.stat(self.paths[0])
+        self.assertNotEqual(st.st_ino, inode)
+        self.assertEqual(st.st_mode & 0o777, 0o640)
+        # No temporary files left behind.
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         ['a.conf', 'templates'])
+
+    def test_write_symlink(self):
+        target = os.path.join(self.tmp, 'target.conf')
+        with open(target, 'w') as f:
+            f.write('old\n')
+        os.symlink(target, self.paths[0])
+        self.assertTrue(self.configs.write(self.paths[0]))
+        self.assertTrue(os.path.islink(self.paths[0]))
+        self.assertEqual(self.read(target), 'one')
+
+    def test_write_all(self):
+        self.assertEqual(self.configs.write_all(), set(self.paths))
+        self.assertEqual(self.configs.write_all(), set())
+        with open(self.paths[1], 'w') as f:
+            f.write('edited\n')
+        self.assertEqual(self.configs.write_all(), set(self.paths[1:]))
+
+    @patch.object(neutron_templating, 'path_hash')
+    @patch.object(neutron_templating, 'service')
+    @patch.object(neutron_templating, 'is_unit_paused_set')
+    def test_restart_on_rendered_change(self, _paused, _service, _path_hash):
+        _paused.return_value = False
+        self.configs.write_all()
+        restart_map = {self.paths[0]: ['svc-a'], self.paths[1]: ['svc-b']}
+
+        restart_on_change = neutron_templating.pausable_restart_on_change
+
+        @restart_on_change(restart_map, rendered=True)
+        def hook():
+            with open(self.paths[1], 'w') as f:
+                f.write('edited\n')
+            self.configs.write_all()
+
+        hook()
+        _service.assert_called_once_with('restart', 'svc-b')
+        _path_hash.assert_not_called()
@@ -1,5 +1,6 @@
 
 import io
+import os
 
 from contextlib import contextmanager
 
@@ -8,6 +9,10 @@ from mock import (
     patch
 )
 import neutron_contexts
+import neutron_templating
+
+import charmhelpers.contrib.openstack.templating as templating
+from charmhelpers.core import hookenv
 
 from test_utils import (
     CharmTestCase
@@ -145,6 +150,7 @@ class TestNeutronGatewayContext(CharmTestCase):
         super(TestNeutronGatewayContext, self).setUp(neutron_contexts,
                                                      TO_PATCH)
         self.config.side_effect = self.test_config.get
+        self.os_release.return_value = 'mitaka'
         self.maxDiff = None
 
     @patch('charmhelpers.contrib.openstack.context.relation_get')
@@ -201,6 +207,8 @@ class TestNeutronGatewayContext(CharmTestCase):
             'veth_mtu': 9000,
             'enable_isolated_metadata': False,
             'enable_metadata_network': False,
+            'firewall_driver': 'neutron.agent.linux.iptables_firewall.'
+                               'OVSHybridIptablesFirewallDriver',
             'dnsmasq_flags': {
                 'dhcp-userclass': 'set:ipxe,iPXE',
                 'dhcp-match': 'set:ipxe,175'
@@ -260,6 +268,8 @@ class TestNeutronGatewayContext(CharmTestCase):
             'veth_mtu': 9000,
             'enable_isolated_metadata': False,
             'enable_metadata_network': False,
+            'firewall_driver': 'neutron.agent.linux.iptables_firewall.'
+                               'OVSHybridIptablesFirewallDriver',
             'dnsmasq_flags': {
                 'dhcp-userclass': 'set:ipxe,iPXE',
                 'dhcp-match': 'set:ipxe,175'
@@ -293,6 +303,33 @@ class TestNeutronGatewayContext(CharmTestCase):
         self.assertTrue(ctxt['enable_isolated_metadata'])
         self.assertTrue(ctxt['enable_metadata_network'])
 
+    @patch('charmhelpers.contrib.openstack.context.relation_get')
+    @patch('charmhelpers.contrib.openstack.context.related_units')
+    @patch('charmhelpers.contrib.openstack.context.relation_ids')
+    @patch.object(neutron_contexts, 'get_shared_secret')
+    def test_cached(self, _secret, _rids, _runits, _rget):
+        self.addCleanup(hookenv.cache.clear)
+        self.unit_get.return_value = '10.5.0.1'
+        self.network_get_primary_address.return_value = '192.168.20.2'
+        _rids.return_value = ['neutron-plugin-api:0']
+        _runits.return_value = ['neutron-api/0']
+        _rget.return_value = {'l2-population': 'True'}
+        # Only memoized in a context_cache() scope.
+        neutron_contexts.NeutronGatewayContext()()
+        neutron_contexts.NeutronGatewayContext()()
+        self.assertEqual(_rget.call_count, 2)
+        _rget.reset_mock()
+        with neutron_contexts.context_cache():
+            ctxt = neutron_contexts.NeutronGatewayContext()()
+            ctxt['l2_population'] = False
+            self.assertTrue(
+                neutron_contexts.NeutronGatewayContext()()['l2_population'])
+        self.assertEqual(_rget.call_count, 1)
+        neutron_contexts.flush_context_cache()
+        with neutron_contexts.context_cache():
+            neutron_contexts.NeutronGatewayContext()()
+        self.assertEqual(_rget.call_count, 2)
+
 
 class TestSharedSecret(CharmTestCase):
 
@@ -387,3 +424,274 @@ class TestNovaMetadataContext(CharmTestCase):
         ctxt = neutron_contexts.NovaMetadataContext()()
 
         self.assertEqual(ctxt, {'vendordata_providers': []})
+
+    def test_vendordata_release_changed(self):
+        self.addCleanup(hookenv.cache.clear)
+        self.test_config.set('vendor-data-url', 'http://example.org/vdata')
+        configs = neutron_templating.NeutronConfigRenderer(
+            templates_dir=TEMPLATES, openstack_release='mitaka')
+        configs.register('/etc/neutron/vendordata.conf',
+                         [neutron_contexts.NovaMetadataContext()],
+                         config_template='{{ vendor_data_url }}')
+        with patch.object(templating, 'log'):
+            self.os_release.return_value = 'mitaka'
+            self.assertEqual(
+                configs.render('/etc/neutron/vendordata.conf'), '')
+            # Upgraded, later in the same hook.
+            self.os_release.return_value = 'newton'
+            self.assertEqual(
+                configs.render('/etc/neutron/vendordata.conf'),
+                'http://example.org/vdata')
+
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'templates')
+
+
+class TestRootwrapDaemonContext(CharmTestCase):
+
+    def setUp(self):
+        super(TestRootwrapDaemonContext, self).setUp(neutron_contexts,
+                                                     TO_PATCH)
+        self.config.side_effect = self.test_config.get
+
+    def test_disabled(self):
+        self.os_release.return_value = 'queens'
+        self.assertEqual(neutron_contexts.RootwrapDaemonContext()(), {})
+
+    def test_enabled(self):
+        self.os_release.return_value = 'kilo'
+        self.test_config.set('use-rootwrap-daemon', True)
+        self.assertEqual(neutron_contexts.RootwrapDaemonContext()(),
+                         {'rootwrap_daemon': True})
+
+    @patch.object(neutron_contexts, 'log')
+    def test_unsupported(self, log):
+        self.os_release.return_value = 'juno'
+        self.test_config.set('use-rootwrap-daemon', True)
+        self.assertEqual(neutron_contexts.RootwrapDaemonContext()(), {})
+        self.assertTrue(log.called)
+
+    @patch.object(templating, 'log')
+    def test_render(self, _log):
+        config_files = {
+            '/etc/neutron/neutron.conf':
+            'root_helper_daemon = sudo /usr/bin/neutron-rootwrap-daemon '
+            '/etc/neutron/rootwrap.conf\n',
+            '/etc/neutron/l3_agent.ini':
+            'root_helper_daemon = sudo /usr/bin/neutron-rootwrap-daemon '
+            '/etc/neutron/rootwrap.conf\n',
+            '/etc/neutron/dhcp_agent.ini':
+            'root_helper_daemon = sudo /usr/bin/neutron-rootwrap-daemon '
+            '/etc/neutron/rootwrap.conf\n',
+            '/etc/neutron/metadata_agent.ini':
+            'root_helper_daemon = sudo neutron-rootwrap-daemon '
+            '/etc/neutron/rootwrap.conf\n',
+        }
+        releases = ['icehouse', 'juno', 'kilo', 'liberty', 'mitaka',
+                    'newton', 'ocata', 'pike', 'queens']
+        for enabled in (False, True):
+            self.test_config.set('use-rootwrap-daemon', enabled)
+            for release in releases:
+                self.os_release.return_value = release
+                # Contexts are evaluated once per hook.
+                hookenv.cache.clear()
+                configs = templating.OSConfigRenderer(
+                    templates_dir=TEMPLATES, openstack_release=release)
+                for config_file in config_files:
+                    configs.register(
+                        config_file,
+                        [neutron_contexts.RootwrapDaemonContext()])
+                supported = enabled and release not in ('icehouse', 'juno')
+                with patch.object(neutron_contexts, 'log'):
+                    for config_file, line in config_files.items():
+                        rendered = configs.render(config_file)
+                        self.assertIn('root_helper = ', rendered)
+                        self.assertEqual(line in rendered, supported,
+                                         (release, config_file))
+                        self.assertNotIn('{%', rendered)
+
+
+class TestOVSAgentOptions(CharmTestCase):
+
+    def setUp(self):
+        super(TestOVSAgentOptions, self).setUp(neutron_contexts, TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        patcher = patch.object(neutron_contexts, 'log')
+        self.log = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_defaults(self):
+        self.assertEqual(neutron_contexts.ovs_agent_options('queens'), {
+            'firewall_driver': 'neutron.agent.linux.iptables_firewall.'
+                               'OVSHybridIptablesFirewallDriver'})
+        self.assertFalse(self.log.called)
+
+    def test_native(self):
+        self.test_config.set('firewall-driver', 'openvswitch')
+        self.test_config.set('of-interface', 'native')
+        self.test_config.set('ovsdb-interface', 'native')
+        self.assertEqual(neutron_contexts.ovs_agent_options('newton'), {
+            'firewall_driver': 'openvswitch',
+            'of_interface': 'native',
+            'ovsdb_interface': 'native'})
+        self.assertFalse(self.log.called)
+
+    def test_unsupported(self):
+        self.test_config.set('firewall-driver', 'openvswitch')
+        self.test_config.set('of-interface', 'native')
+        self.assertEqual(neutron_contexts.ovs_agent_options('liberty'), {
+            'firewall_driver': 'neutron.agent.linux.iptables_firewall.'
+                               'OVSHybridIptablesFirewallDriver'})
+        self.assertEqual(self.log.call_count, 2)
+
+    def test_invalid(self):
+        self.test_config.set('firewall-driver', 'noop')
+        self.test_config.set('ovsdb-interface', 'bogus')
+        self.assertEqual(neutron_contexts.ovs_agent_options('queens'), {
+            'firewall_driver': 'neutron.agent.linux.iptables_firewall.'
+                               'OVSHybridIptablesFirewallDriver'})
+        self.assertEqual(self.log.call_count, 2)
+
+    @patch.object(templating, 'log')
+    def test_render(self, _log):
+        self.test_config.set('firewall-driver', 'openvswitch')
+        self.test_config.set('of-interface', 'native')
+        self.test_config.set('ovsdb-interface', 'native')
+        conf = '/etc/neutron/plugins/ml2/openvswitch_agent.ini'
+        for release, expected in (
+                ('mitaka', ['of_interface = native',
+                            'ovsdb_interface = native',
+                            'firewall_driver = neutron.agent.linux.'
+                            'iptables_firewall.'
+                            'OVSHybridIptablesFirewallDriver']),
+                ('newton', ['of_interface = native',
+                            'ovsdb_interface = native',
+                            'firewall_driver = openvswitch'])):
+            configs = templating.OSConfigRenderer(
+                templates_dir=TEMPLATES, openstack_release=release)
+            configs.register(conf, [MagicMock(
+                return_value=neutron_contexts.ovs_agent_options(release))])
+            rendered = configs.render(conf).split('\n')
+            for line in expected:
+                self.assertIn(line, rendered)
+
+
+class TestAgentConcurrencyContext(CharmTestCase):
+
+    def setUp(self):
+        super(TestAgentConcurrencyContext, self).setUp(neutron_contexts,
+                                                       TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        patcher = patch.object(neutron_contexts, 'get_total_ram')
+        patcher.start().return_value = 64 * 1024 ** 3
+        self.addCleanup(patcher.stop)
+        patcher = patch('charmhelpers.contrib.openstack.context.'
+                        '_calculate_workers')
+        patcher.start().return_value = 48
+        self.addCleanup(patcher.stop)
+
+    def test_small_unit(self):
+        # Never below the upstream defaults.
+        self.assertEqual(neutron_contexts.agent_concurrency(2, 0), {
+            'executor_thread_pool_size': 64,
+            'rpc_conn_pool_size': 30,
+            'num_sync_threads': 4,
+        })
+
+    def test_ram_bound(self):
+        self.assertEqual(neutron_contexts.agent_concurrency(48, 4), {
+            'executor_thread_pool_size': 128,
+            'rpc_conn_pool_size': 64,
+            'num_sync_threads': 8,
+        })
+
+    def test_derived(self):
+        self.assertEqual(neutron_contexts.AgentConcurrencyContext()(), {
+            'workers': 48,
+            'executor_thread_pool_size': 384,
+            'rpc_conn_pool_size': 192,
+            'num_sync_threads': 48,
+        })
+
+    def test_overrides(self):
+        self.test_config.set('rpc-conn-pool-size', 40)
+        self.test_config.set('dhcp-num-sync-threads', 16)
+        ctxt = neutron_contexts.AgentConcurrencyContext()()
+        self.assertEqual(ctxt['rpc_conn_pool_size'], 40)
+        self.assertEqual(ctxt['num_sync_threads'], 16)
+        self.assertEqual(ctxt['executor_thread_pool_size'], 384)
+
+    @patch.object(templating, 'log')
+    def test_render(self, _log):
+        for release, expected in (
+                ('juno', ['rpc_thread_pool_size = 384',
+                          'rpc_conn_pool_size = 192']),
+                ('queens', ['executor_thread_pool_size = 384',
+                            'rpc_conn_pool_size = 192'])):
+            hookenv.cache.clear()
+            configs = templating.OSConfigRenderer(
+                templates_dir=TEMPLATES, openstack_release=release)
+            for conf in ('/etc/neutron/neutron.conf',
+                         '/etc/neutron/dhcp_agent.ini'):
+                configs.register(conf,
+                                 [neutron_contexts.AgentConcurrencyContext()])
+            rendered = configs.render('/etc/neutron/neutron.conf')
+            for line in expected:
+                self.assertIn(line, rendered.split('\n'))
+            # neutron-server options, the agents do not read them.
+            self.assertNotIn('rpc_workers', rendered)
+            self.assertIn('num_sync_threads = 48', configs.render(
+                '/etc/neutron/dhcp_agent.ini').split('\n'))
+
+
+class TestNICTuningContext(CharmTestCase):
+
+    def setUp(self):
+        super(TestNICTuningContext, self).setUp(neutron_contexts, TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        for name in ('ExternalPortContext', 'DataPortContext',
+                     'nic_inventory', 'nic_tuning'):
+            patcher = patch.object(neutron_contexts, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.ExternalPortContext.return_value.return_value = {
+            'ext_port': 'eth1'}
+        self.DataPortContext.return_value.return_value = {
+            'eth3': 'br-data', 'bond0': 'br-ex'}
+        self.nic_inventory.return_value = {'by_name': 'nics'}
+        self.nic_tuning.return_value = {
+            'nic_tuning_nics': 'eth1 eth2',
+            'nic_tuning_cpus': '2:4 3:8',
+            'nic_tuning_rps_cpus': 'c'}
+
+    def test_disabled(self):
+        self.assertEqual(neutron_contexts.NICTuningContext()(), {})
+        self.assertFalse(self.nic_tuning.called)
+
+    def test_enabled(self):
+        self.test_config.set('nic-tuning', True)
+        self.assertEqual(neutron_contexts.NICTuningContext()(),
+                         self.nic_tuning.return_value)
+        self.nic_tuning.assert_called_once_with(
+            ['eth1', 'bond0', 'eth3'], 'nics')
+
+    def test_no_ports(self):
+        self.test_config.set('nic-tuning', True)
+        self.ExternalPortContext.return_value.return_value = {}
+        self.DataPortContext.return_value.return_value = None
+        neutron_contexts.NICTuningContext()()
+        self.nic_tuning.assert_called_once_with([], 'nics')
+
+    @patch.object(templating, 'log')
+    def test_render(self, _log):
+        self.test_config.set('nic-tuning', True)
+        configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
+                                              openstack_release='queens')
+        configs.register('/usr/local/bin/os-charm-nic-tuning',
+                         [neutron_contexts.NICTuningContext()])
+        rendered = configs.render('/usr/local/bin/os-charm-nic-tuning')
+        for line in ('nics="eth1 eth2"', 'cpus="2:4 3:8"', 'rps_cpus="c"'):
+            self.assertIn(line, rendered.split('\n'))
+        # No interrupt numbers, they are looked up at boot.
+        self.assertNotIn('/proc/irq/', rendered)
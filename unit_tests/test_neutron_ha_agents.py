@@ -0,0 +1,91 @@
+import unittest
+
+from mock import MagicMock
+
+import neutron_ha_agents as agents
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestGroupAgents(unittest.TestCase):
+
+    def test_group_agents(self):
+        response = {'agents': [
+            {'id': 'd1', 'agent_type': agents.DHCP_AGENT},
+            {'id': 'l1', 'agent_type': agents.L3_AGENT},
+            {'id': 'l2', 'agent_type': agents.L3_AGENT},
+            {'id': 'm1', 'agent_type': 'Metadata agent'},
+        ]}
+        grouped = agents.group_agents(response)
+        self.assertEqual([a['id'] for a in grouped[agents.L3_AGENT]],
+                         ['l1', 'l2'])
+        self.assertEqual(len(grouped[agents.DHCP_AGENT]), 1)
+        self.assertEqual(grouped[agents.OVS_AGENT], [])
+        self.assertEqual(len(grouped['Metadata agent']), 1)
+
+
+class TestHostedResourceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = agents.HostedResourceCache(ttl=10, clock=self.clock)
+
+    def test_ttl(self):
+        self.cache.set('a1', ['r1'])
+        self.clock.now = 10
+        self.assertEqual(self.cache.get('a1'), ['r1'])
+        self.clock.now = 10.5
+        self.assertEqual(self.cache.get('a1'), None)
+
+    def test_invalidate(self):
+        self.cache.set('a1', [])
+        self.cache.set('a2', [])
+        self.cache.invalidate(['a1'])
+        self.assertEqual(self.cache.get('a1'), None)
+        self.assertEqual(self.cache.get('a2'), [])
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get('a2'), None)
+
+    def test_observe_liveness_change(self):
+        self.cache.set('a1', ['r1'])
+        self.cache.set('a2', ['r2'])
+        self.assertEqual(self.cache.observe([{'id': 'a1', 'alive': True},
+                                             {'id': 'a2', 'alive': True}]),
+                         [])
+        self.assertEqual(self.cache.observe([{'id': 'a1', 'alive': False},
+                                             {'id': 'a2', 'alive': True}]),
+                         ['a1'])
+        self.assertEqual(self.cache.get('a1'), None)
+        self.assertEqual(self.cache.get('a2'), ['r2'])
+
+    def test_fetch_only_misses(self):
+        self.cache.set('a1', ['r1'])
+        fetch = MagicMock(side_effect=lambda agent_id: [agent_id + '-r'])
+        hosted = self.cache.fetch(['a1', 'a2', 'a3'], fetch)
+        self.assertEqual(hosted, {'a1': ['r1'], 'a2': ['a2-r'],
+                                  'a3': ['a3-r']})
+        self.assertEqual(sorted(c[0][0] for c in fetch.call_args_list),
+                         ['a2', 'a3'])
+        fetch.reset_mock()
+        self.cache.fetch(['a1', 'a2', 'a3'], fetch)
+        self.assertFalse(fetch.called)
+
+    def test_fetch_failure(self):
+        log = MagicMock()
+
+        def fetch(agent_id):
+            if agent_id == 'bad':
+                raise RuntimeError('boom')
+            return []
+
+        hosted = self.cache.fetch(['good', 'bad'], fetch, log=log)
+        self.assertEqual(hosted, {'good': []})
+        self.assertEqual(self.cache.get('bad'), None)
+        self.assertTrue(log.called)
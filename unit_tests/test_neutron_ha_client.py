@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+import neutron_ha_client as client
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeError(Exception):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class Unauthorized(Exception):
+    pass
+
+
+class TestClientCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.envrc = os.path.join(self.tmpdir, 'envrc')
+        self._write_env('service_password=foo\n')
+        self.clock = FakeClock()
+        self.build = MagicMock(side_effect=lambda: MagicMock())
+        self.cache = client.ClientCache(self.envrc, self.build,
+                                        token_ttl=100, clock=self.clock)
+
+    def _write_env(self, data):
+        with open(self.envrc, 'w') as f:
+            f.write(data)
+
+    def test_reused(self):
+        first = self.cache.get()
+        self.clock.now = 50
+        self.assertIs(self.cache.get(), first)
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_token_expiry(self):
+        quantum = self.cache.get()
+        quantum.httpclient.auth_token = 'token'
+        self.clock.now = 100
+        self.assertIs(self.cache.get(), quantum)
+        self.assertEqual(quantum.httpclient.auth_token, None)
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_env_change_rebuilds(self):
+        first = self.cache.get()
+        self._write_env('service_password=barbaz\n')
+        self.assertIsNot(self.cache.get(), first)
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_missing_env(self):
+        os.remove(self.envrc)
+        self.build.side_effect = lambda: None
+        self.assertEqual(self.cache.get(), None)
+        self._write_env('service_password=foo\n')
+        self.build.side_effect = lambda: MagicMock()
+        self.assertNotEqual(self.cache.get(), None)
+
+    def test_invalidate(self):
+        first = self.cache.get()
+        self.cache.invalidate()
+        self.assertIsNot(self.cache.get(), first)
+
+    def test_is_unauthorized(self):
+        self.assertTrue(client.is_unauthorized(FakeError(401)))
+        self.assertTrue(client.is_unauthorized(Unauthorized()))
+        self.assertFalse(client.is_unauthorized(FakeError(500)))
+        self.assertFalse(client.is_unauthorized(ValueError()))
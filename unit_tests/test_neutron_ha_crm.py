@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import neutron_ha_crm as crm
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLeaderLease(unittest.TestCase):
+    """Run the lease against the stand-in crm script in unit_tests/bin."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.calls_file = os.path.join(self.tmpdir, 'calls')
+        env = {'PATH': BIN_DIR + os.pathsep + os.environ.get('PATH', ''),
+               'CRM_CALLS': self.calls_file,
+               'CRM_NODES': 'node-1 node-2'}
+        self.saved_env = dict((k, os.environ.get(k)) for k in env)
+        self.addCleanup(self._restore_env)
+        os.environ.update(env)
+        self.clock = FakeClock()
+        self.lease = crm.LeaderLease(ttl=60, clock=self.clock)
+
+    def _restore_env(self):
+        for k, v in self.saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    def crm_calls(self):
+        if not os.path.exists(self.calls_file):
+            return []
+        with open(self.calls_file) as f:
+            return f.read().splitlines()
+
+    def test_list_running_nodes(self):
+        self.assertEqual(crm.list_running_nodes(), ['node-1', 'node-2'])
+        self.assertEqual(self.crm_calls(), ['resource show cl_monitor'])
+
+    def test_lease_cached(self):
+        # The l3 and dhcp reschedules of many checks share one crm call.
+        for i in range(10):
+            self.assertEqual(self.lease.get(), 'node-1')
+            self.assertEqual(self.lease.get(), 'node-1')
+            self.clock.now += 5
+        self.assertEqual(len(self.crm_calls()), 1)
+
+    def test_lease_expiry(self):
+        self.lease.get()
+        self.clock.now = 60
+        os.environ['CRM_NODES'] = 'node-2'
+        self.assertEqual(self.lease.get(), 'node-2')
+        self.assertEqual(len(self.crm_calls()), 2)
+
+    def test_invalidate(self):
+        self.lease.get()
+        self.lease.invalidate()
+        self.lease.get()
+        self.assertEqual(len(self.crm_calls()), 2)
+
+    def test_no_leader_not_cached(self):
+        os.environ['CRM_NODES'] = ''
+        self.assertEqual(self.lease.get(), None)
+        self.assertEqual(self.lease.get(), None)
+        self.assertEqual(len(self.crm_calls()), 2)
@@ -0,0 +1,235 @@
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+import neutron_ha_failover as failover
+
+
+class NeutronClientException(Exception):
+    status_code = 0
+
+
+class NotFound(NeutronClientException):
+    status_code = 404
+
+
+class Conflict(NeutronClientException):
+    status_code = 409
+
+
+class ServiceUnavailable(NeutronClientException):
+    status_code = 503
+
+
+class ConnectionFailed(NeutronClientException):
+    pass
+
+
+GATE_TIMEOUT = 10
+
+
+class FakeNeutronClient(object):
+    """Scheduler API subset with injected failures.
+
+    With gate set, calls block until that many are in flight at once, so
+    overlap is shown without relying on timing.  The wait is bounded, the
+    in flight counts are then asserted on.
+    """
+
+    def __init__(self, fail=None, error=RuntimeError, gate=0):
+        self.fail = fail or {}
+        self.error = error
+        self.gate = gate
+        self.calls = 0
+        self.hosting = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._cond = threading.Condition()
+
+    def _call(self, key):
+        with self._cond:
+            self.in_flight += 1
+            self.calls += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failures = self.fail.get(key, 0)
+            if failures:
+                self.fail[key] = failures - 1
+            if self.max_in_flight >= self.gate:
+                self._cond.notify_all()
+            else:
+                self._cond.wait(GATE_TIMEOUT)
+        try:
+            if failures:
+                raise self.error('injected failure for %s' % (key,))
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+
+    def remove_router_from_l3_agent(self, l3_agent, router_id):
+        self._call(('remove', router_id))
+        self.hosting.pop(router_id, None)
+
+    def add_router_to_l3_agent(self, l3_agent, body):
+        self._call(('add', body['router_id']))
+        self.hosting[body['router_id']] = l3_agent
+
+
+def _moves(count, agents=('a1', 'a2', 'a3')):
+    return [('r%d' % i, 'dead', agents[i % len(agents)])
+            for i in range(count)]
+
+
+def _remove(client):
+    return lambda agent, router_id: client.remove_router_from_l3_agent(
+        l3_agent=agent, router_id=router_id)
+
+
+def _add(client):
+    return lambda agent, router_id: client.add_router_to_l3_agent(
+        l3_agent=agent, body={'router_id': router_id})
+
+
+class TestRetryCall(unittest.TestCase):
+
+    def test_success_after_retries(self):
+        func = MagicMock(side_effect=[ValueError, ValueError, 'done'])
+        sleep = MagicMock()
+        self.assertEqual(failover.retry_call(func, attempts=3, sleep=sleep,
+                                             retry_on=(ValueError,)),
+                         'done')
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @patch.object(failover.random, 'uniform')
+    def test_backoff_is_capped_and_jittered(self, uniform):
+        uniform.return_value = 0
+        func = MagicMock(side_effect=ValueError)
+        self.assertRaises(ValueError, failover.retry_call, func, attempts=4,
+                          interval=2.0, max_interval=5.0, sleep=MagicMock(),
+                          retry_on=(ValueError,))
+        self.assertEqual([c[0] for c in uniform.call_args_list],
+                         [(0, 2.0), (0, 4.0), (0, 5.0)])
+
+    def test_not_retried(self):
+        func = MagicMock(side_effect=KeyError)
+        self.assertRaises(KeyError, failover.retry_call, func,
+                          retry_on=(ValueError,), sleep=MagicMock())
+        self.assertEqual(func.call_count, 1)
+
+    def test_transient_only_by_default(self):
+        for error, calls in ((ServiceUnavailable, 3), (ConnectionFailed, 3),
+                             (IOError, 3), (NotFound, 1), (Conflict, 1),
+                             (NeutronClientException, 1), (KeyError, 1)):
+            func = MagicMock(side_effect=error)
+            self.assertRaises(error, failover.retry_call, func,
+                              sleep=MagicMock())
+            self.assertEqual(func.call_count, calls, error)
+
+
+class TestMoveResources(unittest.TestCase):
+
+    def test_report(self):
+        client = FakeNeutronClient(fail={('add', 'r1'): 5,
+                                         ('remove', 'r2'): 5})
+        moves = _moves(3) + [('r3', 'dead', None), ('r4', 'a1', 'a1')]
+        log = MagicMock()
+        report = failover.move_resources(moves, _remove(client),
+                                         _add(client), attempts=2,
+                                         interval=0, log=log)
+        self.assertEqual(sorted(report.moved), ['r0', 'r2'])
+        self.assertEqual(list(report.failed), ['r1'])
+        self.assertEqual(sorted(report.skipped), ['r3', 'r4'])
+        self.assertEqual(client.hosting, {'r0': 'a1', 'r2': 'a3'})
+        self.assertEqual(log.call_count, 2)
+
+    def test_transient_failure_retried(self):
+        client = FakeNeutronClient(fail={('add', 'r0'): 1},
+                                   error=ServiceUnavailable)
+        report = failover.move_resources(_moves(1), _remove(client),
+                                         _add(client), interval=0)
+        self.assertEqual(report.moved, ['r0'])
+        self.assertEqual(report.failed, {})
+
+    def test_permanent_failure_not_retried(self):
+        client = FakeNeutronClient(fail={('remove', 'r0'): 5,
+                                         ('add', 'r0'): 5,
+                                         ('remove', 'r1'): 5},
+                                   error=NotFound)
+        log = MagicMock()
+        report = failover.move_resources(_moves(2), _remove(client),
+                                         _add(client), log=log)
+        self.assertEqual(report.moved, ['r1'])
+        self.assertEqual(list(report.failed), ['r0'])
+        # One call each, no retries.
+        self.assertEqual(client.calls, 4)
+        # Only the add, removes of resources already gone are expected.
+        self.assertEqual(log.call_count, 1)
+
+    @patch.object(failover.random, 'uniform')
+    def test_backoff_slept(self, uniform):
+        uniform.side_effect = lambda low, high: high
+        client = FakeNeutronClient(fail={('add', 'r0'): 2},
+                                   error=ServiceUnavailable)
+        sleep = MagicMock()
+        report = failover.move_resources(_moves(1), _remove(client),
+                                         _add(client), interval=1.0,
+                                         sleep=sleep)
+        self.assertEqual(report.moved, ['r0'])
+        self.assertEqual([c[0] for c in sleep.call_args_list],
+                         [(1.0,), (2.0,)])
+
+    def test_duration(self):
+        client = FakeNeutronClient()
+        clock = MagicMock(side_effect=[100.0, 102.5])
+        report = failover.move_resources(_moves(3), _remove(client),
+                                         _add(client), clock=clock)
+        self.assertEqual(report.duration, 2.5)
+
+    def test_concurrency_bounded(self):
+        client = FakeNeutronClient(gate=4)
+        report = failover.move_resources(_moves(40), _remove(client),
+                                         _add(client), concurrency=4)
+        self.assertEqual(len(report.moved), 40)
+        self.assertEqual(client.max_in_flight, 4)
+
+    def test_serial(self):
+        client = FakeNeutronClient()
+        report = failover.move_resources(_moves(10), _remove(client),
+                                         _add(client), concurrency=1)
+        self.assertEqual(len(report.moved), 10)
+        self.assertEqual(client.max_in_flight, 1)
+
+    def test_moves_overlap(self):
+        # With as many moves in flight as workers the failover takes about
+        # 1/concurrency of the serial time.
+        serial = FakeNeutronClient()
+        pooled = FakeNeutronClient(gate=16)
+        moves = _moves(80)
+        failover.move_resources(moves, _remove(serial), _add(serial),
+                                concurrency=1)
+        failover.move_resources(moves, _remove(pooled), _add(pooled),
+                                concurrency=16)
+        self.assertEqual(serial.hosting, pooled.hosting)
+        self.assertEqual(pooled.max_in_flight, 16)
+
+
+class TestRunBounded(unittest.TestCase):
+
+    def test_errors_swallowed(self):
+        done = []
+
+        def _func(item):
+            if item % 2:
+                raise ValueError(item)
+            done.append(item)
+
+        failover.run_bounded(_func, range(10), 3)
+        self.assertEqual(sorted(done), [0, 2, 4, 6, 8])
+
+    def test_workers_bounded_by_items(self):
+        client = FakeNeutronClient(gate=2)
+        failover.run_bounded(lambda router_id: client.add_router_to_l3_agent(
+            'a1', {'router_id': router_id}), ['r0', 'r1'], 8)
+        self.assertEqual(client.max_in_flight, 2)
+        self.assertEqual(client.hosting, {'r0': 'a1', 'r1': 'a1'})
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+import neutron_ha_metrics as metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        registry = metrics.Registry()
+        calls = registry.counter('api_calls_total', 'API calls.')
+        last = registry.gauge('last_check_timestamp_seconds', 'Last check.')
+        duration = registry.histogram('scan_duration_seconds', 'Scans.',
+                                      buckets=(1.0, 5.0))
+        calls.inc(verb='GET')
+        calls.inc(2, verb='GET')
+        calls.inc(verb='POST')
+        last.set(42)
+        duration.observe(0.5)
+        duration.observe(3)
+        self.assertEqual(calls.value(verb='GET'), 3)
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP neutron_ha_monitor_api_calls_total API calls.',
+            '# TYPE neutron_ha_monitor_api_calls_total counter',
+            'neutron_ha_monitor_api_calls_total{verb="GET"} 3.0',
+            'neutron_ha_monitor_api_calls_total{verb="POST"} 1.0',
+            '# HELP neutron_ha_monitor_last_check_timestamp_seconds '
+            'Last check.',
+            '# TYPE neutron_ha_monitor_last_check_timestamp_seconds gauge',
+            'neutron_ha_monitor_last_check_timestamp_seconds 42.0',
+            '# HELP neutron_ha_monitor_scan_duration_seconds Scans.',
+            '# TYPE neutron_ha_monitor_scan_duration_seconds histogram',
+            'neutron_ha_monitor_scan_duration_seconds_bucket{le="1.0"} 1.0',
+            'neutron_ha_monitor_scan_duration_seconds_bucket{le="5.0"} 2.0',
+            'neutron_ha_monitor_scan_duration_seconds_bucket{le="+Inf"} 2.0',
+            'neutron_ha_monitor_scan_duration_seconds_sum 3.5',
+            'neutron_ha_monitor_scan_duration_seconds_count 2.0',
+        ])
+
+    def test_write(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        registry = metrics.MonitorMetrics()
+        registry.restarts.inc(service='neutron-dhcp-agent')
+        path = os.path.join(tmpdir, 'monitor.prom')
+        self.assertTrue(registry.write(path))
+        self.assertEqual(os.listdir(tmpdir), ['monitor.prom'])
+        with open(path) as f:
+            self.assertIn('neutron_ha_monitor_service_restarts_total'
+                          '{service="neutron-dhcp-agent"} 1.0', f.read())
+        self.assertFalse(registry.write(os.path.join(tmpdir, 'missing',
+                                                     'monitor.prom')))
+
+    def test_count_api_calls(self):
+        counter = metrics.Counter('api_calls_total', 'API calls.')
+        client = MagicMock()
+        client.get.return_value = {'agents': []}
+        client = metrics.count_api_calls(client, counter)
+        self.assertEqual(client.get('/agents'), {'agents': []})
+        client.delete('/agents/1')
+        client.delete('/agents/2')
+        self.assertEqual(counter.value(verb='GET'), 1)
+        self.assertEqual(counter.value(verb='DELETE'), 2)
+        self.assertEqual(counter.value(verb='PUT'), 0)
@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+import neutron_ha_netns as netns
+
+
+class NetnsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.netns_dir = os.path.join(self.tmpdir, 'netns')
+        self.proc_dir = os.path.join(self.tmpdir, 'proc')
+        os.mkdir(self.netns_dir)
+        os.mkdir(self.proc_dir)
+
+    def _add_namespace(self, name):
+        path = os.path.join(self.netns_dir, name)
+        open(path, 'w').close()
+        return os.stat(path).st_ino
+
+    def _add_process(self, pid, inode):
+        os.makedirs(os.path.join(self.proc_dir, pid, 'ns'))
+        os.symlink('net:[%d]' % inode,
+                   os.path.join(self.proc_dir, pid, 'ns', 'net'))
+
+
+class TestNamespaces(NetnsTestCase):
+
+    def test_list_namespaces(self):
+        for name in ['qrouter-2', 'qdhcp-1', 'qrouter-1']:
+            self._add_namespace(name)
+        self.assertEqual(netns.list_namespaces('qrouter',
+                                               netns_dir=self.netns_dir),
+                         ['qrouter-1', 'qrouter-2'])
+        self.assertEqual(len(netns.list_namespaces(
+            netns_dir=self.netns_dir)), 3)
+
+    def test_list_namespaces_no_dir(self):
+        self.assertEqual(netns.list_namespaces(
+            netns_dir=os.path.join(self.tmpdir, 'missing')), [])
+
+    def test_namespaces_in_use(self):
+        busy = self._add_namespace('qdhcp-1')
+        self._add_namespace('qdhcp-2')
+        self._add_process('42', busy)
+        self._add_process('43', 1)
+        os.mkdir(os.path.join(self.proc_dir, 'self'))
+        self.assertEqual(netns.namespaces_in_use(['qdhcp-1', 'qdhcp-2'],
+                                                 netns_dir=self.netns_dir,
+                                                 proc_dir=self.proc_dir),
+                         set(['qdhcp-1']))
+
+
+class TestNamespaceCleaner(NetnsTestCase):
+
+    def setUp(self):
+        super(TestNamespaceCleaner, self).setUp()
+        self.calls = []
+        self.devices = {}
+        self.ovs_interfaces = []
+        self.in_use = set()
+        self.cleaner = netns.NamespaceCleaner(netns_dir=self.netns_dir,
+                                              use_netlink=False)
+        _execute = patch.object(self.cleaner, '_execute',
+                                side_effect=self._execute)
+        _execute.start()
+        self.addCleanup(_execute.stop)
+        _in_use = patch.object(netns, 'namespaces_in_use',
+                               side_effect=lambda *a, **k: self.in_use)
+        _in_use.start()
+        self.addCleanup(_in_use.stop)
+
+    def _execute(self, cmd, stdin=None):
+        self.calls.append((cmd, stdin))
+        if cmd[-4:] == ['ip', '-o', 'link', 'show']:
+            lines = ['1: lo: <LOOPBACK,UP> mtu 65536']
+            for i, name in enumerate(self.devices[cmd[3]]):
+                lines.append('%d: %s@if9: <BROADCAST> mtu 1500' % (i + 2,
+                                                                   name))
+            return '\n'.join(lines)
+        if cmd[0] == 'ovs-vsctl' and 'list' in cmd:
+            return json.dumps({'headings': ['name'],
+                               'data': [[n] for n in self.ovs_interfaces]})
+        return ''
+
+    def _commands(self, name):
+        return [c for c in self.calls if name in c[0]]
+
+    def test_cleanup(self):
+        for ns in ['qrouter-1', 'qrouter-2']:
+            self._add_namespace(ns)
+        self.devices = {'qrouter-1': ['qr-1', 'qg-1', 'veth-1'],
+                        'qrouter-2': ['qr-2']}
+        self.ovs_interfaces = ['qr-1', 'qg-1', 'qr-2', 'tap-other']
+        self.in_use = set(['qrouter-1'])
+        deleted = self.cleaner.cleanup(['qrouter-1', 'qrouter-2',
+                                        'qrouter-gone'])
+        self.assertEqual(deleted, ['qrouter-1', 'qrouter-2'])
+
+        ovs = [c[0] for c in self.calls
+               if c[0][0] == 'ovs-vsctl' and 'del-port' in c[0]]
+        self.assertEqual(ovs, [['ovs-vsctl', '--timeout=10',
+                                '--', '--if-exists', 'del-port', 'qg-1',
+                                '--', '--if-exists', 'del-port', 'qr-1',
+                                '--', '--if-exists', 'del-port', 'qr-2']])
+
+        batches = self._commands('-batch')
+        self.assertEqual(len(batches), 2)
+        # Only the busy namespace gets its remaining devices deleted.
+        self.assertEqual(batches[0][0][:4],
+                         ['ip', 'netns', 'exec', 'qrouter-1'])
+        self.assertEqual(batches[0][1], b'link delete dev veth-1\n')
+        self.assertEqual(batches[1][1],
+                         b'netns delete qrouter-1\nnetns delete qrouter-2\n')
+
+    def test_cleanup_nothing(self):
+        self.assertEqual(self.cleaner.cleanup(['qdhcp-1']), [])
+        self.assertEqual(self.calls, [])
+
+    def test_cleanup_without_ovs(self):
+        self._add_namespace('qdhcp-1')
+        self.devices = {'qdhcp-1': ['tap-1']}
+
+        def _execute(cmd, stdin=None):
+            if cmd[0] == 'ovs-vsctl':
+                raise OSError('No such file or directory')
+            return self._execute(cmd, stdin)
+
+        self.cleaner._execute.side_effect = _execute
+        self.assertEqual(self.cleaner.cleanup(['qdhcp-1']), ['qdhcp-1'])
+        self.assertEqual(self._commands('-batch')[-1][1],
+                         b'netns delete qdhcp-1\n')
+
+    def test_chunks(self):
+        self.assertEqual(list(netns._chunks(list(range(5)), 2)),
+                         [[0, 1], [2, 3], [4]])
@@ -0,0 +1,110 @@
+import json
+import socket
+import threading
+import unittest
+
+from mock import MagicMock
+
+import neutron_ha_ovsdb as ovsdb
+
+
+def _row(name, type_):
+    return {'new': {'name': name, 'type': type_}}
+
+
+INITIAL = {'Interface': {
+    'u1': _row('gre-0a000001', 'gre'),
+    'u2': _row('vxlan-0a000002', 'vxlan'),
+    'u3': _row('br-tun', 'internal'),
+    'u4': _row('patch-int', 'patch'),
+}}
+
+
+class TestTunnelIndex(unittest.TestCase):
+
+    def test_update(self):
+        index = ovsdb.TunnelIndex()
+        self.assertEqual(index.update(INITIAL, reset=True), set())
+        self.assertEqual(index.ports(), ['gre-0a000001', 'vxlan-0a000002'])
+        self.assertEqual(index.ports(['vxlan']), ['vxlan-0a000002'])
+
+        # Deleting the only vxlan port reports the type as lost.
+        self.assertEqual(index.update({'Interface': {'u2': {
+            'old': {'name': 'vxlan-0a000002', 'type': 'vxlan'}}}}),
+            set(['vxlan']))
+        self.assertEqual(index.ports(['vxlan']), [])
+
+        self.assertEqual(index.update({'Interface': {
+            'u5': _row('gre-0a000003', 'gre')}}), set())
+        self.assertEqual(index.update({'Interface': {'u1': {}}}), set())
+        self.assertEqual(index.ports(), ['gre-0a000003'])
+
+    def test_reset(self):
+        index = ovsdb.TunnelIndex()
+        index.update(INITIAL, reset=True)
+        self.assertEqual(index.update({'Interface': {}}, reset=True),
+                         set(['gre', 'vxlan']))
+        self.assertEqual(index.ports(), [])
+
+
+class TestTunnelWatchdog(unittest.TestCase):
+
+    def setUp(self):
+        self.server, client = socket.socketpair()
+        self.addCleanup(self.server.close)
+        self.on_lost = MagicMock()
+        self.watchdog = ovsdb.TunnelWatchdog(on_lost=self.on_lost)
+        self.thread = threading.Thread(target=self.watchdog.session,
+                                       args=(client,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.addCleanup(client.close)
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+
+    def _recv(self):
+        while True:
+            try:
+                msg, end = self.decoder.raw_decode(self.buf)
+                self.buf = self.buf[end:]
+                return msg
+            except ValueError:
+                self.buf += self.server.recv(65536).decode('UTF-8')
+
+    def _send(self, msg):
+        self.server.sendall(json.dumps(msg).encode('UTF-8'))
+
+    def test_session(self):
+        request = self._recv()
+        self.assertEqual(request['method'], 'monitor')
+        self.assertEqual(request['params'][2],
+                         {'Interface': {'columns': ['name', 'type']}})
+
+        # Reply split across writes together with an echo request.
+        data = json.dumps({'id': request['id'], 'result': INITIAL,
+                           'error': None})
+        self.server.sendall(data[:10].encode('UTF-8'))
+        self.server.sendall((data[10:] + json.dumps(
+            {'method': 'echo', 'params': [], 'id': 'echo'})).encode('UTF-8'))
+        self.assertEqual(self._recv(), {'id': 'echo', 'result': [],
+                                        'error': None})
+        self.assertTrue(self.watchdog.synced.is_set())
+        self.assertEqual(self.watchdog.index.ports(),
+                         ['gre-0a000001', 'vxlan-0a000002'])
+
+        self._send({'method': 'update', 'id': None,
+                    'params': [ovsdb.MONITOR_ID,
+                               {'Interface': {'u1': {'old': {}}}}]})
+        self.server.shutdown(socket.SHUT_WR)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.on_lost.assert_called_once_with(set(['gre']))
+        self.assertEqual(self.watchdog.index.ports(), ['vxlan-0a000002'])
+
+    def test_monitor_error(self):
+        request = self._recv()
+        self.assertRaises(ValueError, self.watchdog.handle, self.server,
+                          {'id': request['id'], 'result': None,
+                           'error': 'unknown database'})
+        self.server.shutdown(socket.SHUT_WR)
+        self.thread.join(5)
@@ -0,0 +1,79 @@
+import unittest
+
+import neutron_ha_placement as placement
+
+
+class TestParseWeights(unittest.TestCase):
+
+    def test_defaults(self):
+        self.assertEqual(placement.parse_weights(None),
+                         placement.DEFAULT_WEIGHTS)
+
+    def test_string(self):
+        weights = placement.parse_weights('ports:0.5, ha_routers:2')
+        self.assertEqual(weights, {'routers': 1.0,
+                                   'ports': 0.5,
+                                   'ha_routers': 2.0})
+
+    def test_dict(self):
+        weights = placement.parse_weights({'routers': '3'})
+        self.assertEqual(weights['routers'], 3.0)
+        self.assertEqual(weights['ports'], 0.0)
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, placement.parse_weights, 'cpu:1')
+
+
+class TestWeigher(unittest.TestCase):
+
+    def test_count_ports(self):
+        ports = [{'device_id': 'r1'}, {'device_id': 'r1'},
+                 {'device_id': 'r2'}, {'device_id': ''}]
+        self.assertEqual(placement.count_ports(ports, 'device_id'),
+                         {'r1': 2, 'r2': 1})
+
+    def test_default_weight(self):
+        weigher = placement.Weigher()
+        self.assertEqual(weigher({'id': 'r1', 'ha': True}), 1.0)
+        self.assertEqual(weigher('r1'), 1.0)
+
+    def test_ports_and_ha(self):
+        weigher = placement.Weigher('ports:0.5,ha_routers:2',
+                                    port_counts={'r1': 4})
+        self.assertEqual(weigher({'id': 'r1', 'ha': True}), 5.0)
+        self.assertEqual(weigher({'id': 'r2', 'ha': False}), 1.0)
+
+
+class TestPlacement(unittest.TestCase):
+
+    def test_no_agents(self):
+        self.assertEqual(placement.Placement().place('r1'), None)
+
+    def test_least_loaded(self):
+        p = placement.Placement()
+        p.add_agent('a1', ['r1', 'r2', 'r3'])
+        p.add_agent('a2', ['r4'])
+        p.add_agent('a3', [])
+        self.assertEqual(p.place('x1'), 'a3')
+        self.assertEqual(p.place('x2'), 'a2')
+        self.assertEqual(p.place('x3'), 'a3')
+        self.assertEqual(p.loads, {'a1': 3.0, 'a2': 2.0, 'a3': 2.0})
+
+    def test_place_all_balances(self):
+        p = placement.Placement()
+        p.add_agent('a1', [{'id': 'r%d' % i} for i in range(4)])
+        p.add_agent('a2', [])
+        orphans = dict(('o%d' % i, {'id': 'o%d' % i}) for i in range(6))
+        targets = p.place_all(orphans)
+        self.assertEqual(sorted(targets), sorted(orphans))
+        self.assertEqual(p.loads, {'a1': 5.0, 'a2': 5.0})
+
+    def test_place_all_heaviest_first(self):
+        weigher = placement.Weigher('ports:1',
+                                    port_counts={'big': 10, 'small': 1})
+        p = placement.Placement(weigher)
+        p.add_agent('a1', [])
+        p.add_agent('a2', [])
+        targets = p.place_all({'small': {'id': 'small'},
+                               'big': {'id': 'big'}})
+        self.assertEqual(targets, {'big': 'a1', 'small': 'a2'})
@@ -0,0 +1,53 @@
+import os
+import signal
+import threading
+import time
+import unittest
+
+import neutron_ha_scheduler as scheduler
+
+
+class TestAdaptiveInterval(unittest.TestCase):
+
+    def test_invalid_range(self):
+        self.assertRaises(ValueError, scheduler.AdaptiveInterval, 0, 10)
+        self.assertRaises(ValueError, scheduler.AdaptiveInterval, 10, 5)
+
+    def test_backoff_to_ceiling(self):
+        interval = scheduler.AdaptiveInterval(2, 30)
+        self.assertEqual([interval.next() for _ in range(6)],
+                         [4, 8, 16, 30, 30, 30])
+
+    def test_activity_resets(self):
+        interval = scheduler.AdaptiveInterval(2, 30)
+        interval.next()
+        interval.next()
+        self.assertEqual(interval.next(activity=True), 2)
+        self.assertEqual(interval.next(), 4)
+
+    def test_wait_timeout(self):
+        interval = scheduler.AdaptiveInterval(1, 8)
+        interval.next()
+        self.assertFalse(interval.wait(0.01))
+        self.assertEqual(interval.interval, 2)
+
+    def test_wake(self):
+        interval = scheduler.AdaptiveInterval(1, 8)
+        interval.next()
+        threading.Timer(0.05, interval.wake).start()
+        start = time.time()
+        self.assertTrue(interval.wait(5))
+        self.assertTrue(time.time() - start < 4)
+        self.assertEqual(interval.interval, 1)
+        # The wake up is consumed.
+        self.assertFalse(interval.wait(0.01))
+
+    def test_wake_on_signal(self):
+        interval = scheduler.AdaptiveInterval(1, 8)
+        previous = signal.signal(signal.SIGUSR1, interval.wake)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+        threading.Timer(0.05, os.kill,
+                        [os.getpid(), signal.SIGUSR1]).start()
+        start = time.time()
+        self.assertTrue(interval.wait(5))
+        self.assertTrue(time.time() - start < 4)
@@ -0,0 +1,153 @@
+import subprocess
+import unittest
+
+from mock import MagicMock
+
+import neutron_ha_services as services
+
+SYSTEMCTL_SHOW = """LoadState=loaded
+ActiveState=active
+SubState=exited
+MainPID=0
+
+LoadState=loaded
+ActiveState=active
+SubState=running
+MainPID=1234
+
+LoadState=loaded
+ActiveState=failed
+SubState=failed
+MainPID=0
+
+LoadState=not-found
+ActiveState=inactive
+SubState=dead
+MainPID=0
+"""
+
+INITCTL_LIST = """openvswitch-switch start/running
+neutron-dhcp-agent start/running, process 1234
+neutron-metadata-agent stop/waiting
+neutron-vpn-agent start/running, process 4321
+ssh start/running, process 99
+"""
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_systemctl_show(self):
+        states = services.parse_systemctl_show(SYSTEMCTL_SHOW,
+                                               services.SERVICES)
+        self.assertEqual(states['neutron-dhcp-agent']['MainPID'], '1234')
+        self.assertEqual(states['neutron-metadata-agent']['ActiveState'],
+                         'failed')
+        self.assertTrue(services.is_healthy(states['openvswitch-switch']))
+        self.assertFalse(
+            services.is_healthy(states['neutron-metadata-agent']))
+        self.assertTrue(services.is_healthy(states['neutron-vpn-agent']))
+
+    def test_parse_initctl_list(self):
+        states = services.parse_initctl_list(
+            INITCTL_LIST, services.SERVICES + ['neutron-lbaas-agent'])
+        self.assertNotIn('ssh', states)
+        self.assertEqual(states['neutron-vpn-agent']['MainPID'], '4321')
+        self.assertFalse(
+            services.is_healthy(states['neutron-metadata-agent']))
+        self.assertTrue(services.is_healthy(states['neutron-dhcp-agent']))
+        self.assertEqual(states['neutron-lbaas-agent'],
+                         {'LoadState': 'not-found'})
+
+
+class TestRestartLimiter(unittest.TestCase):
+
+    def test_allow(self):
+        clock = FakeClock()
+        limiter = services.RestartLimiter(burst=2, period=60, clock=clock)
+        self.assertTrue(limiter.allow('a'))
+        self.assertTrue(limiter.allow('a'))
+        self.assertFalse(limiter.allow('a'))
+        self.assertTrue(limiter.allow('b'))
+        clock.now = 60
+        self.assertTrue(limiter.allow('a'))
+
+
+class TestServiceMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.execute = MagicMock()
+        self.log = MagicMock()
+        self.clock = FakeClock()
+
+    def _monitor(self, init, output):
+        self.execute.side_effect = lambda cmd: (
+            output if cmd[0] != 'sudo' else '')
+        return services.ServiceMonitor(
+            limiter=services.RestartLimiter(burst=1, period=60,
+                                            clock=self.clock),
+            init=init, execute=self.execute, log=self.log)
+
+    def _restarts(self):
+        return [c[0][0][2] for c in self.execute.call_args_list
+                if c[0][0][0] == 'sudo']
+
+    def test_check_systemd(self):
+        monitor = self._monitor(services.SYSTEMD, SYSTEMCTL_SHOW)
+        # The vpn agent depends on the metadata agent but is not installed.
+        self.assertEqual(monitor.check(), ['neutron-metadata-agent'])
+        self.assertEqual(self.execute.call_args_list[0][0][0], [
+            'systemctl', 'show',
+            '-p', 'LoadState,ActiveState,SubState,MainPID',
+            'openvswitch-switch.service', 'neutron-dhcp-agent.service',
+            'neutron-metadata-agent.service', 'neutron-vpn-agent.service'])
+        self.assertEqual(self._restarts(), ['neutron-metadata-agent'])
+
+    def test_check_upstart_restarts_dependents(self):
+        monitor = self._monitor(services.UPSTART, INITCTL_LIST)
+        self.assertEqual(monitor.check(), ['neutron-metadata-agent',
+                                           'neutron-vpn-agent'])
+        self.assertEqual(self.execute.call_args_list[0][0][0],
+                         ['initctl', 'list'])
+        self.assertEqual(self._restarts(), ['neutron-metadata-agent',
+                                            'neutron-vpn-agent'])
+
+    def test_check_rate_limited(self):
+        monitor = self._monitor(services.UPSTART, INITCTL_LIST)
+        monitor.check()
+        self.assertEqual(monitor.check(), [])
+        self.assertEqual(len(self._restarts()), 2)
+        self.clock.now = 60
+        self.assertEqual(len(monitor.check()), 2)
+
+    def test_check_healthy(self):
+        monitor = self._monitor(services.UPSTART,
+                                INITCTL_LIST.replace('stop/waiting',
+                                                     'start/running'))
+        self.assertEqual(monitor.check(), [])
+        self.assertEqual(self.execute.call_count, 1)
+
+    def test_restart_failure(self):
+        monitor = self._monitor(services.UPSTART, INITCTL_LIST)
+
+        def _execute(cmd):
+            if cmd[0] == 'sudo':
+                raise subprocess.CalledProcessError(1, cmd)
+            return INITCTL_LIST
+
+        self.execute.side_effect = _execute
+        self.assertEqual(monitor.check(), [])
+        self.assertTrue(self.log.called)
+
+    def test_init_system(self):
+        self.assertEqual(services.init_system('/nonexistent'),
+                         services.UPSTART)
+        self.assertEqual(services.init_system('/'), services.SYSTEMD)
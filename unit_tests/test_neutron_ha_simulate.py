@@ -0,0 +1,182 @@
+import logging
+import sys
+import types
+import unittest
+
+from mock import patch
+
+import neutron_ha_simulate as simulate
+
+
+class FakeOpt(object):
+
+    def __init__(self, name, default=None, help=None):
+        self.name = name
+        self.default = default
+
+
+class FakeConf(object):
+    """The subset of oslo.config's CONF the monitor uses."""
+
+    def __init__(self):
+        self._opts = {}
+        self._overrides = {}
+
+    def register_cli_opts(self, opts):
+        for opt in opts:
+            self._opts.setdefault(opt.name, opt)
+
+    def __call__(self, args=None, project=None, default_config_files=None):
+        pass
+
+    def set_override(self, name, value):
+        self._overrides[name] = value
+
+    def __getattr__(self, name):
+        try:
+            opt = self.__dict__['_opts'][name]
+        except KeyError:
+            raise AttributeError(name)
+        return self._overrides.get(name, opt.default)
+
+
+class NeutronException(Exception):
+    message = 'An unknown exception occurred.'
+
+    def __init__(self, **kwargs):
+        super(NeutronException, self).__init__(self.message % kwargs)
+
+
+def fake_monitor_modules():
+    """Stand ins for the oslo.config and neutron modules the monitor
+    imports, which are not installed where the unit tests run."""
+    modules = dict((name, types.ModuleType(name)) for name in (
+        'oslo', 'oslo.config', 'oslo.config.cfg', 'neutron',
+        'neutron.common', 'neutron.common.exceptions', 'neutron.openstack',
+        'neutron.openstack.common', 'neutron.openstack.common.log'))
+    cfg = modules['oslo.config.cfg']
+    for opt in ('StrOpt', 'IntOpt', 'FloatOpt', 'BoolOpt', 'DictOpt'):
+        setattr(cfg, opt, FakeOpt)
+    cfg.DuplicateOptError = type('DuplicateOptError', (Exception,), {})
+    cfg.CONF = FakeConf()
+    modules['neutron.common.exceptions'].NeutronException = NeutronException
+    log = modules['neutron.openstack.common.log']
+    log.getLogger = logging.getLogger
+    log.setup = lambda name: None
+    for name, module in modules.items():
+        parent, _, child = name.rpartition('.')
+        if parent:
+            setattr(modules[parent], child, module)
+    return modules
+
+
+try:
+    monitor = simulate.load_monitor()
+except ImportError:
+    # oslo.config and neutron are not installed, run the monitor on stand
+    # ins of them.
+    with patch.dict(sys.modules, fake_monitor_modules()):
+        monitor = simulate.load_monitor()
+
+
+class TestFakeNeutronClient(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = simulate.Cluster(nodes=3, routers=6, networks=3)
+        self.client = simulate.FakeNeutronClient(self.cluster)
+
+    def test_topology(self):
+        self.assertEqual(len(self.client.list_agents()['agents']), 6)
+        self.assertEqual(
+            self.client.list_routers_on_l3_agent('l3-node-1')['routers'],
+            [{'id': 'router-1'}, {'id': 'router-4'}])
+        self.assertEqual(
+            self.client.list_networks_on_dhcp_agent('dhcp-node-2'),
+            {'networks': [{'id': 'network-2'}]})
+        self.assertEqual(self.cluster.balance()['routers'],
+                         {'l3-node-0': 2, 'l3-node-1': 2, 'l3-node-2': 2})
+
+    def test_move(self):
+        self.cluster.set_alive('node-1', False)
+        self.assertEqual(self.cluster.orphans(), 3)
+        self.client.remove_router_from_l3_agent('l3-node-1', 'router-1')
+        self.assertEqual(self.cluster.lost(), 1)
+        self.client.add_router_to_l3_agent('l3-node-0',
+                                           {'router_id': 'router-1'})
+        self.assertRaises(simulate.SimulatedError,
+                          self.client.add_router_to_l3_agent,
+                          'l3-node-2', {'router_id': 'router-1'})
+        self.client.remove_network_from_dhcp_agent('dhcp-node-1',
+                                                   'network-1')
+        self.client.add_network_to_dhcp_agent('dhcp-node-2',
+                                              {'network_id': 'network-1'})
+        self.assertEqual(self.cluster.orphans(), 1)
+        self.assertEqual(self.cluster.lost(), 0)
+        self.assertEqual(self.client.calls,
+                         {'DELETE': 2, 'POST': 3})
+
+    def test_errors_repeatable(self):
+        def _failures(seed):
+            client = simulate.FakeNeutronClient(self.cluster,
+                                                error_rate=0.5, seed=seed)
+            failures = []
+            for i in range(20):
+                try:
+                    client.list_agents()
+                except simulate.SimulatedError:
+                    failures.append(i)
+            return failures
+
+        self.assertEqual(_failures(1), _failures(1))
+        self.assertTrue(0 < len(_failures(1)) < 20)
+
+
+class TestSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = simulate.Simulator(monitor, nodes=3, routers=30,
+                                            networks=30)
+
+    def test_single_loss(self):
+        result = self.simulator.single_loss()
+        self.assertEqual(result.orphans, 0)
+        self.assertEqual(result.lost, 0)
+        self.assertEqual(result.moved, 20)
+        self.assertEqual(result.crm_calls, 1)
+        self.assertEqual(result.balance, {
+            'routers': {'l3-node-0': 15, 'l3-node-2': 15},
+            'networks': {'dhcp-node-0': 15, 'dhcp-node-2': 15}})
+
+    def test_double_loss_with_errors(self):
+        self.simulator.error_rate = 0.1
+        result = self.simulator.double_loss()
+        self.assertEqual(result.orphans, 0)
+        self.assertEqual(result.lost, 0)
+        self.assertTrue(result.errors)
+        self.assertEqual(result.balance, {
+            'routers': {'l3-node-0': 30},
+            'networks': {'dhcp-node-0': 30}})
+
+    def test_flapping(self):
+        result = self.simulator.flapping()
+        self.assertEqual(result.orphans, 0)
+        self.assertEqual(result.lost, 0)
+        self.assertEqual(result.checks, 5)
+        # Moved once, not back and forth with every flap.
+        self.assertEqual(result.moved, 20)
+        self.assertEqual(result.balance, {
+            'routers': {'l3-node-0': 15, 'l3-node-2': 15},
+            'networks': {'dhcp-node-0': 15, 'dhcp-node-2': 15}})
+
+    def test_no_cleanup_of_newly_hosted(self):
+        simulator = simulate.Simulator(monitor, nodes=3, routers=0,
+                                       networks=0)
+        cluster, client, _, daemon = simulator._setup()
+        cleanups = []
+        daemon.cleanup_router = cleanups.append
+        simulator.check(daemon, client)
+        self.assertEqual(cleanups, [None])
+        # Scheduled while the empty hosting of l3-node-0 is still cached.
+        cluster.routers['router-new'] = 'l3-node-0'
+        simulator.check(daemon, client)
+        self.assertEqual(cleanups, [None])
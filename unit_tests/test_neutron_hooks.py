@@ -45,6 +45,7 @@ TO_PATCH = [
     'stop_services',
     'b64decode',
     'create_sysctl',
+    'gateway_sysctls',
     'update_nrpe_config',
     'update_legacy_ha_files',
     'install_legacy_ha_files',
@@ -53,11 +54,14 @@ TO_PATCH = [
     'remove_legacy_ha_files',
     'cleanup_ovs_netns',
     'stop_neutron_ha_monitor_daemon',
+    'restart_neutron_ha_monitor_daemon',
+    'wake_neutron_ha_monitor_daemon',
     'use_l3ha',
     'kv',
     'service_restart',
     'is_unit_paused_set',
     'install_systemd_override',
+    'update_nic_tuning',
     'configure_apparmor',
 ]
 
@@ -96,6 +100,16 @@ class TestQuantumHooks(CharmTestCase):
         self.assertTrue(self.get_packages.called)
         self.assertTrue(self.execd_preinstall.called)
         self.assertTrue(self.install_systemd_override.called)
+        self.assertTrue(self.update_nic_tuning.called)
+        self.assertFalse(self.restart_neutron_ha_monitor_daemon.called)
+
+    def test_upgrade_charm_legacy_ha(self):
+        self.test_config.set('ha-legacy-mode', True)
+        self.patch('install')
+        self.patch('config_changed')
+        self._call_hook('upgrade-charm')
+        self.update_legacy_ha_files.assert_called_with(force=True)
+        self.assertTrue(self.restart_neutron_ha_monitor_daemon.called)
 
     def test_install_hook_precise_nocloudarchive(self):
         self.test_config.set('openstack-origin', 'distro')
@@ -114,7 +128,7 @@ class TestQuantumHooks(CharmTestCase):
     def test_config_changed(self):
         def mock_relids(rel):
             return ['relid']
-        self.test_config.set('sysctl', '{ kernel.max_pid: "1337"}')
+        self.gateway_sysctls.return_value = {'kernel.max_pid': '1337'}
         self.openstack_upgrade_available.return_value = True
         self.valid_plugin.return_value = True
         self.relation_ids.side_effect = mock_relids
@@ -125,8 +139,11 @@ class TestQuantumHooks(CharmTestCase):
         self.assertTrue(self.configure_ovs.called)
         self.assertTrue(_amqp_joined.called)
         self.assertTrue(_amqp_nova_joined.called)
-        self.assertTrue(self.create_sysctl.called)
+        self.create_sysctl.assert_called_with(
+            {'kernel.max_pid': '1337'},
+            '/etc/sysctl.d/50-quantum-gateway.conf')
         self.configure_apparmor.assert_called_with()
+        self.assertTrue(self.update_nic_tuning.called)
 
     def test_config_changed_upgrade(self):
         self.openstack_upgrade_available.return_value = True
@@ -160,6 +177,7 @@ class TestQuantumHooks(CharmTestCase):
         self.assertTrue(_install.called)
         self.assertTrue(_config_changed.called)
         self.assertTrue(self.install_systemd_override.called)
+        self.assertTrue(self.update_nic_tuning.called)
 
     def test_amqp_joined(self):
         self._call_hook('amqp-relation-joined')
@@ -290,6 +308,11 @@ class TestQuantumHooks(CharmTestCase):
         self._call_hook('cluster-relation-departed')
         self.assertTrue(self.log.called)
 
+    def test_cluster_departed_legacy_ha(self):
+        self.test_config.set('ha-legacy-mode', True)
+        self._call_hook('cluster-relation-departed')
+        self.assertTrue(self.wake_neutron_ha_monitor_daemon.called)
+
     def test_stop(self):
         self._call_hook('stop')
         self.assertTrue(self.stop_services.called)
@@ -0,0 +1,285 @@
+'''
+Startup cost of neutron_hooks.py per hook.
+
+Loads a fresh copy of the hooks module for every hook and counts the
+subprocesses forked, juju-log calls counted apart, and apt caches opened
+by the import and by what the
+hook resolves before its body runs: the restart map of its
+restart_on_change decorator and the config registration.  Hook bodies are
+not run.  juju-log calls are counted with log() writing through, and with
+it buffered as the hooks run it.  Run this file directly to print the
+counts:
+
+    PYTHONPATH=hooks:unit_tests python unit_tests/test_neutron_hooks_startup.py
+'''
+
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mock import MagicMock, NonCallableMock, call, patch
+
+# python-apt is not installed as part of test-requirements but is imported by
+# some charmhelpers modules so create a fake import.
+sys.modules.setdefault('apt', MagicMock())
+sys.modules.setdefault('apt_pkg', MagicMock())
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
+import charmhelpers.contrib.openstack.utils as os_utils
+import neutron_templating
+import neutron_utils
+
+from test_utils import get_default_config
+
+HOOKS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'hooks', 'neutron_hooks.py')
+
+
+class FakePopen(object):
+    '''Answers juju hook tools without running anything.'''
+
+    def __init__(self, counts, args, *a, **kw):
+        counts['juju_log' if args[0] == 'juju-log' else 'subprocess'] += 1
+        self.args = args
+        self.returncode = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def communicate(self, input=None, timeout=None):
+        if self.args[0] == 'config-get':
+            config = get_default_config()
+            config['openstack-origin'] = 'cloud:xenial-queens'
+            return json.dumps(config).encode('UTF-8'), b''
+        if '--format=json' in self.args:
+            return b'null', b''
+        return b'', b''
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+def _counted(counts, key, func):
+    def _call(*args, **kwargs):
+        counts[key] += 1
+        return func(*args, **kwargs)
+    return _call
+
+
+def _load_hooks():
+    spec = importlib.util.spec_from_file_location('neutron_hooks_startup',
+                                                  HOOKS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _lsb_release():
+    return {'DISTRIB_CODENAME': 'xenial'}
+
+
+def _restart_on_change_code():
+    return neutron_templating.pausable_restart_on_change({})(
+        lambda: None).__code__
+
+
+def hook_startup(hook_name, buffered=False, kv=None, failed=False):
+    '''Return the resolutions made by hook_name before its body runs.
+
+    :param buffered: queue log() messages as after buffer_log(), and flush
+                     them once the hook is bootstrapped.
+    :param kv: the unit's kv store, as left by the previous hooks, else an
+               empty one.
+    :param failed: the hook fails after the bootstrap, so its atexit
+                   callbacks are not run.
+    :returns: dict with the counts for the import alone under 'import' and
+              for the import plus the hook bootstrap under 'total'.
+    '''
+    hookenv.cache.clear()
+    hookenv._cache_config = None
+    del hookenv._atexit[:]
+    counts = dict.fromkeys(['subprocess', 'juju_log', 'apt_cache',
+                            'register_configs', 'restart_map'], 0)
+    charm_dir = tempfile.mkdtemp()
+    patches = [
+        patch.dict(os.environ, {'CHARM_DIR': charm_dir}),
+        patch('subprocess.Popen',
+              lambda *args, **kwargs: FakePopen(counts, *args, **kwargs)),
+        patch.object(os_utils, 'apt_cache',
+                     _counted(counts, 'apt_cache', lambda: {})),
+        patch.object(neutron_templating, 'is_unit_paused_set',
+                     lambda: False),
+        # Skip the hook body, only the restart map is resolved.
+        patch.object(neutron_templating, 'restart_on_change_helper',
+                     lambda *args, **kwargs: None),
+        patch.object(neutron_utils, 'lsb_release', _lsb_release),
+        patch.object(os_utils, 'lsb_release', _lsb_release),
+        patch.object(neutron_utils, 'register_configs',
+                     _counted(counts, 'register_configs',
+                              neutron_utils.register_configs)),
+        patch.object(neutron_utils, 'restart_map',
+                     _counted(counts, 'restart_map',
+                              neutron_utils.restart_map)),
+        patch('charmhelpers.contrib.hardening.harden.harden',
+              lambda *dargs, **dkwargs: lambda f: f),
+        patch.object(hookenv, '_log_buffer', [] if buffered else None),
+        patch.object(unitdata, '_KV', kv or unitdata.Storage(':memory:')),
+        patch.object(os_utils, '_os_rel', None),
+    ]
+    # Other test modules import the hooks with hookenv.config patched, which
+    # leaves the mock bound in the modules imported at the time.
+    patches.extend(patch.object(module, 'config', hookenv.config)
+                   for module in list(sys.modules.values())
+                   if isinstance(getattr(module, 'config', None),
+                                 NonCallableMock))
+    for p in patches:
+        p.start()
+    try:
+        module = _load_hooks()
+        result = {'import': dict(counts)}
+        module.load_os_release()
+        hook = module.hooks._hooks[hook_name]
+        if hook.__code__ is _restart_on_change_code():
+            hook()
+        # Any use of CONFIGS registers the configs.
+        module.CONFIGS.templates
+        hookenv.flush_log()
+        result['total'] = dict(counts)
+        if not failed:
+            hookenv._run_atexit()
+        return result
+    finally:
+        for p in reversed(patches):
+            p.stop()
+        shutil.rmtree(charm_dir)
+
+
+def hook_names():
+    '''The hooks juju runs, i.e. the hooks/ symlinks to neutron_hooks.py.'''
+    hooks_dir = os.path.dirname(HOOKS)
+    with patch('charmhelpers.contrib.hardening.harden.harden',
+               lambda *dargs, **dkwargs: lambda f: f):
+        registered = _load_hooks().hooks._hooks
+    return sorted(name for name in os.listdir(hooks_dir)
+                  if name in registered and
+                  os.path.realpath(os.path.join(hooks_dir, name)) == HOOKS)
+
+
+class TestHookStartup(unittest.TestCase):
+
+    def test_import_resolves_nothing(self):
+        result = hook_startup('update-status')
+        self.assertEqual(result['import'],
+                         {'subprocess': 0, 'juju_log': 0, 'apt_cache': 0,
+                          'register_configs': 0, 'restart_map': 0})
+
+    def test_resolved_once_per_hook(self):
+        for hook_name in hook_names():
+            total = hook_startup(hook_name)['total']
+            self.assertEqual(total['register_configs'], 1, hook_name)
+            self.assertTrue(total['restart_map'] <= 1, hook_name)
+            # The release is looked up once, then config-get and a couple
+            # of relation-ids.
+            self.assertEqual(total['apt_cache'], 1, hook_name)
+            self.assertTrue(total['subprocess'] <= 3, hook_name)
+
+    def test_log_buffered(self):
+        for hook_name in hook_names():
+            total = hook_startup(hook_name)['total']
+            buffered = hook_startup(hook_name, buffered=True)['total']
+            self.assertTrue(total['juju_log'] > 1, hook_name)
+            # All the config registrations are logged at the same level.
+            self.assertEqual(buffered['juju_log'], 1, hook_name)
+            self.assertEqual(buffered['subprocess'], total['subprocess'])
+
+    def test_release_persisted(self):
+        kv = unitdata.Storage(':memory:')
+        self.assertEqual(
+            hook_startup('update-status', kv=kv)['total']['apt_cache'], 1)
+        # Later hooks reuse the release until the packages change.
+        self.assertEqual(
+            hook_startup('config-changed', kv=kv)['total']['apt_cache'], 0)
+        with patch.object(neutron_utils, 'DPKG_STATUS', os.devnull):
+            self.assertEqual(
+                hook_startup('config-changed', kv=kv)['total']['apt_cache'],
+                1)
+
+    def test_release_not_persisted_on_failure(self):
+        kv = unitdata.Storage(':memory:')
+        hook_startup('update-status', kv=kv, failed=True)
+        self.assertEqual(kv.get(neutron_utils.OS_RELEASE_KEY), None)
+        self.assertEqual(
+            hook_startup('update-status', kv=kv)['total']['apt_cache'], 1)
+        self.assertEqual(
+            kv.get(neutron_utils.OS_RELEASE_KEY)['release'], 'queens')
+
+    @patch.object(neutron_utils, 'restart_map')
+    @patch.object(neutron_utils, 'flush_context_cache')
+    @patch.object(os_utils, '_os_rel', 'pike')
+    def test_reset_release(self, flush_context_cache, restart_map):
+        hookenv.cache.clear()
+        self.addCleanup(hookenv.cache.clear)
+        restart_map.return_value = {'/etc/neutron/l3_agent.ini':
+                                    ['neutron-l3-agent']}
+        self.assertEqual(neutron_utils.services(), ['neutron-l3-agent'])
+        neutron_utils.reset_os_release()
+        self.assertEqual(os_utils._os_rel, None)
+        flush_context_cache.assert_called_once_with()
+        self.assertEqual(hookenv.cache, {})
+
+
+class TestLogBuffer(unittest.TestCase):
+
+    @patch.object(hookenv, '_juju_log')
+    @patch.object(hookenv, '_log_buffer', [])
+    def test_batches_in_order(self, _juju_log):
+        hookenv.log('one', level=hookenv.INFO)
+        hookenv.log('two', level=hookenv.INFO)
+        hookenv.log('three', level=hookenv.DEBUG)
+        self.assertFalse(_juju_log.called)
+        hookenv.log('failed', level=hookenv.ERROR)
+        self.assertEqual(_juju_log.call_args_list,
+                         [call('one\ntwo', hookenv.INFO),
+                          call('three', hookenv.DEBUG),
+                          call('failed', hookenv.ERROR)])
+        _juju_log.reset_mock()
+        hookenv.log('four')
+        hookenv.flush_log()
+        _juju_log.assert_called_once_with('four', None)
+
+    @patch.object(hookenv, '_juju_log')
+    @patch.object(hookenv, '_log_buffer', [])
+    @patch.object(hookenv, 'LOG_BATCH_MAX', 10)
+    def test_batch_size(self, _juju_log):
+        for message in ('12345', '67890', 'abc'):
+            hookenv.log(message)
+        hookenv.flush_log()
+        self.assertEqual(_juju_log.call_args_list,
+                         [call('12345', None), call('67890\nabc', None)])
+
+
+if __name__ == '__main__':
+    print('%-40s %10s %8s %8s %9s %7s %11s' % (
+        'hook', 'subprocess', 'juju-log', 'buffered', 'apt_cache', 'configs',
+        'restart_map'))
+    for name in hook_names():
+        total = hook_startup(name)['total']
+        buffered = hook_startup(name, buffered=True)['total']
+        print('%-40s %10d %8d %8d %9d %7d %11d' % (
+            name, total['subprocess'], total['juju_log'],
+            buffered['juju_log'], total['apt_cache'],
+            total['register_configs'], total['restart_map']))
@@ -0,0 +1,159 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+# python-apt is not installed as part of test-requirements but is imported by
+# some charmhelpers modules so create a fake import.
+sys.modules.setdefault('apt', MagicMock())
+sys.modules.setdefault('apt_pkg', MagicMock())
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.contrib.openstack.context as context
+import neutron_contexts
+import neutron_nics
+
+IP_ADDR = b'''\
+1: lo    inet 127.0.0.1/8 scope host lo\\       valid_lft forever
+1: lo    inet6 ::1/128 scope host \\       valid_lft forever
+2: eth0    inet 10.0.0.5/24 brd 10.0.0.255 scope global eth0\\       valid_lft
+2: eth0    inet6 fe80::5054:ff:fe00:1/64 scope link \\       valid_lft forever
+5: eth3    inet6 fe80::5054:ff:fe00:4/64 scope link \\       valid_lft forever
+9: bond0    inet6 2001:db8::1/64 scope global dynamic \\       valid_lft 86400
+'''
+
+
+class FakeSysNet(object):
+    '''A /sys/class/net tree in a temporary directory, with the interfaces
+    linked to their devices as sysfs does.'''
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp()
+        self.sys_net = os.path.join(self.root, 'class', 'net')
+        os.makedirs(self.sys_net)
+        self.index = 0
+
+    def cleanup(self):
+        shutil.rmtree(self.root)
+
+    def add(self, name, mac=None, virtual=False, master=None, bond=False,
+            bridge=False, lower=None, type=1):
+        self.index += 1
+        device = os.path.join(self.root, 'devices',
+                              'virtual' if virtual else 'pci0000:00',
+                              'net', name)
+        os.makedirs(device)
+        os.symlink(device, os.path.join(self.sys_net, name))
+        files = {'ifindex': self.index, 'mtu': 1500, 'type': type,
+                 'address': mac or '00:00:00:00:00:00'}
+        for key, value in files.items():
+            with open(os.path.join(device, key), 'w') as f:
+                f.write('{}\n'.format(value))
+        if master:
+            os.symlink(os.path.join(self.sys_net, master),
+                       os.path.join(device, 'master'))
+        if bond:
+            os.mkdir(os.path.join(device, 'bonding'))
+        if bridge:
+            os.mkdir(os.path.join(device, 'bridge'))
+        if lower:
+            os.symlink(os.path.join(self.sys_net, lower),
+                       os.path.join(device, 'lower_' + lower))
+
+
+class TestNICInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.sys = FakeSysNet()
+        self.addCleanup(self.sys.cleanup)
+        self.sys.add('lo', virtual=True, type=772)
+        self.sys.add('eth0', mac='52:54:00:00:00:01')
+        self.sys.add('bond0', mac='52:54:00:00:00:02', virtual=True,
+                     bond=True)
+        self.sys.add('br0', mac='52:54:00:00:00:05', virtual=True,
+                     bridge=True)
+        self.sys.add('eth1', mac='52:54:00:00:00:02', master='bond0')
+        self.sys.add('eth2', mac='52:54:00:00:00:02', master='bond0')
+        self.sys.add('eth3', mac='52:54:00:00:00:04')
+        self.sys.add('eth4', mac='52:54:00:00:00:05', master='br0')
+        self.sys.add('eth5', mac='52:54:00:00:00:06')
+        self.sys.add('eth5.100', mac='52:54:00:00:00:06', virtual=True,
+                     lower='eth5')
+        patcher = patch('subprocess.check_output')
+        self.check_output = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.check_output.return_value = IP_ADDR
+        inventory = neutron_nics.build_nic_inventory(self.sys.sys_net)
+        for target, name in ((neutron_contexts, 'nic_inventory'),
+                             (neutron_contexts, 'log'),
+                             (neutron_contexts, 'config'),
+                             (context, 'relation_ids')):
+            patcher = patch.object(target, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        neutron_contexts.nic_inventory.return_value = inventory
+        context.relation_ids.return_value = []
+        self.config = {}
+        neutron_contexts.config.side_effect = self.config.get
+
+    def test_build(self):
+        nics = neutron_nics.build_nic_inventory(self.sys.sys_net)
+        self.check_output.assert_called_with(['ip', '-o', 'addr', 'show'])
+        by_name = nics['by_name']
+        self.assertEqual(sorted(by_name), [
+            'bond0', 'br0', 'eth0', 'eth1', 'eth2', 'eth3', 'eth4', 'eth5',
+            'eth5.100', 'lo'])
+        self.assertEqual(by_name['lo']['mac'], '')
+        self.assertTrue(by_name['lo']['virtual'])
+        self.assertEqual(by_name['eth0']['addresses'], ['10.0.0.5'])
+        self.assertFalse(by_name['eth0']['virtual'])
+        self.assertEqual(by_name['eth1']['master'], 'bond0')
+        self.assertEqual(by_name['eth1']['bond_master'], 'bond0')
+        self.assertEqual(by_name['bond0']['addresses'], ['2001:db8::1'])
+        # Link local addresses are not addresses.
+        self.assertEqual(by_name['eth3']['addresses'], [])
+        self.assertTrue(by_name['eth4']['bridge_member'])
+        self.assertEqual(by_name['eth4']['bond_master'], None)
+        self.assertEqual(by_name['eth5.100']['lower'], ['eth5'])
+        self.assertEqual(nics['by_mac']['52:54:00:00:00:02'],
+                         ['bond0', 'eth1', 'eth2'])
+
+    def test_cached(self):
+        hookenv.cache.clear()
+        self.addCleanup(hookenv.cache.clear)
+        with patch.object(neutron_nics, 'build_nic_inventory') as build:
+            for _ in range(3):
+                neutron_nics.nic_inventory()
+            neutron_nics.flush_nic_inventory()
+            neutron_nics.nic_inventory()
+        self.assertEqual(build.call_count, 2)
+
+    def test_resolve_ports(self):
+        ports = ['52:54:00:00:00:01', '52:54:00:00:00:02',
+                 '52:54:00:00:00:04', '52:54:00:00:00:05',
+                 '52:54:00:00:00:06', 'eth9']
+        self.assertEqual(
+            sorted(neutron_contexts.NeutronPortContext().resolve_ports(ports)),
+            # eth0 has an address, eth4 is in a bridge.
+            ['eth3', 'eth5', 'eth9'])
+
+    def test_ext_port(self):
+        self.config['ext-port'] = '52:54:00:00:00:04'
+        self.assertEqual(neutron_contexts.ExternalPortContext()(),
+                         {'ext_port': 'eth3'})
+
+    def test_data_port(self):
+        self.config['data-port'] = ('br-data:52:54:00:00:00:06 '
+                                    'br-ex:eth5.100')
+        self.assertEqual(neutron_contexts.DataPortContext()(),
+                         {'eth5': 'br-data', 'eth5.100': 'br-ex'})
+
+    @patch.object(neutron_contexts, 'NeutronAPIContext')
+    def test_phy_nic_mtu(self, api_context):
+        api_context.return_value.return_value = {'network_device_mtu': 9000}
+        self.config['data-port'] = 'br-ex:eth5.100 br-data:eth3'
+        self.assertEqual(neutron_contexts.PhyNICMTUContext()(),
+                         {'devs': 'eth5\\neth3\\neth5.100', 'mtu': 9000})
@@ -0,0 +1,85 @@
+import json
+import unittest
+
+from mock import call, patch
+
+import neutron_ovs as ovs
+
+
+def _table(headings, *rows):
+    return json.dumps({'headings': headings, 'data': list(rows)})
+
+
+def ovs_vsctl_output(ipfix_target=None):
+    '''ovs-vsctl --format=json output for br-int with no ports, and br-ex
+    with eth0 and, if ipfix_target, exporting to it.'''
+    ipfix = ['uuid', 'i1'] if ipfix_target else ['set', []]
+    bridges = _table(['name', 'ports', 'ipfix'],
+                     ['br-int', ['set', []], ['set', []]],
+                     ['br-ex', ['uuid', 'p1'], ipfix])
+    ports = _table(['_uuid', 'name'], [['uuid', 'p1'], 'eth0'])
+    ipfixes = _table(['_uuid', 'targets'],
+                     *([[['uuid', 'i1'], ipfix_target]]
+                       if ipfix_target else []))
+    return '\n'.join([bridges, ports, ipfixes]).encode('UTF-8')
+
+
+@patch.object(ovs, 'log')
+@patch.object(ovs, '_link_flags', lambda port: ovs.IFF_UP)
+@patch.object(ovs.subprocess, 'check_call')
+@patch.object(ovs.subprocess, 'check_output')
+class TestReconcileBridges(unittest.TestCase):
+
+    def test_bridges_state(self, check_output, check_call, log):
+        check_output.return_value = ovs_vsctl_output('10.0.0.1:4739')
+        self.assertEqual(ovs.bridges_state(), {
+            'br-int': {'ports': set(), 'ipfix': set()},
+            'br-ex': {'ports': set(['eth0']),
+                      'ipfix': set(['10.0.0.1:4739'])},
+        })
+        check_output.assert_called_once_with(
+            ['ovs-vsctl', '--format=json',
+             '--', '--columns=name,ports,ipfix', 'list', 'Bridge',
+             '--', '--columns=_uuid,name', 'list', 'Port',
+             '--', '--columns=_uuid,targets', 'list', 'IPFIX'])
+
+    def test_no_changes(self, check_output, check_call, log):
+        check_output.return_value = ovs_vsctl_output()
+        self.assertEqual(
+            ovs.reconcile_bridges({'br-int': {}, 'br-ex': {'eth0': False}}),
+            [])
+        self.assertFalse(check_call.called)
+
+    def test_single_transaction(self, check_output, check_call, log):
+        check_output.return_value = ovs_vsctl_output()
+        ovs.reconcile_bridges({'br-int': {}, 'br-ex': {'eth0': False},
+                               'br-data': {'eth1': True}}, '10.0.0.1:4739')
+        self.assertEqual(check_call.call_args_list[0], call(
+            ['ovs-vsctl',
+             '--', '--may-exist', 'add-br', 'br-data',
+             '--', 'set', 'Bridge', 'br-int', 'ipfix=@ipfix1',
+             '--', '--id=@ipfix1', 'create', 'IPFIX',
+             'targets="10.0.0.1:4739"',
+             '--', 'set', 'Bridge', 'br-ex', 'ipfix=@ipfix3',
+             '--', '--id=@ipfix3', 'create', 'IPFIX',
+             'targets="10.0.0.1:4739"',
+             '--', '--may-exist', 'add-port', 'br-data', 'eth1',
+             '--', 'set', 'Bridge', 'br-data', 'ipfix=@ipfix6',
+             '--', '--id=@ipfix6', 'create', 'IPFIX',
+             'targets="10.0.0.1:4739"']))
+        # eth0 is up and not promiscuous already.
+        self.assertEqual(check_call.call_args_list[1:], [
+            call(['ip', 'link', 'set', 'eth1', 'up', 'promisc', 'on'])])
+
+    def test_ipfix_unchanged(self, check_output, check_call, log):
+        check_output.return_value = ovs_vsctl_output('10.0.0.1:4739')
+        self.assertEqual(
+            ovs.reconcile_bridges({'br-ex': {'eth0': False}},
+                                  '10.0.0.1:4739'), [])
+        self.assertFalse(check_call.called)
+
+    def test_ipfix_disabled(self, check_output, check_call, log):
+        check_output.return_value = ovs_vsctl_output('10.0.0.1:4739')
+        ovs.reconcile_bridges({'br-int': {}, 'br-ex': {'eth0': False}})
+        check_call.assert_called_once_with(
+            ['ovs-vsctl', '--', 'clear', 'Bridge', 'br-ex', 'ipfix'])
@@ -0,0 +1,233 @@
+'''
+Cost of rendering every registered config file in one hook.
+
+Renders all the templates of a gateway related to a neutron-api, a
+nova-cloud-controller and a rabbitmq-server of several units each, with and
+without the context cache and the relation snapshot, counting the hook tools
+forked and the times NeutronAPIContext walks the neutron-plugin-api
+relation.  Nothing is written.  Run this file directly to print the counts
+and the wall time, with every hook tool taking LATENCY seconds:
+
+    PYTHONPATH=hooks:unit_tests python unit_tests/test_neutron_render_cost.py
+'''
+
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from mock import MagicMock, NonCallableMock, patch
+
+# python-apt is not installed as part of test-requirements but is imported by
+# some charmhelpers modules so create a fake import.
+sys.modules.setdefault('apt', MagicMock())
+sys.modules.setdefault('apt_pkg', MagicMock())
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.contrib.openstack.context as context
+import neutron_contexts
+import neutron_templating
+import neutron_utils
+
+from test_utils import get_default_config
+
+CHARM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNITS = 3
+
+RELATIONS = {
+    'neutron-plugin-api': {
+        'l2-population': 'True',
+        'overlay-network-type': 'vxlan',
+        'network-device-mtu': '9000',
+    },
+    'quantum-network-service': {
+        'keystone_host': '10.0.0.10',
+        'auth_port': '35357',
+        'auth_protocol': 'http',
+        'service_tenant': 'services',
+        'service_username': 'quantum',
+        'service_password': 'secret',
+        'quantum_host': '10.0.0.11',
+        'quantum_port': '9696',
+        'quantum_url': 'http://10.0.0.11:9696',
+        'region': 'RegionOne',
+    },
+    'amqp': {
+        'hostname': '10.0.0.12',
+        'password': 'secret',
+    },
+}
+
+
+class FakeHookTools(object):
+    '''Answers the hook tools for a unit related to UNITS units on each of
+    RELATIONS, counting the forks.'''
+
+    latency = 0
+
+    def __init__(self, counts, args, *a, **kw):
+        counts[args[0]] = counts.get(args[0], 0) + 1
+        self.args = args
+        self.returncode = 0
+        self.done = time.time() + self.latency
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def _answer(self):
+        tool, args = self.args[0], self.args[1:]
+        if tool == 'config-get':
+            config = get_default_config()
+            config['openstack-origin'] = 'cloud:xenial-queens'
+            return config
+        if tool == 'relation-ids':
+            return ['{}:0'.format(args[-1])] if args[-1] in RELATIONS else []
+        if tool == 'relation-list':
+            rid = args[args.index('-r') + 1]
+            return ['{}/{}'.format(rid.split(':')[0], i)
+                    for i in range(UNITS)]
+        if tool == 'relation-get':
+            rid = args[args.index('-r') + 1]
+            settings = dict(RELATIONS[rid.split(':')[0]])
+            settings['private-address'] = '10.0.0.{}'.format(
+                20 + int(args[-1].split('/')[1]))
+            attribute = args[args.index('-r') + 2]
+            return settings if attribute == '-' else settings.get(attribute)
+        if tool in ('unit-get', 'network-get'):
+            return '10.0.0.1'
+        return None
+
+    def communicate(self, input=None, timeout=None):
+        time.sleep(max(0, self.done - time.time()))
+        if self.args[0] == 'juju-log':
+            return b'', b''
+        return json.dumps(self._answer()).encode('UTF-8'), b''
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+def _lsb_release():
+    return {'DISTRIB_CODENAME': 'xenial', 'DISTRIB_RELEASE': '16.04'}
+
+
+def render_all(cache=True, prefetch=False):
+    '''Register and render every config file once, as write_all() does.
+
+    :param cache: render with the context cache, as OSConfigRenderer does.
+    :param prefetch: answer relation lookups from a relation snapshot.
+    :returns: dict with the forks by hook tool, the neutron-plugin-api walks
+              under 'NeutronAPIContext', the wall time under 'seconds' and
+              the rendered files under 'rendered'.
+    '''
+    hookenv.cache.clear()
+    hookenv._cache_config = None
+    counts = {}
+    walks = []
+    api_context = context.NeutronAPIContext.get_neutron_options
+
+    def get_neutron_options(self, rdata):
+        if not rdata:
+            walks.append(type(self).__name__)
+        return api_context(self, rdata)
+
+    charm_dir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(CHARM_DIR, 'metadata.yaml'), charm_dir)
+    patches = [
+        patch.dict(os.environ, {'CHARM_DIR': charm_dir}),
+        patch('subprocess.Popen',
+              lambda *args, **kwargs: FakeHookTools(counts, *args, **kwargs)),
+        patch.object(neutron_utils, 'lsb_release', _lsb_release),
+        patch.object(context, 'lsb_release', _lsb_release),
+        patch('charmhelpers.core.host.lsb_release', _lsb_release),
+        patch.object(neutron_contexts, 'get_shared_secret', lambda: 'secret'),
+        patch.object(neutron_contexts, 'os_release', lambda *args: 'queens'),
+        patch.object(context.NeutronAPIContext, 'get_neutron_options',
+                     get_neutron_options),
+        patch.object(hookenv, '_prefetch_relations', prefetch),
+    ]
+    if not cache:
+        patches.append(patch.object(neutron_templating, 'context_cache',
+                                    contextlib.contextmanager(
+                                        lambda: (yield))))
+    # Other test modules import the hooks with hookenv.config patched, which
+    # leaves the mock bound in the modules imported at the time.
+    patches.extend(patch.object(module, 'config', hookenv.config)
+                   for module in list(sys.modules.values())
+                   if isinstance(getattr(module, 'config', None),
+                                 NonCallableMock))
+    cwd = os.getcwd()
+    for p in patches:
+        p.start()
+    try:
+        os.chdir(CHARM_DIR)
+        start = time.time()
+        configs = neutron_utils.register_configs('queens')
+        rendered = {config_file: configs.render(config_file)
+                    for config_file in configs.templates}
+        result = dict(counts, seconds=time.time() - start,
+                      NeutronAPIContext=len(walks), rendered=rendered)
+        result.pop('juju-log', None)
+        return result
+    finally:
+        os.chdir(cwd)
+        for p in reversed(patches):
+            p.stop()
+        shutil.rmtree(charm_dir)
+        hookenv.cache.clear()
+        hookenv._cache_config = None
+
+
+class TestRenderCost(unittest.TestCase):
+
+    def test_contexts_evaluated_once(self):
+        uncached = render_all(cache=False)
+        cached = render_all()
+        self.assertTrue(uncached['NeutronAPIContext'] > 10)
+        # NeutronAPIContext itself and the base of NeutronGatewayContext.
+        self.assertEqual(cached['NeutronAPIContext'], 2)
+        # relation-get is cached by hookenv either way.
+        self.assertEqual(cached['relation-get'], uncached['relation-get'])
+        self.assertEqual(cached['rendered'], uncached['rendered'])
+
+    def test_relation_snapshot(self):
+        cached = render_all()
+        prefetched = render_all(prefetch=True)
+        self.assertEqual(prefetched['rendered'], cached['rendered'])
+        # A relation-list per relation id and a relation-get per unit,
+        # rather than one per setting looked up.
+        self.assertEqual(prefetched['relation-list'], len(RELATIONS))
+        self.assertEqual(prefetched['relation-get'], len(RELATIONS) * UNITS)
+        self.assertTrue(prefetched['relation-get'] < cached['relation-get'])
+
+
+LATENCY = 0.005
+
+if __name__ == '__main__':
+    FakeHookTools.latency = LATENCY
+    runs = 5
+    modes = [('uncached', {'cache': False}), ('cached', {}),
+             ('prefetched', {'prefetch': True})]
+    results = []
+    for name, kwargs in modes:
+        samples = [render_all(**kwargs) for _ in range(runs)]
+        results.append(dict(samples[0], seconds=min(
+            s['seconds'] for s in samples)))
+    keys = sorted(set().union(*results) - set(['rendered']))
+    print('%-20s' % '' + ''.join('%12s' % name for name, _ in modes))
+    for key in keys:
+        fmt = '%12.4f' if key == 'seconds' else '%12d'
+        print('%-20s' % key + ''.join(fmt % r.get(key, 0) for r in results))
@@ -0,0 +1,88 @@
+import subprocess
+import sys
+import unittest
+
+from mock import MagicMock, call, patch
+
+# python-apt is not installed as part of test-requirements but is imported by
+# some charmhelpers modules so create a fake import.
+sys.modules.setdefault('apt', MagicMock())
+sys.modules.setdefault('apt_pkg', MagicMock())
+
+import charmhelpers.core.hookenv as hookenv
+import neutron_utils
+
+SHOW = b'''\
+ActiveState=active
+
+ActiveState=inactive
+
+ActiveState=reloading
+'''
+
+
+@patch.object(neutron_utils, 'init_is_systemd', lambda: True)
+@patch.object(neutron_utils, 'service_running')
+@patch('subprocess.check_output')
+class TestServicesRunning(unittest.TestCase):
+
+    def test_one_query(self, check_output, service_running):
+        check_output.return_value = SHOW
+        services = ['neutron-l3-agent', 'neutron-metering-agent',
+                    'neutron-dhcp-agent']
+        self.assertEqual(neutron_utils.services_running(services), {
+            'neutron-l3-agent': True,
+            'neutron-metering-agent': False,
+            'neutron-dhcp-agent': True})
+        check_output.assert_called_once_with(
+            ['systemctl', 'show', '--property=ActiveState'] + services)
+        self.assertFalse(service_running.called)
+
+    @patch.object(neutron_utils, 'relation_ids', lambda reltype: [])
+    def test_check_services_running(self, check_output, service_running):
+        check_output.return_value = SHOW
+        services = ['neutron-l3-agent', 'neutron-metering-agent',
+                    'neutron-dhcp-agent']
+        self.assertEqual(
+            neutron_utils.check_services_running('configs', services),
+            ('blocked', 'Services not running that should be: '
+             'neutron-metering-agent'))
+        self.assertEqual(
+            neutron_utils.check_services_running('configs', services[:1]),
+            ('unknown', ''))
+
+    def test_no_services(self, check_output, service_running):
+        self.assertEqual(neutron_utils.services_running([]), {})
+        self.assertFalse(check_output.called)
+
+    def test_fallback(self, check_output, service_running):
+        service_running.return_value = True
+        for side_effect in (
+                [SHOW],
+                subprocess.CalledProcessError(1, 'systemctl')):
+            check_output.side_effect = side_effect
+            self.assertEqual(neutron_utils.services_running(['a', 'b']),
+                             {'a': True, 'b': True})
+        service_running.assert_has_calls([call('a'), call('b')])
+
+
+class TestServicesMemoized(unittest.TestCase):
+
+    def setUp(self):
+        hookenv.cache.clear()
+        self.addCleanup(hookenv.cache.clear)
+
+    @patch.object(neutron_utils, 'os_release')
+    @patch.object(neutron_utils, 'restart_map')
+    def test_services(self, restart_map, os_release):
+        os_release.return_value = 'mitaka'
+        restart_map.return_value = {'a.conf': ['svc-a', 'svc-b'],
+                                    'b.conf': ['svc-b']}
+        for _ in range(3):
+            self.assertEqual(sorted(neutron_utils.services()),
+                             ['svc-a', 'svc-b'])
+        restart_map.assert_called_once_with('mitaka')
+        # Until the release changes, as on upgrade.
+        os_release.return_value = 'newton'
+        neutron_utils.services()
+        restart_map.assert_called_with('newton')
@@ -0,0 +1,298 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+import jinja2
+
+from mock import patch
+
+import neutron_nics
+import neutron_tuning
+
+from charmhelpers.core.sysctl import create as create_sysctl
+from test_neutron_nic_inventory import FakeSysNet, IP_ADDR
+from test_utils import CharmTestCase
+
+TO_PATCH = [
+    'config',
+    'log',
+    'get_total_ram',
+]
+
+GB = 1024 ** 3
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'templates', 'os-charm-nic-tuning')
+
+
+class TestCalculate(CharmTestCase):
+
+    def setUp(self):
+        super(TestCalculate, self).setUp(neutron_tuning, TO_PATCH)
+
+    def test_small(self):
+        # Nothing below the kernel defaults.
+        self.assertEqual(neutron_tuning.calculate(2 * GB, 2, 1), {
+            'net.core.netdev_max_backlog': 4000,
+            'net.core.rmem_max': 4194304,
+            'net.core.wmem_max': 4194304,
+            'net.ipv4.neigh.default.gc_thresh1': 128,
+            'net.ipv4.neigh.default.gc_thresh2': 512,
+            'net.ipv4.neigh.default.gc_thresh3': 1024,
+            'net.ipv4.tcp_rmem': '4096 87380 4194304',
+            'net.ipv4.tcp_wmem': '4096 65536 4194304',
+            'net.ipv6.neigh.default.gc_thresh1': 128,
+            'net.ipv6.neigh.default.gc_thresh2': 512,
+            'net.ipv6.neigh.default.gc_thresh3': 1024,
+            'net.netfilter.nf_conntrack_max': 262144,
+        })
+
+    def test_large(self):
+        sysctls = neutron_tuning.calculate(256 * GB, 64, 500)
+        self.assertEqual(sysctls['net.netfilter.nf_conntrack_max'],
+                         500 * 16384)
+        self.assertEqual(sysctls['net.ipv4.neigh.default.gc_thresh3'], 64000)
+        self.assertEqual(sysctls['net.ipv6.neigh.default.gc_thresh1'], 8000)
+        self.assertEqual(sysctls['net.core.netdev_max_backlog'], 65536)
+        self.assertEqual(sysctls['net.core.rmem_max'], 16 * 1024 ** 2)
+        self.assertEqual(list(sysctls), sorted(sysctls))
+
+    def test_conntrack_ram_bound(self):
+        sysctls = neutron_tuning.calculate(16 * GB, 8, 1000)
+        self.assertEqual(sysctls['net.netfilter.nf_conntrack_max'],
+                         16 * GB // 4096)
+
+
+@patch('multiprocessing.cpu_count', lambda: 4)
+class TestGatewaySysctls(CharmTestCase):
+
+    def setUp(self):
+        super(TestGatewaySysctls, self).setUp(neutron_tuning, TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        self.get_total_ram.return_value = 8 * GB
+
+    def test_disabled(self):
+        self.test_config.set('sysctl', '{ kernel.pid_max: 4194303 }')
+        self.assertEqual(neutron_tuning.gateway_sysctls(),
+                         {'kernel.pid_max': 4194303})
+
+    def test_auto(self):
+        self.test_config.set('gateway-tuning-profile', 'auto')
+        self.test_config.set('gateway-expected-routers', 10)
+        self.test_config.set('sysctl', '{ net.core.rmem_max: 1048576 }')
+        sysctls = neutron_tuning.gateway_sysctls()
+        self.assertEqual(
+            sysctls, dict(neutron_tuning.calculate(8 * GB, 4, 10),
+                          **{'net.core.rmem_max': 1048576}))
+
+    def test_unknown_profile(self):
+        self.test_config.set('gateway-tuning-profile', 'fast')
+        self.assertEqual(neutron_tuning.gateway_sysctls(), {})
+        self.assertTrue(self.log.called)
+
+    @patch('charmhelpers.core.sysctl.log')
+    @patch('charmhelpers.core.sysctl.check_call')
+    def test_create_sysctl(self, check_call, _log):
+        self.test_config.set('sysctl', '{ kernel.pid_max: 4194303 }')
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        for profile in (None, 'auto'):
+            self.test_config.set('gateway-tuning-profile', profile)
+            sysctls = neutron_tuning.gateway_sysctls()
+            create_sysctl(sysctls, path)
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertIn('kernel.pid_max=4194303', lines)
+            self.assertEqual(len(lines), len(sysctls))
+            check_call.assert_called_with(['sysctl', '-p', path])
+
+    def test_invalid_sysctl(self):
+        self.test_config.set('gateway-tuning-profile', 'auto')
+        for sysctl in ('{ kernel.pid_max: [', 'kernel.pid_max'):
+            self.log.reset_mock()
+            self.test_config.set('sysctl', sysctl)
+            self.assertEqual(neutron_tuning.gateway_sysctls(),
+                             neutron_tuning.calculate(8 * GB, 4, 100))
+            self.assertTrue(self.log.called)
+
+
+class TestCPUs(CharmTestCase):
+
+    def setUp(self):
+        super(TestCPUs, self).setUp(neutron_tuning, TO_PATCH)
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(neutron_tuning.parse_cpu_list('0-3, 8,10-11'),
+                         [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(neutron_tuning.parse_cpu_list(''), [])
+        for cpus in ('3-1', 'a', '0-'):
+            self.assertRaises(ValueError, neutron_tuning.parse_cpu_list,
+                              cpus)
+
+    def test_cpu_mask(self):
+        self.assertEqual(neutron_tuning.cpu_mask([]), '0')
+        self.assertEqual(neutron_tuning.cpu_mask([0, 2, 3]), 'd')
+        self.assertEqual(neutron_tuning.cpu_mask([33]), '2,00000000')
+        self.assertEqual(neutron_tuning.cpu_mask(range(40)), 'ff,ffffffff')
+
+
+class TestNICTuning(CharmTestCase):
+
+    def setUp(self):
+        super(TestNICTuning, self).setUp(neutron_tuning, TO_PATCH)
+        self.config.side_effect = self.test_config.get
+        self.sys = FakeSysNet()
+        self.addCleanup(self.sys.cleanup)
+        self.proc = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.proc)
+        self.sys.add('eth0', mac='52:54:00:00:00:01')
+        self.sys.add('bond0', mac='52:54:00:00:00:02', virtual=True,
+                     bond=True)
+        self.sys.add('eth1', mac='52:54:00:00:00:02', master='bond0')
+        self.sys.add('eth2', mac='52:54:00:00:00:02', master='bond0')
+        self.sys.add('bond0.100', mac='52:54:00:00:00:02', virtual=True,
+                     lower='bond0')
+        self.sys.add('eth3', mac='52:54:00:00:00:04')
+        self.sys.add('br-ex', virtual=True, bridge=True)
+        self.add_queues('eth1', irqs=[40, 41, 42], rx=2, tx=2)
+        self.add_queues('eth2', irqs=[50, 51], rx=2, tx=2)
+        # Without MSI.
+        self.add_queues('eth3', irqs=None, rx=1, tx=1)
+        self.set_online('0-3')
+        with patch('subprocess.check_output') as check_output:
+            check_output.return_value = IP_ADDR
+            self.by_name = neutron_nics.build_nic_inventory(
+                self.sys.sys_net)['by_name']
+
+    def device(self, nic):
+        return os.path.realpath(os.path.join(self.sys.sys_net, nic))
+
+    def add_queues(self, nic, irqs, rx, tx):
+        device = self.device(nic)
+        if not os.path.isdir(os.path.join(device, 'device')):
+            os.mkdir(os.path.join(device, 'device'))
+        if irqs is not None:
+            msi_irqs = os.path.join(device, 'device', 'msi_irqs')
+            if os.path.isdir(msi_irqs):
+                shutil.rmtree(msi_irqs)
+            os.mkdir(msi_irqs)
+            for irq in irqs:
+                open(os.path.join(msi_irqs, str(irq)), 'w').close()
+                if not os.path.isdir(os.path.join(self.proc, 'irq',
+                                                  str(irq))):
+                    os.makedirs(os.path.join(self.proc, 'irq', str(irq)))
+        for kind, count in (('rx', rx), ('tx', tx)):
+            for i in range(count):
+                os.makedirs(os.path.join(device, 'queues',
+                                         '{}-{}'.format(kind, i)))
+
+    def set_online(self, cpus):
+        path = os.path.join(self.sys.root, 'devices', 'system', 'cpu')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        with open(os.path.join(path, 'online'), 'w') as f:
+            f.write('{}\n'.format(cpus))
+
+    def run_script(self, ctxt):
+        with open(SCRIPT) as f:
+            script = jinja2.Template(f.read()).render(**ctxt)
+        env = dict(os.environ, SYSFS=self.sys.root, PROCFS=self.proc)
+        process = subprocess.Popen(['/bin/sh', '-c', script], env=env)
+        process.communicate()
+        return process.returncode
+
+    def irq_cpus(self):
+        irqs = {}
+        for irq in os.listdir(os.path.join(self.proc, 'irq')):
+            path = os.path.join(self.proc, 'irq', irq, 'smp_affinity_list')
+            if os.path.exists(path):
+                with open(path) as f:
+                    irqs[int(irq)] = f.read().strip()
+        return irqs
+
+    def queue_cpus(self, nic):
+        queues = {}
+        path = os.path.join(self.device(nic), 'queues')
+        for queue in os.listdir(path):
+            for name in ('rps_cpus', 'xps_cpus'):
+                if os.path.exists(os.path.join(path, queue, name)):
+                    with open(os.path.join(path, queue, name)) as f:
+                        queues[queue] = f.read().strip()
+        return queues
+
+    def test_physical_nics(self):
+        self.assertEqual(
+            neutron_tuning.physical_nics(
+                ['eth3', 'bond0.100', 'bond0', 'br-ex', 'eth9'],
+                self.by_name),
+            ['eth3', 'eth1', 'eth2'])
+
+    def test_online_cpus(self):
+        self.assertEqual(neutron_tuning.online_cpus(self.sys.root),
+                         [0, 1, 2, 3])
+
+    def test_nic_tuning(self):
+        self.assertEqual(
+            neutron_tuning.nic_tuning(['bond0.100', 'eth3'], self.by_name,
+                                      self.sys.root),
+            {'nic_tuning_nics': 'eth1 eth2 eth3',
+             'nic_tuning_cpus': '0:1 1:2 2:4 3:8',
+             'nic_tuning_rps_cpus': 'f'})
+
+    def test_script(self):
+        ctxt = neutron_tuning.nic_tuning(['bond0.100', 'eth3'],
+                                         self.by_name, self.sys.root)
+        self.assertEqual(self.run_script(ctxt), 0)
+        # eth2 carries on from CPU 3.
+        self.assertEqual(self.irq_cpus(),
+                         {40: '0', 41: '1', 42: '2', 50: '3', 51: '0'})
+        self.assertEqual(self.queue_cpus('eth1'),
+                         {'rx-0': 'f', 'rx-1': 'f', 'tx-0': '1', 'tx-1': '2'})
+        self.assertEqual(self.queue_cpus('eth2'),
+                         {'rx-0': 'f', 'rx-1': 'f', 'tx-0': '8', 'tx-1': '1'})
+        self.assertEqual(self.queue_cpus('eth3'),
+                         {'rx-0': 'f', 'tx-0': '2'})
+
+    def test_script_irqs_renumbered(self):
+        ctxt = neutron_tuning.nic_tuning(['eth1'], self.by_name,
+                                         self.sys.root)
+        # As after a reboot, the same script follows the new numbers.
+        self.add_queues('eth1', irqs=[60, 61, 62], rx=0, tx=0)
+        self.assertEqual(self.run_script(ctxt), 0)
+        self.assertEqual(self.irq_cpus(), {60: '0', 61: '1', 62: '2'})
+
+    def test_script_nothing_to_tune(self):
+        self.assertEqual(self.run_script({}), 0)
+        self.assertEqual(self.irq_cpus(), {})
+
+    def test_reserved_cpus(self):
+        self.set_online('0-7')
+        self.test_config.set('nic-tuning-reserved-cpus', '0-1,4-7')
+        ctxt = neutron_tuning.nic_tuning(['eth2'], self.by_name,
+                                         self.sys.root)
+        self.assertEqual(ctxt['nic_tuning_cpus'], '2:4 3:8')
+        self.assertEqual(self.run_script(ctxt), 0)
+        self.assertEqual(self.irq_cpus(), {50: '2', 51: '3'})
+        self.assertEqual(self.queue_cpus('eth2'),
+                         {'rx-0': 'c', 'rx-1': 'c', 'tx-0': '4', 'tx-1': '8'})
+
+    def test_no_nics(self):
+        self.assertEqual(
+            neutron_tuning.nic_tuning(['br-ex'], self.by_name,
+                                      self.sys.root), {})
+
+    def test_all_cpus_reserved(self):
+        self.test_config.set('nic-tuning-reserved-cpus', '0-3')
+        self.assertEqual(
+            neutron_tuning.nic_tuning(['eth1'], self.by_name, self.sys.root),
+            {})
+        self.assertTrue(self.log.called)
+
+    def test_invalid_reserved_cpus(self):
+        self.test_config.set('nic-tuning-reserved-cpus', 'all')
+        self.assertEqual(
+            neutron_tuning.nic_tuning(['eth1'], self.by_name, self.sys.root),
+            {})
+        self.assertTrue(self.log.called)
@@ -1,3 +1,5 @@
+import signal
+
 from mock import MagicMock, call, patch, ANY
 
 import charmhelpers.core.hookenv as hookenv
@@ -23,13 +25,14 @@ TO_PATCH = [
     'apt_install',
     'configure_installation_source',
     'log',
-    'add_bridge',
-    'add_bridge_port',
     'add_ovsbridge_linuxbridge',
     'is_linuxbridge_interface',
     'headers_package',
     'full_restart',
     'os_release',
+    'reset_os_release',
+    'flush_context_cache',
+    'flush_nic_inventory',
     'service_running',
     'NetworkServiceContext',
     'ExternalPortContext',
@@ -43,8 +46,7 @@ TO_PATCH = [
     'init_is_systemd',
     'os_application_version_set',
     'NeutronAPIContext',
-    'enable_ipfix',
-    'disable_ipfix',
+    'reconcile_bridges',
 ]
 
 
@@ -175,7 +177,7 @@ class TestNeutronUtils(CharmTestCase):
         self.os_release.return_value = 'juno'
         self.assertTrue('keepalived' in neutron_utils.get_packages())
 
-    @patch('charmhelpers.contrib.openstack.context.config')
+    @patch('neutron_contexts.config')
     def test_configure_ovs_starts_service_if_required(self, mock_config):
         mock_config.side_effect = self.test_config.get
         self.config.return_value = 'ovs'
@@ -188,7 +190,7 @@ class TestNeutronUtils(CharmTestCase):
         neutron_utils.configure_ovs()
         self.assertFalse(self.full_restart.called)
 
-    @patch('charmhelpers.contrib.openstack.context.config')
+    @patch('neutron_contexts.config')
     def test_configure_ovs_ovs_ext_port(self, mock_config):
         mock_config.side_effect = self.test_config.get
         self.config.side_effect = self.test_config.get
@@ -197,14 +199,12 @@ class TestNeutronUtils(CharmTestCase):
         self.ExternalPortContext.return_value = \
             DummyExternalPortContext(return_value={'ext_port': 'eth0'})
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int'),
-            call('br-ex'),
-            call('br-data')
-        ])
-        self.add_bridge_port.assert_called_with('br-ex', 'eth0')
-
-    @patch('charmhelpers.contrib.openstack.context.config')
+        self.reconcile_bridges.assert_called_with(
+            {'br-int': {}, 'br-ex': {'eth0': False}, 'br-data': {}}, None)
+        self.assertEqual(list(self.reconcile_bridges.call_args[0][0]),
+                         ['br-int', 'br-ex', 'br-data'])
+
+    @patch('neutron_contexts.config')
     def test_configure_ovs_ovs_data_port(self, mock_config):
         self.is_linuxbridge_interface.return_value = False
         mock_config.side_effect = self.test_config.get
@@ -216,43 +216,26 @@ class TestNeutronUtils(CharmTestCase):
         # assumed)
         self.test_config.set('data-port', 'eth0')
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int'),
-            call('br-ex'),
-            call('br-data')
-        ])
-        calls = [call('br-data', 'eth0', promisc=True)]
-        self.add_bridge_port.assert_has_calls(calls)
+        self.reconcile_bridges.assert_called_with(
+            {'br-int': {}, 'br-ex': {}, 'br-data': {'eth0': True}}, None)
 
         # Now test with bridge:port format and bogus bridge
         self.test_config.set('data-port', 'br-foo:eth0')
-        self.add_bridge.reset_mock()
-        self.add_bridge_port.reset_mock()
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int'),
-            call('br-ex'),
-            call('br-data')
-        ])
-        # Not called since we have a bogus bridge in data-ports
-        self.assertFalse(self.add_bridge_port.called)
+        # No ports since we have a bogus bridge in data-ports
+        self.reconcile_bridges.assert_called_with(
+            {'br-int': {}, 'br-ex': {}, 'br-data': {}}, None)
 
         # Now test with bridge:port format
         self.test_config.set('bridge-mappings', 'net1:br1')
         self.test_config.set('data-port', 'br1:eth0.100 br1:eth0.200')
-        self.add_bridge.reset_mock()
-        self.add_bridge_port.reset_mock()
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int'),
-            call('br-ex'),
-            call('br1')
-        ])
-        calls = [call('br1', 'eth0.100', promisc=True),
-                 call('br1', 'eth0.200', promisc=True)]
-        self.add_bridge_port.assert_has_calls(calls, any_order=True)
-
-    @patch('charmhelpers.contrib.openstack.context.config')
+        self.reconcile_bridges.assert_called_with(
+            {'br-int': {}, 'br-ex': {},
+             'br1': {'eth0.100': True, 'eth0.200': True}}, None)
+        self.assertFalse(self.add_ovsbridge_linuxbridge.called)
+
+    @patch('neutron_contexts.config')
     def test_configure_ovs_ovs_data_port_bridge(self, mock_config):
         self.is_linuxbridge_interface.return_value = True
         mock_config.side_effect = self.test_config.get
@@ -264,29 +247,26 @@ class TestNeutronUtils(CharmTestCase):
         # assumed)
         self.test_config.set('data-port', 'br-eth0')
         neutron_utils.configure_ovs()
-        self.add_bridge.assert_has_calls([
-            call('br-int'),
-            call('br-ex'),
-            call('br-data')
-        ])
+        self.reconcile_bridges.assert_called_with(
+            {'br-int': {}, 'br-ex': {}, 'br-data': {}}, None)
         calls = [call('br-data', 'br-eth0')]
         self.add_ovsbridge_linuxbridge.assert_has_calls(calls)
+        self.flush_nic_inventory.assert_called_once_with()
 
-    @patch('charmhelpers.contrib.openstack.context.config')
+    @patch('neutron_contexts.config')
     def test_configure_ovs_enable_ipfix(self, mock_config):
         mock_config.side_effect = self.test_config.get
         self.config.side_effect = self.test_config.get
         self.test_config.set('plugin', 'ovs')
         self.test_config.set('ipfix-target', '127.0.0.1:80')
+        self.ExternalPortContext.return_value = \
+            DummyExternalPortContext(return_value=None)
         neutron_utils.configure_ovs()
-        self.enable_ipfix.assert_has_calls([
-            call('br-int', '127.0.0.1:80'),
-            call('br-ex', '127.0.0.1:80'),
-            call('br-data', '127.0.0.1:80'),
-        ])
+        self.reconcile_bridges.assert_called_with(
+            {'br-int': {}, 'br-ex': {}, 'br-data': {}}, '127.0.0.1:80')
 
     @patch.object(neutron_utils, 'register_configs')
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_do_openstack_upgrade(self, mock_renderer,
                                   mock_register_configs):
         mock_configs = MagicMock()
@@ -311,8 +291,19 @@ class TestNeutronUtils(CharmTestCase):
         self.configure_installation_source.assert_called_with(
             'cloud:precise-havana'
         )
+        self.reset_os_release.assert_called_once_with()
+        self.flush_context_cache.assert_called_once_with()
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'register_configs')
+    def test_lazy_configs(self, mock_register_configs):
+        configs = neutron_utils.LazyConfigs()
+        self.assertFalse(mock_register_configs.called)
+        configs.write_all()
+        configs.complete_contexts()
+        mock_register_configs.assert_called_once_with(None)
+        mock_register_configs.return_value.write_all.assert_called_once_with()
+
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_ovs(self, mock_renderer):
         self.config.return_value = 'ovs'
         self.os_release.return_value = 'diablo'
@@ -328,7 +319,7 @@ class TestNeutronUtils(CharmTestCase):
         for conf in confs:
             configs.register.assert_any_call(conf, ANY)
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_ovs_odl(self, mock_renderer):
         self.config.side_effect = self.test_config.get
         self.test_config.set('plugin', 'ovs-odl')
@@ -345,7 +336,7 @@ class TestNeutronUtils(CharmTestCase):
         for conf in confs:
             configs.register.assert_any_call(conf, ANY)
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_amqp_nova(self, mock_renderer):
         self.config.return_value = 'ovs'
         self.is_relation_made.return_value = True
@@ -391,6 +382,7 @@ class TestNeutronUtils(CharmTestCase):
             neutron_utils.NOVA_CONF: ['nova-api-metadata'],
             neutron_utils.EXT_PORT_CONF: ['ext-port'],
             neutron_utils.PHY_NIC_MTU_CONF: ['os-charm-phy-nic-mtu'],
+            neutron_utils.NIC_TUNING_SCRIPT: ['os-charm-nic-tuning'],
             neutron_utils.NEUTRON_DHCP_AA_PROFILE_PATH: ['neutron-dhcp-agent'],
             neutron_utils.NEUTRON_OVS_AA_PROFILE_PATH:
                 ['neutron-plugin-openvswitch-agent'],
@@ -434,6 +426,7 @@ class TestNeutronUtils(CharmTestCase):
             neutron_utils.NOVA_CONF: ['nova-api-metadata'],
             neutron_utils.EXT_PORT_CONF: ['ext-port'],
             neutron_utils.PHY_NIC_MTU_CONF: ['os-charm-phy-nic-mtu'],
+            neutron_utils.NIC_TUNING_SCRIPT: ['os-charm-nic-tuning'],
             neutron_utils.NEUTRON_DHCP_AA_PROFILE_PATH: ['neutron-dhcp-agent'],
             neutron_utils.NEUTRON_OVS_AA_PROFILE_PATH:
                 ['neutron-openvswitch-agent'],
@@ -477,6 +470,7 @@ class TestNeutronUtils(CharmTestCase):
             neutron_utils.NOVA_CONF: ['nova-api-metadata'],
             neutron_utils.EXT_PORT_CONF: ['ext-port'],
             neutron_utils.PHY_NIC_MTU_CONF: ['os-charm-phy-nic-mtu'],
+            neutron_utils.NIC_TUNING_SCRIPT: ['os-charm-nic-tuning'],
             neutron_utils.NEUTRON_DHCP_AA_PROFILE_PATH: ['neutron-dhcp-agent'],
             neutron_utils.NEUTRON_OVS_AA_PROFILE_PATH:
                 ['neutron-openvswitch-agent'],
@@ -527,6 +521,7 @@ class TestNeutronUtils(CharmTestCase):
             neutron_utils.NOVA_CONF: ['nova-api-metadata'],
             neutron_utils.EXT_PORT_CONF: ['ext-port'],
             neutron_utils.PHY_NIC_MTU_CONF: ['os-charm-phy-nic-mtu'],
+            neutron_utils.NIC_TUNING_SCRIPT: ['os-charm-nic-tuning'],
             neutron_utils.NEUTRON_DHCP_AA_PROFILE_PATH: ['neutron-dhcp-agent'],
             neutron_utils.NEUTRON_LBAAS_AA_PROFILE_PATH:
             ['neutron-lbaas-agent'],
@@ -565,6 +560,7 @@ class TestNeutronUtils(CharmTestCase):
             neutron_utils.NOVA_CONF: ['nova-api-metadata'],
             neutron_utils.EXT_PORT_CONF: ['ext-port'],
             neutron_utils.PHY_NIC_MTU_CONF: ['os-charm-phy-nic-mtu'],
+            neutron_utils.NIC_TUNING_SCRIPT: ['os-charm-nic-tuning'],
             neutron_utils.NEUTRON_DHCP_AA_PROFILE_PATH: ['neutron-dhcp-agent'],
             neutron_utils.NEUTRON_LBAASV2_AA_PROFILE_PATH:
             ['neutron-lbaasv2-agent'],
@@ -578,7 +574,7 @@ class TestNeutronUtils(CharmTestCase):
 
         self.assertEqual(neutron_utils.restart_map(), ex_map)
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_nsx(self, mock_renderer):
         self.config.return_value = 'nsx'
         self.os_release.return_value = 'diablo'
@@ -604,7 +600,7 @@ class TestNeutronUtils(CharmTestCase):
             any_order=True,
         )
 
-    @patch('charmhelpers.contrib.openstack.templating.OSConfigRenderer')
+    @patch.object(neutron_utils, 'NeutronConfigRenderer')
     def test_register_configs_pre_install(self, mock_renderer):
         self.config.return_value = 'ovs'
         self.is_relation_made.return_value = False
@@ -736,6 +732,220 @@ class TestNeutronUtils(CharmTestCase):
         with patch_open() as (_open, _file):
             self.assertEqual(neutron_utils.write_vendordata(_jdata), False)
 
+    @patch('os.kill')
+    @patch.object(neutron_utils, 'handles_sigusr1')
+    @patch.object(neutron_utils, 'neutron_ha_monitor_pids')
+    @patch.object(neutron_utils, 'restart_neutron_ha_monitor_daemon')
+    def test_wake_neutron_ha_monitor_daemon(self, _restart, _pids, _handles,
+                                            _kill):
+        _pids.return_value = [1234]
+        _handles.return_value = True
+        neutron_utils.wake_neutron_ha_monitor_daemon()
+        _kill.assert_called_once_with(1234, signal.SIGUSR1)
+        self.assertFalse(_restart.called)
+
+    @patch('os.kill')
+    @patch.object(neutron_utils, 'handles_sigusr1')
+    @patch.object(neutron_utils, 'neutron_ha_monitor_pids')
+    @patch.object(neutron_utils, 'restart_neutron_ha_monitor_daemon')
+    def test_wake_neutron_ha_monitor_daemon_restart(self, _restart, _pids,
+                                                    _handles, _kill):
+        # A daemon of the code upgraded from would be killed by SIGUSR1.
+        _pids.return_value = [1234]
+        _handles.return_value = False
+        for restarted in (True, False):
+            _restart.reset_mock()
+            _restart.return_value = restarted
+            neutron_utils.wake_neutron_ha_monitor_daemon()
+            self.assertFalse(_kill.called)
+            self.assertTrue(_restart.called)
+
+    @patch.object(neutron_utils, 'is_clustered')
+    @patch.object(neutron_utils.subprocess, 'check_call')
+    @patch.object(neutron_utils.subprocess, 'check_output')
+    def test_restart_neutron_ha_monitor_daemon(self, _check_output,
+                                               _check_call, _is_clustered):
+        _is_clustered.return_value = True
+        self.assertTrue(neutron_utils.restart_neutron_ha_monitor_daemon())
+        _check_output.assert_called_with(
+            ['crm', 'resource', 'status', 'res_monitor'], stderr=ANY)
+        _check_call.assert_called_with(
+            ['crm', 'resource', 'restart', 'res_monitor'])
+
+    @patch.object(neutron_utils, 'is_clustered')
+    @patch.object(neutron_utils.subprocess, 'check_call')
+    @patch.object(neutron_utils.subprocess, 'check_output')
+    def test_restart_neutron_ha_monitor_daemon_not_clustered(
+            self, _check_output, _check_call, _is_clustered):
+        _is_clustered.return_value = False
+        self.assertFalse(neutron_utils.restart_neutron_ha_monitor_daemon())
+        self.assertFalse(_check_call.called)
+        # Clustered, but without the resource.
+        _is_clustered.return_value = True
+        _check_output.side_effect = neutron_utils.subprocess.\
+            CalledProcessError(1, 'crm')
+        self.assertFalse(neutron_utils.restart_neutron_ha_monitor_daemon())
+        self.assertFalse(_check_call.called)
+
+    @patch.object(neutron_utils, 'is_clustered')
+    @patch.object(neutron_utils.subprocess, 'check_call')
+    @patch.object(neutron_utils.subprocess, 'check_output')
+    def test_restart_neutron_ha_monitor_daemon_fails(
+            self, _check_output, _check_call, _is_clustered):
+        _is_clustered.return_value = True
+        _check_call.side_effect = neutron_utils.subprocess.\
+            CalledProcessError(1, 'crm')
+        self.assertFalse(neutron_utils.restart_neutron_ha_monitor_daemon())
+        self.assertTrue(self.log.called)
+
+    @patch('os.kill')
+    @patch.object(neutron_utils, 'neutron_ha_monitor_pids')
+    @patch.object(neutron_utils, 'subprocess')
+    def test_wake_neutron_ha_monitor_daemon_none(self, _subprocess, _pids,
+                                                 _kill):
+        _pids.return_value = []
+        neutron_utils.wake_neutron_ha_monitor_daemon()
+        self.assertFalse(_kill.called)
+        self.assertFalse(_subprocess.call.called)
+
+    def test_handles_sigusr1(self):
+        status = 'Name:\tpython\nSigIgn:\t{}\nSigCgt:\t{}\n'
+        for ignored, caught, handles in (
+                ('0000000001001000', '0000000180000002', False),
+                ('0000000001001200', '0000000180000002', True),
+                ('0000000001001000', '0000000180000202', True)):
+            with patch_open() as (_open, _file):
+                _file.read.return_value = status.format(ignored, caught)
+                self.assertEqual(neutron_utils.handles_sigusr1(1234), handles)
+                _open.assert_called_with('/proc/1234/status')
+        with patch_open() as (_open, _file):
+            _open.side_effect = IOError
+            self.assertFalse(neutron_utils.handles_sigusr1(1234))
+
+    @patch.object(neutron_utils.subprocess, 'check_output')
+    def test_neutron_ha_monitor_pids(self, _check_output):
+        _check_output.return_value = b'1234\n5678\n'
+        self.assertEqual(neutron_utils.neutron_ha_monitor_pids(),
+                         [1234, 5678])
+        _check_output.assert_called_with(
+            ['pgrep', '-f', 'neutron-ha-monitor.py'])
+        _check_output.side_effect = neutron_utils.subprocess.\
+            CalledProcessError(1, 'pgrep')
+        self.assertEqual(neutron_utils.neutron_ha_monitor_pids(), [])
+
+    @patch.object(neutron_utils, 'pause_irqbalance')
+    @patch.object(neutron_utils, 'subprocess')
+    @patch.object(neutron_utils, 'shutil')
+    @patch('os.path.exists')
+    def test_install_nic_tuning_systemd(self, _os_exists, _shutil,
+                                        _subprocess, _pause):
+        self.init_is_systemd.return_value = True
+        _os_exists.return_value = False
+        neutron_utils.install_nic_tuning()
+        _shutil.copy.assert_called_with(
+            'files/os-charm-nic-tuning.service',
+            '/etc/systemd/system/os-charm-nic-tuning.service')
+        _subprocess.check_call.assert_has_calls([
+            call(['systemctl', 'daemon-reload']),
+            call(['systemctl', 'enable', 'os-charm-nic-tuning.service'])])
+        self.assertTrue(_pause.called)
+
+    @patch.object(neutron_utils, 'pause_irqbalance')
+    @patch.object(neutron_utils, 'subprocess')
+    @patch.object(neutron_utils, 'shutil')
+    @patch.object(neutron_utils, 'filecmp')
+    @patch('os.path.exists')
+    def test_install_nic_tuning_upstart(self, _os_exists, _filecmp, _shutil,
+                                        _subprocess, _pause):
+        self.init_is_systemd.return_value = False
+        _os_exists.return_value = True
+        _filecmp.cmp.return_value = False
+        neutron_utils.install_nic_tuning()
+        _shutil.copy.assert_called_with(
+            'files/os-charm-nic-tuning.conf',
+            '/etc/init/os-charm-nic-tuning.conf')
+        self.assertFalse(_subprocess.check_call.called)
+        # Not again once installed.
+        _shutil.reset_mock()
+        _filecmp.cmp.return_value = True
+        neutron_utils.install_nic_tuning()
+        self.assertFalse(_shutil.copy.called)
+        self.assertEqual(_pause.call_count, 2)
+
+    @patch.object(neutron_utils, 'resume_irqbalance')
+    @patch.object(neutron_utils, 'remove_file')
+    @patch.object(neutron_utils, 'subprocess')
+    @patch('os.path.exists')
+    def test_remove_nic_tuning_systemd(self, _os_exists, _subprocess,
+                                       _remove_file, _resume):
+        self.init_is_systemd.return_value = True
+        _os_exists.return_value = True
+        neutron_utils.remove_nic_tuning()
+        _subprocess.check_call.assert_has_calls([
+            call(['systemctl', 'disable', 'os-charm-nic-tuning.service']),
+            call(['systemctl', 'daemon-reload'])])
+        _remove_file.assert_called_with(
+            '/etc/systemd/system/os-charm-nic-tuning.service')
+        self.assertTrue(_resume.called)
+
+    @patch.object(neutron_utils, 'resume_irqbalance')
+    @patch.object(neutron_utils, 'remove_file')
+    @patch.object(neutron_utils, 'subprocess')
+    @patch('os.path.exists')
+    def test_remove_nic_tuning_not_installed(self, _os_exists, _subprocess,
+                                             _remove_file, _resume):
+        self.init_is_systemd.return_value = False
+        _os_exists.return_value = False
+        neutron_utils.remove_nic_tuning()
+        self.assertFalse(_subprocess.check_call.called)
+        self.assertFalse(_remove_file.called)
+        self.assertTrue(_resume.called)
+
+    @patch.object(neutron_utils, 'remove_nic_tuning')
+    @patch.object(neutron_utils, 'install_nic_tuning')
+    def test_update_nic_tuning(self, _install, _remove):
+        self.config.side_effect = self.test_config.get
+        self.test_config.set('nic-tuning', True)
+        neutron_utils.update_nic_tuning()
+        self.assertTrue(_install.called)
+        self.assertFalse(_remove.called)
+        _install.reset_mock()
+        self.test_config.set('nic-tuning', False)
+        neutron_utils.update_nic_tuning()
+        self.assertFalse(_install.called)
+        self.assertTrue(_remove.called)
+
+    @patch.object(neutron_utils, 'service_resume')
+    @patch.object(neutron_utils, 'service_pause')
+    @patch.object(neutron_utils, 'kv')
+    def test_pause_resume_irqbalance(self, _kv, _pause, _resume):
+        store = {}
+        _kv.return_value.get.side_effect = store.get
+        _kv.return_value.set.side_effect = store.__setitem__
+        _kv.return_value.unset.side_effect = store.pop
+        self.service_running.return_value = True
+        neutron_utils.pause_irqbalance()
+        _pause.assert_called_once_with('irqbalance')
+        self.assertTrue(self.log.called)
+        # Not again while paused.
+        neutron_utils.pause_irqbalance()
+        self.assertEqual(_pause.call_count, 1)
+        neutron_utils.resume_irqbalance()
+        _resume.assert_called_once_with('irqbalance')
+        neutron_utils.resume_irqbalance()
+        self.assertEqual(_resume.call_count, 1)
+
+    @patch.object(neutron_utils, 'service_resume')
+    @patch.object(neutron_utils, 'service_pause')
+    @patch.object(neutron_utils, 'kv')
+    def test_irqbalance_not_running(self, _kv, _pause, _resume):
+        # Stopped by the operator, left alone.
+        _kv.return_value.get.return_value = None
+        self.service_running.return_value = False
+        neutron_utils.pause_irqbalance()
+        neutron_utils.resume_irqbalance()
+        self.assertFalse(_pause.called)
+        self.assertFalse(_resume.called)
 
 network_context = {
     'service_username': 'foo',
@@ -807,12 +1017,27 @@ class TestNeutronAgentReallocation(CharmTestCase):
         services.return_value = ['s1']
         REQUIRED_INTERFACES.copy.return_value = {'int': ['test 1']}
         get_optional_interfaces.return_value = {'opt': ['test 2']}
-        neutron_utils.assess_status_func('test-config')
+        paused_func, running_func = MagicMock(), MagicMock()
+        make_assess_status_func.side_effect = [paused_func, running_func]
+        assessor = neutron_utils.assess_status_func('test-config')
         # ports=None whilst port checks are disabled.
-        make_assess_status_func.assert_called_once_with(
+        make_assess_status_func.assert_any_call(
             'test-config',
             {'int': ['test 1'], 'opt': ['test 2']},
             charm_func=check_optional_relations, services=['s1'], ports=None)
+        charm_func = make_assess_status_func.call_args[1]['charm_func']
+        self.assertEqual(make_assess_status_func.call_args[1]['services'],
+                         None)
+        with patch.object(neutron_utils, 'is_unit_paused_set') as paused:
+            paused.return_value = True
+            assessor()
+            paused_func.assert_called_once_with()
+            paused.return_value = False
+            assessor()
+            running_func.assert_called_once_with()
+        with patch.object(neutron_utils, 'check_services_running') as csr:
+            charm_func('test-config')
+            csr.assert_called_once_with('test-config', ['s1'])
 
     def test_pause_unit_helper(self):
         with patch.object(neutron_utils, '_pause_resume_helper') as prh: